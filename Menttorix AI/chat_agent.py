@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from math_tool import solve_equation, solve_system, factor, expand, differentiate, limit, series
 from diagram import generate_svg_diagram
 from sandbox import execute_safe_code
+from study_retrieval import search_study_material
 from math_tool import matrix_multiply, determinant, eigenvalues
 from math_tool import kinematics, projectile_motion, simple_harmonic_motion
 from math_tool import beam_deflection, fluid_flow
@@ -94,7 +95,8 @@ class Assistant:
 
 from datetime import datetime
 
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+# The agent calls tools over several turns, which the small models are not reliable at
+llm = ChatGoogleGenerativeAI(model=os.environ.get("CHAT_MODEL", "gemini-1.5-flash"))
 
 
 assistant_prompt = ChatPromptTemplate.from_messages(
@@ -104,6 +106,8 @@ assistant_prompt = ChatPromptTemplate.from_messages(
             "You are a cool study buddy called Menttorix, and your aim is to help students learn." 
             "Use the provided tools to solve any kind of mathematics, some physics and engineering questions,"
             " and other information to assist the student's queries."
+            " When a question touches on what the student has studied, search their study material first"
+            " and build on their own flashcards and quizzes."
 
             "When searching, be persistent. Expand your query bounds if the first search returns no results." 
             "If a search comes up empty, expand your search before giving up."
@@ -127,6 +131,7 @@ assistant_prompt = ChatPromptTemplate.from_messages(
 
 part_3_safe_tools = [
     TavilySearchResults(max_results=5),
+    search_study_material,
     generate_svg_diagram, 
     execute_safe_code,
     solve_equation, 
@@ -0,0 +1,246 @@
+import contextvars
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import google.generativeai as genai
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+
+# Embeddings share the API's Gemini key, so they go through its rate limits,
+# retries and circuit breaker (routes/ at the repository root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routes.circuit_breaker import CircuitOpen  # noqa: E402
+from routes.rate_limit import PRIORITY_BACKGROUND, RateLimited, set_caller  # noqa: E402
+from routes.resilience import DeadlineExceeded, call_model  # noqa: E402
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_BATCH = 100
+TOP_K = 5
+# Quiz questions are chunked this many at a time, with their answers and explanations
+QUESTIONS_PER_CHUNK = 5
+# A user's index is brought up to date with Firestore after this long
+REFRESH_SECONDS = 10 * 60
+# Indexes of more chunks than this are partitioned (IVF) instead of searched flat
+IVF_MIN_CHUNKS = 20_000
+IVF_PROBES = 8
+# Bounds on the embeddings and user indexes kept in memory, least recently used evicted
+MAX_CACHED_EMBEDDINGS = 200_000
+MAX_CACHED_INDEXES = 200
+
+
+class VectorIndex:
+    """
+    Cosine-similarity search over unit-normalized embeddings.
+
+    Searches are flat (one matrix product over every vector) until build_ivf
+    partitions the vectors around k-means centroids; a partitioned search only
+    scores the vectors of the n_probe lists whose centroids are closest.
+    """
+
+    def __init__(self, dimensions: int):
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.items: List[Dict] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, vectors: np.ndarray, items: List[Dict]) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.items += items
+        # New vectors are not in any list yet; partition again to include them
+        self.centroids, self.lists = None, []
+
+    def build_ivf(self, n_lists: int, iterations: int = 10, seed: int = 0) -> None:
+        """Partitions the vectors into n_lists inverted lists with spherical k-means."""
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(len(self.vectors), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            for list_number in range(n_lists):
+                members = self.vectors[assignments == list_number]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_number] = centroid / (np.linalg.norm(centroid) + 1e-12)
+        assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignments == list_number) for list_number in range(n_lists)]
+
+    def search(self, query: np.ndarray, k: int = TOP_K, n_probe: int = IVF_PROBES) -> List[Tuple[Dict, float]]:
+        """
+        The k items most similar to the query vector, best first.
+
+        Returns:
+            List[Tuple[Dict, float]]: The items and their cosine similarities.
+        """
+        if not self.items:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        if self.centroids is None:
+            candidates = np.arange(len(self.items))
+            scores = self.vectors @ query
+        else:
+            probes = np.argsort(self.centroids @ query)[::-1][:n_probe]
+            candidates = np.concatenate([self.lists[probe] for probe in probes])
+            scores = self.vectors[candidates] @ query
+        if len(scores) > k:
+            best = np.argpartition(scores, -k)[-k:]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(scores[best])[::-1]]
+        return [(self.items[candidates[position]], float(scores[position])) for position in best]
+
+
+def embed(texts: List[str], task_type: str = "retrieval_document") -> np.ndarray:
+    """
+    Embeds texts with Gemini, EMBEDDING_BATCH at a time, each batch a call_model
+    call made as the current caller (see routes.rate_limit.set_caller).
+    """
+    genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH):
+        result = call_model(
+            "embed", genai.embed_content,
+            model=EMBEDDING_MODEL, content=texts[start:start + EMBEDDING_BATCH], task_type=task_type,
+        )
+        vectors += result["embedding"]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def _in_background(user_id: str, function, *args):
+    """Runs function with its Gemini calls made as background calls of the user, behind interactive ones."""
+    def run():
+        set_caller(user_id, PRIORITY_BACKGROUND)
+        return function(*args)
+    return contextvars.copy_context().run(run)
+
+
+def study_chunks(user_id: str) -> List[Dict]:
+    """
+    The user's study material as retrieval chunks: one per flashcard, and one per
+    QUESTIONS_PER_CHUNK questions of each quiz with their answers and explanations.
+
+    Quiz source documents are not kept after generation, so their questions stand
+    in for them.
+    """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate("/etc/secrets/credentials.json"))
+    user_ref = firestore.client().collection("users").document(user_id)
+
+    chunks = []
+    for doc in user_ref.collection("flashcards").stream():
+        card = doc.to_dict()
+        chunks.append({"source": f"flashcard {doc.id}", "text": f"Q: {card.get('front', '')}\nA: {card.get('back', '')}"})
+    for quiz in user_ref.collection("quizzes").stream():
+        title = (quiz.to_dict() or {}).get("title") or quiz.id
+        lines = []
+        for doc in quiz.reference.collection("questions").stream():
+            question = doc.to_dict()
+            line = f"Q: {question.get('question', '')}\nA: {question.get('answer', '')}"
+            if question.get("explanation"):
+                line += f"\nWhy: {question['explanation']}"
+            lines.append(line)
+        for start in range(0, len(lines), QUESTIONS_PER_CHUNK):
+            chunks.append({"source": f"quiz {title}", "text": "\n\n".join(lines[start:start + QUESTIONS_PER_CHUNK])})
+    return chunks
+
+
+# Embeddings by chunk text hash, so refreshes only embed new or changed chunks
+_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embeddings_lock = threading.Lock()
+# Per user: the index, when it was built, and the lock its builds run under
+_indexes: "OrderedDict[str, Dict]" = OrderedDict()
+# Guards only the two caches above; Firestore reads, embedding and k-means run outside it
+_indexes_lock = threading.Lock()
+
+
+def _entry(user_id: str) -> Dict:
+    with _indexes_lock:
+        entry = _indexes.get(user_id)
+        if entry is None:
+            entry = _indexes[user_id] = {"lock": threading.Lock(), "index": None, "built": 0.0}
+            if len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(user_id)
+        return entry
+
+
+def chunk_embeddings(chunks: List[Dict]) -> List[np.ndarray]:
+    """The chunks' embeddings, from the cache where it has them and embedded otherwise."""
+    keys = [hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest() for chunk in chunks]
+    with _embeddings_lock:
+        vectors = [_embeddings.get(key) for key in keys]
+        for key, vector in zip(keys, vectors):
+            if vector is not None:
+                _embeddings.move_to_end(key)
+    missing = [position for position, vector in enumerate(vectors) if vector is None]
+    if missing:
+        for position, vector in zip(missing, embed([chunks[position]["text"] for position in missing])):
+            vectors[position] = vector
+        with _embeddings_lock:
+            for position in missing:
+                _embeddings[keys[position]] = vectors[position]
+            while len(_embeddings) > MAX_CACHED_EMBEDDINGS:
+                _embeddings.popitem(last=False)
+    return vectors
+
+
+def user_index(user_id: str) -> VectorIndex:
+    """A user's index, rebuilt from Firestore every REFRESH_SECONDS."""
+    entry = _entry(user_id)
+    # Concurrent searches by one user wait for a single build; other users are not held up
+    with entry["lock"]:
+        if entry["index"] is not None and time.time() - entry["built"] < REFRESH_SECONDS:
+            return entry["index"]
+
+        chunks = study_chunks(user_id)
+        # A first build can embed thousands of chunks; it queues behind quiz generation
+        vectors = _in_background(user_id, chunk_embeddings, chunks)
+        index = VectorIndex(len(vectors[0]) if vectors else 768)
+        if chunks:
+            index.add(np.stack(vectors), chunks)
+        if len(index) >= IVF_MIN_CHUNKS:
+            index.build_ivf(int(np.sqrt(len(index))))
+        entry["index"], entry["built"] = index, time.time()
+        return index
+
+
+@tool
+def search_study_material(query: str, config: RunnableConfig) -> str:
+    """
+    Search the student's own flashcards and quizzes for material relevant to a question.
+    Use it when the student asks about something they have studied, or to ground an
+    explanation in their own decks and quizzes.
+
+    Args:
+        query (str): What to look for, e.g. "how does the krebs cycle produce ATP"
+
+    Returns:
+        str: The most relevant flashcards and quiz questions, with their sources
+    """
+    user_id = config.get("configurable", {}).get("user_id")
+    if not user_id:
+        return "No student is signed in, so there is no study material to search."
+    set_caller(user_id)
+    try:
+        index = user_index(user_id)
+        results = index.search(embed([query], task_type="retrieval_query")[0], k=TOP_K)
+    except (RateLimited, CircuitOpen, DeadlineExceeded) as e:
+        return f"The study material cannot be searched right now ({str(e)}); try again shortly."
+    if not results:
+        return "The student has no flashcards or quizzes yet."
+    return "\n\n---\n\n".join(f"[{item['source']}] (relevance {score:.2f})\n{item['text']}" for item, score in results)
@@ -0,0 +1,62 @@
+"""
+Output-token comparison of the verbose and compact quiz output contracts.
+
+Runs a fixed set of topic quizzes both ways and reads the output token counts
+from Gemini's usage metadata. Needs GEMINI_API_KEY. Run from the repository root:
+
+    python -m benchmarks.compact_schema --questions 3
+"""
+import argparse
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+from routes.quiz_topic import generate_quiz_topic
+
+load_dotenv()
+
+USER_DATA = {"education_level": "High school"}
+
+PROMPT_SET = [
+    ("Photosynthesis", "Biology", "Multiple Choice"),
+    ("Newton's laws of motion", "Physics", "True/False"),
+    ("The French Revolution", "History", "Short Answer"),
+    ("Chemical bonding", "Chemistry", "Fill in the space"),
+    ("Supply and demand", "Economics", "Open End"),
+]
+
+# Record the usage metadata of every generate_content call made by the generators
+output_tokens = []
+_generate_content = genai.GenerativeModel.generate_content
+
+
+def recording_generate_content(self, *args, **kwargs):
+    response = _generate_content(self, *args, **kwargs)
+    output_tokens.append(response.usage_metadata.candidates_token_count)
+    return response
+
+
+genai.GenerativeModel.generate_content = recording_generate_content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=3, help="questions per difficulty level")
+    args = parser.parse_args()
+
+    totals = {False: 0, True: 0}
+    for topic, subject, question_type in PROMPT_SET:
+        row = []
+        for compact in (False, True):
+            quiz = generate_quiz_topic(topic, subject, question_type, args.questions, USER_DATA, compact=compact)
+            tokens = output_tokens[-1]
+            totals[compact] += tokens
+            row.append(f"{tokens:5} tokens / {len(quiz):2} questions")
+        print(f"{question_type:18} verbose {row[0]}   compact {row[1]}")
+
+    saved = 100 * (1 - totals[True] / totals[False])
+    print(f"\ntotal output tokens: verbose {totals[False]}, compact {totals[True]} ({saved:.0f}% saved)")
+
+
+if __name__ == "__main__":
+    main()
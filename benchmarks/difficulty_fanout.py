@@ -0,0 +1,56 @@
+"""
+Wall-clock comparison of single-call and per-difficulty quiz generation.
+
+Needs GEMINI_API_KEY. Run from the repository root:
+
+    python -m benchmarks.difficulty_fanout --rounds 3 --questions 5
+"""
+import argparse
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from routes.difficulty_fanout import generate_by_difficulty
+from routes.quiz_topic import generate_quiz_topic
+
+load_dotenv()
+
+USER_DATA = {"education_level": "High school", "interests": ["science"]}
+
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    quiz = function(*args, **kwargs)
+    return time.perf_counter() - start_time, len(quiz)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=5, help="questions per difficulty level")
+    parser.add_argument("--topic", default="Photosynthesis")
+    parser.add_argument("--subject", default="Biology")
+    parser.add_argument("--question-type", default="Multiple Choice")
+    args = parser.parse_args()
+
+    quiz_args = (args.topic, args.subject, args.question_type, args.questions, USER_DATA)
+    results = {"single call": [], "per difficulty": []}
+    for round_number in range(1, args.rounds + 1):
+        for name, run in (
+            ("single call", lambda: timed(generate_quiz_topic, *quiz_args)),
+            ("per difficulty", lambda: timed(generate_by_difficulty, generate_quiz_topic, *quiz_args)),
+        ):
+            seconds, count = run()
+            results[name].append(seconds)
+            print(f"round {round_number} {name:15} {seconds:6.2f}s {count} questions")
+
+    print()
+    for name, timings in results.items():
+        print(f"{name:15} median {statistics.median(timings):6.2f}s  best {min(timings):6.2f}s")
+    speedup = statistics.median(results["single call"]) / statistics.median(results["per difficulty"])
+    print(f"per-difficulty speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Retries of an in-flight generation with the same Idempotency-Key: how many
+generations run, how the retries are answered, and how long the event loop
+stalls meanwhile.
+
+Offline, no Firebase or Gemini needed: the generation is a blocking sleep run in
+a worker thread, like the quiz endpoints' generations. Run from the repository root:
+
+    python -m benchmarks.idempotency --retries 20 --generation-seconds 1
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from routes.idempotency import idempotency_stats, idempotent
+
+generations = 0
+
+
+def make_endpoint(seconds: float):
+    @idempotent
+    async def generate_quiz(user_id: str, topic: str, idempotency_key: str = None):
+        global generations
+        generations += 1
+        await asyncio.to_thread(time.sleep, seconds)
+        return {"quiz": [f"{topic} question"], "generation": generations}
+    return generate_quiz
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """The longest the event loop took to wake a sleeper beyond interval."""
+    worst = 0.0
+    while not stop.is_set():
+        start_time = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start_time - interval)
+    return worst
+
+
+async def run(retries: int, seconds: float):
+    endpoint = make_endpoint(seconds)
+    stop = asyncio.Event()
+    lag = asyncio.ensure_future(loop_lag(stop))
+
+    start_time = time.perf_counter()
+    first = asyncio.ensure_future(endpoint(user_id="u1", topic="cells", idempotency_key="k1"))
+    await asyncio.sleep(seconds / 10)
+    # Client retries while the first request is still generating
+    responses = await asyncio.gather(
+        first, *(endpoint(user_id="u1", topic="cells", idempotency_key="k1") for _ in range(retries))
+    )
+    elapsed = time.perf_counter() - start_time
+    replay = await endpoint(user_id="u1", topic="cells", idempotency_key="k1")
+    try:
+        await endpoint(user_id="u1", topic="atoms", idempotency_key="k1")
+        conflict = None
+    except HTTPException as e:
+        conflict = e.status_code
+    stop.set()
+    worst_lag = await lag
+
+    stats = idempotency_stats()
+    print(f"{retries} retries in flight: {generations} generation(s), {elapsed:.2f}s for all responses")
+    print(f"stats {stats}")
+    print(f"worst event loop stall {worst_lag * 1000:.1f}ms")
+    same = all(response == responses[0] for response in [*responses, replay])
+    checks = {
+        "one generation": generations == 1,
+        "retries attached to the running generation": stats["attached"] == retries,
+        "finished response replayed": stats["replayed"] == 1,
+        "same response for every retry": same,
+        "different request with the key refused": conflict == 422,
+        "event loop kept serving": worst_lag < seconds / 2,
+    }
+    for name, passed in checks.items():
+        print(f"{'ok' if passed else 'FAILED':6} {name}")
+    if not all(checks.values()):
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retries", type=int, default=20)
+    parser.add_argument("--generation-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.retries, args.generation_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Latency and token comparison of one mixed-type call against one call per type.
+
+Needs GEMINI_API_KEY. Uses a topic quiz by default, or pasted text from a file
+(to include the cost of re-reading the source once per type). Run from the
+repository root:
+
+    python -m benchmarks.mixed_quiz --rounds 3
+    python -m benchmarks.mixed_quiz --text-file notes.txt
+"""
+import argparse
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from routes.generation_pipeline import run_pipeline
+from routes.prompt_registry import MIXED
+
+load_dotenv()
+
+USER_DATA = {"education_level": "High school"}
+QUESTION_COUNTS = {"Multiple Choice": 2, "True/False": 2, "Short Answer": 1}
+
+
+def tokens(report):
+    """Input and output tokens of a pipeline run, from its generate stage."""
+    stage = next(record for record in report["stages"] if record["stage"] == "generate")
+    return stage.get("input_tokens", 0), stage.get("tokens", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--topic", default="Photosynthesis")
+    parser.add_argument("--subject", default="Biology")
+    parser.add_argument("--text-file", help="generate from this text instead of the topic")
+    args = parser.parse_args()
+
+    if args.text_file:
+        with open(args.text_file, encoding="utf-8") as text_file:
+            source, source_args, prompt_values = "text", {"content": text_file.read()}, None
+    else:
+        source, source_args, prompt_values = "topic", {}, {"topic": args.topic, "subject": args.subject}
+
+    results = {"one call per type": [], "mixed": []}
+    for round_number in range(1, args.rounds + 1):
+        start_time = time.perf_counter()
+        count, input_tokens, output_tokens = 0, 0, 0
+        for question_type, number_of_questions in QUESTION_COUNTS.items():
+            quiz, report = run_pipeline(
+                source, source_args, number_of_questions, question_type, USER_DATA, prompt_values=prompt_values
+            )
+            call_input_tokens, call_output_tokens = tokens(report)
+            count += len(quiz)
+            input_tokens += call_input_tokens
+            output_tokens += call_output_tokens
+        results["one call per type"].append((time.perf_counter() - start_time, input_tokens, output_tokens, count))
+
+        start_time = time.perf_counter()
+        quiz, report = run_pipeline(
+            source, source_args, sum(QUESTION_COUNTS.values()), MIXED, USER_DATA,
+            prompt_values=prompt_values, question_counts=QUESTION_COUNTS,
+        )
+        results["mixed"].append((time.perf_counter() - start_time, *tokens(report), len(quiz)))
+
+        for name, runs in results.items():
+            seconds, input_tokens, output_tokens, count = runs[-1]
+            print(f"round {round_number} {name:17} {seconds:6.2f}s  in {input_tokens:6}  out {output_tokens:5}  {count} questions")
+
+    print()
+    for name, runs in results.items():
+        print(
+            f"{name:17} median {statistics.median(run[0] for run in runs):6.2f}s  "
+            f"in {statistics.median(run[1] for run in runs):8.0f}  out {statistics.median(run[2] for run in runs):6.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
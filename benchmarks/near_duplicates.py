@@ -0,0 +1,100 @@
+"""
+Per-item cost of the near-duplicate check on ingest, how well it finds
+reformatted and reworded copies, and how rarely it flags distinct short or
+templated cards (e.g. the same arithmetic card with other numbers).
+
+Offline, no Firebase or Gemini needed. Run from the repository root:
+
+    python -m benchmarks.near_duplicates --items 20000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from routes.near_duplicates import DuplicateIndex, normalize_text, signature
+
+WORDS = (
+    "cell membrane energy protein enzyme reaction molecule atom force mass velocity "
+    "equation function variable theorem proof market demand supply price revolution "
+    "empire treaty climate river mountain population genome species organism light"
+).split()
+
+
+def card(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "?"
+
+
+def short_card(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).capitalize() + "?"
+
+
+def templated_card(rng: random.Random) -> str:
+    first, second = rng.randint(1, 999), rng.randint(1, 999)
+    return f"What is {first} + {second}? {first + second}"
+
+
+def reformat(text: str) -> str:
+    """The same card with changed casing and punctuation."""
+    return text.rstrip("?").upper() + "!!"
+
+
+def reword(text: str, rng: random.Random) -> str:
+    """A light edit of a card: changed casing and punctuation, one word swapped."""
+    words = text.rstrip("?").split()
+    position = rng.randrange(len(words))
+    words[position] = rng.choice([word for word in WORDS if word != words[position].casefold()])
+    return " ".join(words).upper() + "!!"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000, help="cards already in the index")
+    parser.add_argument("--checks", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cards = [card(rng) for _ in range(args.items)]
+    short_cards = [short_card(rng) for _ in range(args.items // 10)]
+    templated_cards = [templated_card(rng) for _ in range(args.items // 10)]
+    cards += short_cards + templated_cards
+    index = DuplicateIndex()
+    start_time = time.perf_counter()
+    for position, text in enumerate(cards):
+        index.add(str(position), signature(text))
+    print(f"indexed {len(cards)} cards in {time.perf_counter() - start_time:.2f}s")
+
+    known = {normalize_text(text) for text in cards}
+
+    def distinct(make):
+        """make, redrawn until its card is not one already indexed."""
+        def draw():
+            while True:
+                text = make()
+                if normalize_text(text) not in known:
+                    return text
+        return draw
+
+    # Copies should be flagged; the rest are distinct cards that should not be
+    for name, make in (
+        ("reformatted copies", lambda: reformat(rng.choice(cards))),
+        ("reworded copies", lambda: reword(rng.choice(cards), rng)),
+        ("new cards", distinct(lambda: card(rng))),
+        ("short, one word changed", distinct(lambda: reword(rng.choice(short_cards), rng))),
+        ("templated, new numbers", distinct(lambda: templated_card(rng))),
+    ):
+        timings, found = [], 0
+        for _ in range(args.checks):
+            text = make()
+            start_time = time.perf_counter()
+            found += index.find(signature(text)) is not None
+            timings.append((time.perf_counter() - start_time) * 1000)
+        timings.sort()
+        print(
+            f"{name:24} flagged {found / args.checks:6.1%}  "
+            f"median {statistics.median(timings):.3f}ms  p99 {timings[int(len(timings) * 0.99)]:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Render cost of the prompt registry against the old build-all-five approach.
+
+The generators used to build all five question-type prompts as f-strings on every
+call and keep one; the registry renders only the selected template. No API key is
+needed. Run from the repository root:
+
+    python -m benchmarks.prompt_render --calls 20000
+"""
+import argparse
+import timeit
+
+from routes.prompt_registry import QUESTION_TYPES, TEMPLATES, prompt_hash, render_prompt
+
+VALUES = {"num": 15, "topic": "Photosynthesis", "subject": "Biology"}
+
+
+def render_all_five(source: str, question_type: str) -> str:
+    """What each generator call used to do: render every template, then pick one."""
+    prompts = {name: template.format(**VALUES) for name, template in TEMPLATES[source].items()}
+    return prompts[question_type]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    for source in TEMPLATES:
+        question_type = QUESTION_TYPES[0]
+        eager = timeit.timeit(lambda: render_all_five(source, question_type), number=args.calls)
+        lazy = timeit.timeit(
+            lambda: render_prompt(source, question_type, compact=False, **VALUES), number=args.calls
+        )
+        print(
+            f"{source:9} all five {eager / args.calls * 1e6:7.2f}us  registry {lazy / args.calls * 1e6:7.2f}us  "
+            f"({eager / lazy:.1f}x)  hash {prompt_hash(source, question_type)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
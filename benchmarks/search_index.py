@@ -0,0 +1,78 @@
+"""
+Build, segment load and query latency of the full-text search index at 100k
+documents (flashcards and quiz questions).
+
+Offline, no Firebase needed. Run from the repository root:
+
+    python -m benchmarks.search_index --documents 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from routes.search_index import SearchIndex
+
+WORDS = (
+    "cell membrane energy protein enzyme reaction molecule atom force mass velocity acceleration "
+    "equation function variable theorem proof derivative integral market demand supply price "
+    "revolution empire treaty constitution climate river mountain population genome species "
+    "organism light photosynthesis mitochondria respiration gravity electron nucleus element "
+    "compound solution acid base oxidation circuit voltage current resistance magnet wave"
+).split()
+
+
+def document(rng: random.Random) -> str:
+    # Zipf-like word choice, so some words are common and most are rare
+    return " ".join(WORDS[min(int(rng.paretovariate(1.2)) - 1, len(WORDS) - 1)] for _ in range(rng.randint(6, 30)))
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[int(len(timings) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = SearchIndex()
+    start_time = time.perf_counter()
+    for number in range(args.documents):
+        text = document(rng)
+        kind = "flashcard" if number % 2 else "question"
+        index.add(f"{kind}:{number}", text, text)
+    print(f"built {args.documents} documents in {time.perf_counter() - start_time:.2f}s")
+
+    start_time = time.perf_counter()
+    segments = index.segments()
+    print(
+        f"wrote {len(segments)} segments, {sum(map(len, segments)) / 1e6:.1f} MB, "
+        f"in {time.perf_counter() - start_time:.2f}s"
+    )
+    start_time = time.perf_counter()
+    loaded = SearchIndex()
+    for data in segments:
+        loaded.load_segment(data)
+    print(f"loaded them in {time.perf_counter() - start_time:.2f}s")
+
+    for name, make_query in (
+        ("one word", lambda: rng.choice(WORDS)),
+        ("three words", lambda: " ".join(rng.sample(WORDS, 3))),
+        ("prefix", lambda: rng.choice(WORDS)[:3]),
+    ):
+        timings = []
+        for _ in range(args.queries):
+            query = make_query()
+            start_time = time.perf_counter()
+            loaded.search(query)
+            timings.append((time.perf_counter() - start_time) * 1000)
+        median, p99 = percentiles(timings)
+        print(f"{name:12} median {median:6.2f}ms  p99 {p99:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Recall and latency of the chat agent's study-material vector index, flat
+against IVF partitioned, on synthetic clustered embeddings.
+
+Offline, no Gemini or Firebase needed. Run from the repository root:
+
+    python -m benchmarks.vector_index --chunks 50000 --lists 224
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Menttorix AI"))
+
+from study_retrieval import VectorIndex  # noqa: E402
+
+DIMENSIONS = 768
+
+
+def clustered(rng, count: int, topics: int) -> np.ndarray:
+    # Study material clusters by topic, and embeddings vary along far fewer
+    # directions than they have dimensions
+    latent = 32
+    centers = rng.standard_normal((topics, latent))
+    points = centers[rng.integers(0, topics, count)] + 0.7 * rng.standard_normal((count, latent))
+    projection = rng.standard_normal((latent, DIMENSIONS))
+    return (points @ projection + 0.5 * rng.standard_normal((count, DIMENSIONS))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--lists", type=int, default=224, help="IVF lists, about the square root of --chunks")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered(rng, args.chunks + args.queries, topics=500)
+    queries = vectors[args.chunks:]
+    index = VectorIndex(DIMENSIONS)
+    index.add(vectors[:args.chunks], [{"id": number} for number in range(args.chunks)])
+
+    def run(**search_args):
+        timings, results = [], []
+        for query in queries:
+            start_time = time.perf_counter()
+            results.append({item["id"] for item, _ in index.search(query, k=args.k, **search_args)})
+            timings.append((time.perf_counter() - start_time) * 1000)
+        return results, timings
+
+    exact, timings = run()
+    print(f"flat          median {statistics.median(timings):6.2f}ms  recall@{args.k} 100.0%")
+
+    start_time = time.perf_counter()
+    index.build_ivf(args.lists)
+    print(f"built {args.lists} IVF lists in {time.perf_counter() - start_time:.2f}s")
+    for n_probe in (1, 4, 8, 16):
+        results, timings = run(n_probe=n_probe)
+        recall = statistics.mean(len(found & truth) / args.k for found, truth in zip(results, exact))
+        print(f"ivf probe {n_probe:<3} median {statistics.median(timings):6.2f}ms  recall@{args.k} {recall:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from routes.firebase_utils import initialize_firebase
-from routes import algorithm, flashcards, decks, quizzes, study_sessions
+from routes import algorithm, flashcards, decks, quizzes, study_sessions, metrics, search
+from routes.topic_bank import start_warmer
 
 
 
@@ -12,6 +13,15 @@ app.include_router(quizzes.router)
 app.include_router(flashcards.router)
 app.include_router(decks.router)
 app.include_router(study_sessions.router)
+app.include_router(metrics.router)
+app.include_router(search.router)
+
+
+@app.on_event("startup")
+def warm_topic_banks():
+    # Pre-generates shared question banks for popular topics during off-peak hours
+    start_warmer()
+
 
 if __name__ == "__main__":
     import uvicorn
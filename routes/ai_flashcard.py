@@ -2,6 +2,11 @@ import os
 from dotenv import load_dotenv
 import google.generativeai as genai
 import json
+from routes.compact_schema import FLASHCARD_SCHEMA, expand_flashcards
+from routes.content_minimizer import estimate_tokens
+from routes.context_cache import cached_model, record_cache_hit, use_file
+from routes.model_routing import FLASHCARDS_OUTPUT_TOKENS, routed_model
+from routes.resilience import call_model
 
 load_dotenv()
 
@@ -42,9 +47,8 @@ def generate_flashcards(message: str, deck_id: str, file_name: str = None):
     "<OUTPUT_FORMAT>\n"\
     "The output format must be a list of JSON objects, each representing a flashcard with the following structure:\n"\
     "{\n"\
-    "    \"front\": \"Question or prompt\",\n"\
-    "    \"back\": \"Answer or explanation\",\n"\
-    f"    \"deck_id\": {deck_id}\n"\
+    "    \"f\": \"Question or prompt (the front)\",\n"\
+    "    \"b\": \"Answer or explanation (the back)\"\n"\
     "}\n"\
     "</OUTPUT_FORMAT>\n"\
     "\n"\
@@ -58,14 +62,12 @@ def generate_flashcards(message: str, deck_id: str, file_name: str = None):
     "Output:\n"\
     "[\n"\
     "    {\n"\
-    "        \"front\": \"What is evaporation in the water cycle?\",\n"\
-    "        \"back\": \"Evaporation is the process where water changes from a liquid to a gas or vapor due to heat from the sun. It occurs from surfaces like oceans, lakes, and plants.\",\n"\
-    f"       \"deck_id\": {deck_id}\n"\
+    "        \"f\": \"What is evaporation in the water cycle?\",\n"\
+    "        \"b\": \"Evaporation is the process where water changes from a liquid to a gas or vapor due to heat from the sun. It occurs from surfaces like oceans, lakes, and plants.\"\n"\
     "    },\n"\
     "    {\n"\
-    "        \"front\": \"What is condensation in the water cycle?\",\n"\
-    "        \"back\": \"Condensation is the process where water vapor in the air cools and changes back into liquid water. This forms clouds and fog.\",\n"\
-    f"       \"deck_id\": {deck_id},\n"\
+    "        \"f\": \"What is condensation in the water cycle?\",\n"\
+    "        \"b\": \"Condensation is the process where water vapor in the air cools and changes back into liquid water. This forms clouds and fog.\"\n"\
     "    }\n"\
     "]\n"\
     "</FEW_SHOT_EXAMPLES>\n"\
@@ -74,26 +76,33 @@ def generate_flashcards(message: str, deck_id: str, file_name: str = None):
     "Remember to create flashcards that are concise, focused, and informative. Each flashcard should cover a single concept, with a clear question on the front and a comprehensive answer on the back. Prioritize important information and maintain consistency across all flashcards. Output the flashcards in the specified JSON format, ensuring all required fields are included.\n"\
     "</RECAP>"
     print("Start generating....")
-
-    model = genai.GenerativeModel(
-                "models/gemini-1.5-flash",
-                system_instruction=system_message,
-                generation_config={"response_mime_type": "application/json"},
-            )
-    print("Model loaded....")
+    generation_config = {"response_mime_type": "application/json", "response_schema": FLASHCARD_SCHEMA}
 
     if not file_name:
         prompt = f"Generate flashcards base on the given instructions and constraints: {message}"
-        response = model.generate_content(prompt)
+        # The routing table picks the model from the size of the request
+        with routed_model("flashcards", estimate_tokens(system_message + prompt), FLASHCARDS_OUTPUT_TOKENS) as model_name:
+            model = genai.GenerativeModel(model_name, system_instruction=system_message, generation_config=generation_config)
+            response = call_model("flashcards", model.generate_content, prompt)
         print("Response generated....")
     else:
-        file = genai.get_file(file_name)
         prompt = f"Generate flashcards base on the given document, instructions and constraints: {message}"
-        response = model.generate_content([file, prompt])
+        # Documents reused across generations are read from their context cache
+        cache, file = use_file(file_name)
+        if cache is not None:
+            cached = cached_model(cache, generation_config)
+            response = call_model("flashcards", cached.generate_content, [system_message, prompt])
+            record_cache_hit(file_name, response)
+        else:
+            # A document's size is not known here, so it is routed as a large request
+            with routed_model("flashcards", None, FLASHCARDS_OUTPUT_TOKENS) as model_name:
+                model = genai.GenerativeModel(model_name, system_instruction=system_message, generation_config=generation_config)
+                response = call_model("flashcards", model.generate_content, [file, prompt])
 
     print("Response received")
 
-    flashcard = json.loads(response.text)
+    # The model only writes front and back; the deck id is added here
+    flashcard = expand_flashcards(json.loads(response.text), deck_id)
     print("Flashcards generated....")
     print(flashcard)
 
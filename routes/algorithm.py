@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 import random
 from firebase_admin import firestore
 from routes.firebase_utils import initialize_firebase
+from routes.question_pool import LOW_WATERMARK, replenish_pool
 from datetime import datetime
 
 
@@ -27,13 +29,16 @@ class QuizAnswer(BaseModel):
     time_to_answer: float
 
 @router.post("/users/{user_id}/quizzes/{quiz_id}/next-question")
-async def get_next_question(user_id: str, quiz_id: str, answer: QuizAnswer):
+async def get_next_question(user_id: str, quiz_id: str, answer: QuizAnswer, background_tasks: BackgroundTasks):
     # Validate user and quiz
     user_ref = db.collection("users").document(user_id)
     quiz_ref = user_ref.collection("quizzes").document(quiz_id)
-    
-    if not quiz_ref.get().exists:
+    quiz_doc = quiz_ref.get()
+
+    if not quiz_doc.exists:
         raise HTTPException(status_code=404, detail="Quiz not found")
+    # Lazily generated quizzes keep a spec for topping up their question pool
+    has_pool = "question_pool" in (quiz_doc.to_dict() or {})
 
     # Normalize inputs
     normalized_confidence = answer.confidence_level / 5
@@ -71,19 +76,26 @@ async def get_next_question(user_id: str, quiz_id: str, answer: QuizAnswer):
             'last_updated': firestore.SERVER_TIMESTAMP
         })
     else:
+        completed_questions = [answer.question_id]
         progress_ref.add({
-            'completed_questions': [answer.question_id],
+            'completed_questions': completed_questions,
             'current_difficulty': next_difficulty,
             'score': 1 if answer.is_correct else 0,
             'last_updated': firestore.SERVER_TIMESTAMP
         })
-    completed_questions = progress_data.get('completed_questions', [])
-    # Get next question from Firestore
-    questions_ref = quiz_ref.collection('questions')
-    questions = questions_ref.where('difficulty', '==', next_difficulty).stream()
 
-    # Convert to list and filter out completed questions
-    available_questions = [q.to_dict() | {"id": q.id} for q in questions if q.id not in completed_questions]
+    def get_available_questions():
+        # Get next question from Firestore
+        questions_ref = quiz_ref.collection('questions')
+        questions = questions_ref.where('difficulty', '==', next_difficulty).stream()
+        # Convert to list and filter out completed questions
+        return [q.to_dict() | {"id": q.id} for q in questions if q.id not in completed_questions]
+
+    available_questions = get_available_questions()
+
+    # A lazy pool that ran dry is topped up before giving up, in a worker thread as it calls Gemini
+    if not available_questions and has_pool and await asyncio.to_thread(replenish_pool, user_id, quiz_id, next_difficulty):
+        available_questions = get_available_questions()
 
     if not available_questions:
         raise HTTPException(status_code=404, detail="No more questions available")
@@ -91,6 +103,10 @@ async def get_next_question(user_id: str, quiz_id: str, answer: QuizAnswer):
     # Randomly select next question
     next_question = random.choice(available_questions)
 
+    # Refill a running-low pool after responding, before it runs dry
+    if has_pool and len(available_questions) - 1 <= LOW_WATERMARK:
+        background_tasks.add_task(replenish_pool, user_id, quiz_id, next_difficulty)
+
     # Update ML model weights (simple gradient descent)
     learning_rate = 0.01
     target = 1 if next_difficulty == "Hard" else 0.5 if next_difficulty == "Medium" else 0
@@ -0,0 +1,110 @@
+import math
+import threading
+import time
+from typing import Dict
+
+# Consecutive failures that open a circuit, and how long it stays open before
+# one probe call is let through (half-open)
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """A call refused because its service's circuit is open; retry_after is in whole seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while instead of waiting out every failure.
+
+    The circuit opens after FAILURE_THRESHOLD consecutive failures and refuses calls
+    for OPEN_SECONDS. Then it is half-open: a single probe call goes through, and
+    its outcome closes the circuit again or re-opens it. A probe that never reports
+    back is replaced by another after OPEN_SECONDS.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.counters = {"opened": 0, "rejected": 0, "probes": 0}
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """Whether calls are being refused (open, or half-open with its probe in flight)."""
+        with self._lock:
+            return self.state != CLOSED
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return max(math.ceil(self.opened_at + self.open_seconds - time.monotonic()), 1)
+
+    def allow(self) -> bool:
+        """Whether a call may go to the service now; in half-open state it becomes the probe."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    self.counters["rejected"] += 1
+                    return False
+                self.state = HALF_OPEN
+                self.probe_started = None
+            if self.probe_started is not None and now - self.probe_started < self.open_seconds:
+                self.counters["rejected"] += 1
+                return False
+            self.probe_started = now
+            self.counters["probes"] += 1
+            return True
+
+    def check(self) -> None:
+        """
+        Raises:
+            CircuitOpen: If the call may not go to the service now.
+        """
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable right now; try again shortly", self.retry_after())
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                print(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probe_started = None
+                self.counters["opened"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.counters}
+
+
+gemini_breaker = CircuitBreaker("Gemini")
+firecrawl_breaker = CircuitBreaker("Firecrawl")
+
+
+def breaker_stats() -> Dict:
+    """State and counters of every circuit breaker."""
+    return {breaker.name: breaker.stats() for breaker in (gemini_breaker, firecrawl_breaker)}
@@ -0,0 +1,173 @@
+from typing import Dict, List
+
+# Compact output contract: the model answers with short keys and no data the server
+# already has; expand_questions and expand_flashcards rebuild the stored shapes.
+DIFFICULTY_CODES = {"E": "Easy", "M": "Medium", "H": "Hard"}
+RESPONSE_LENGTH_CODES = {"B": "Brief", "M": "Moderate", "X": "Extensive"}
+# Keys of the per-type lists in mixed-quiz output
+TYPE_CODES = {
+    "Multiple Choice": "mc",
+    "True/False": "tf",
+    "Fill in the space": "fs",
+    "Short Answer": "sa",
+    "Open End": "oe",
+}
+
+COMMON_PROPERTIES = {
+    "q": {"type": "string"},
+    "e": {"type": "string"},
+    "h": {"type": "string"},
+    "d": {"type": "string"},
+    "t": {"type": "string"},
+}
+ANSWER_PROPERTIES = {
+    "Multiple Choice": {"o": {"type": "array", "items": {"type": "string"}}, "a": {"type": "integer"}},
+    "True/False": {"a": {"type": "boolean"}},
+    "Fill in the space": {"a": {"type": "string"}},
+    "Short Answer": {"a": {"type": "string"}},
+    "Open End": {"l": {"type": "string"}, "k": {"type": "array", "items": {"type": "string"}}},
+}
+ANSWER_INSTRUCTIONS = {
+    "Multiple Choice": '"o": the 4 options in order, "a": the 0-based index of the correct option in "o"',
+    "True/False": '"a": true or false',
+    "Fill in the space": '"a": the missing words',
+    "Short Answer": '"a": the short answer',
+    "Open End": '"l": suggested response length, B (Brief), M (Moderate) or X (Extensive), "k": 3-5 key points',
+}
+
+FLASHCARD_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"f": {"type": "string"}, "b": {"type": "string"}},
+        "required": ["f", "b"],
+    },
+}
+
+
+def question_schema(question_type: str, lean: bool = False) -> Dict:
+    """The Gemini response_schema for a compact list of questions."""
+    properties = dict(COMMON_PROPERTIES, **ANSWER_PROPERTIES[question_type])
+    if lean or question_type == "Open End":
+        properties.pop("h")
+    if lean:
+        properties.pop("e")
+    return {
+        "type": "array",
+        "items": {"type": "object", "properties": properties, "required": list(properties)},
+    }
+
+
+def compact_generation_config(question_type: str, lean: bool = False) -> Dict:
+    """generation_config enforcing the compact question contract."""
+    return {"response_mime_type": "application/json", "response_schema": question_schema(question_type, lean)}
+
+
+def compact_fields(question_type: str, lean: bool = False) -> str:
+    """The compact keys of one question type, described for the prompt."""
+    fields = ['"q": the question', ANSWER_INSTRUCTIONS[question_type]]
+    if not lean:
+        fields.append('"e": the explanation')
+        if question_type != "Open End":
+            fields.append('"h": a short hint')
+    fields += ['"d": difficulty, E (Easy), M (Medium) or H (Hard)', '"t": the topic']
+    return ", ".join(fields)
+
+
+def compact_instructions(question_type: str, lean: bool = False) -> str:
+    """Prompt text replacing the verbose OUTPUT_FORMAT with the compact keys."""
+    return f"""
+            COMPACT_OUTPUT
+            Ignore the key names in OUTPUT_FORMAT and the examples. Output a JSON list where each question
+            only has these keys: {compact_fields(question_type, lean)}.
+            """
+
+
+def mixed_generation_config(question_types: List[str], lean: bool = False) -> Dict:
+    """generation_config for a mixed quiz: one compact list per question type, under its TYPE_CODES key."""
+    properties = {TYPE_CODES[question_type]: question_schema(question_type, lean) for question_type in question_types}
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": {"type": "object", "properties": properties, "required": list(properties)},
+    }
+
+
+def mixed_instructions(question_types: List[str], lean: bool = False) -> str:
+    """Prompt text describing the compact output of a mixed quiz."""
+    lists = "\n".join(
+        f'            - "{TYPE_CODES[question_type]}": the {question_type} questions, each with only these keys: '
+        f"{compact_fields(question_type, lean)}"
+        for question_type in question_types
+    )
+    return f"""
+            OUTPUT_FORMAT
+            Output a JSON object with one list of questions per question type:
+{lists}
+            """
+
+
+def expand_questions(items: List[Dict], question_type: str) -> List[Dict]:
+    """
+    Turns compact model output into the question documents stored in Firestore.
+
+    Items without a question, or whose answer cannot be resolved (e.g. an option
+    index out of range), are dropped.
+    """
+    questions = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("q"):
+            continue
+        question = {"question": item["q"]}
+
+        if question_type == "Multiple Choice":
+            options = item.get("o") or []
+            index = item.get("a")
+            if not isinstance(index, int) or not 0 <= index < len(options):
+                continue
+            question["answer"] = options[index]
+            question["options"] = options
+        elif question_type == "True/False":
+            if not isinstance(item.get("a"), bool):
+                continue
+            question["answer"] = "True" if item["a"] else "False"
+            question["options"] = ["True", "False"]
+        elif question_type == "Open End":
+            question["suggestedResponseLength"] = RESPONSE_LENGTH_CODES.get(item.get("l"), item.get("l", "Moderate"))
+            question["keyPoints"] = item.get("k", [])
+        else:
+            if not item.get("a"):
+                continue
+            question["answer"] = item["a"]
+
+        if "e" in item:
+            question["explanation"] = item["e"]
+        if "h" in item:
+            question["hint"] = item["h"]
+        question["difficulty"] = DIFFICULTY_CODES.get(item.get("d"), item.get("d"))
+        question["topic"] = item.get("t", "")
+        questions.append(question)
+    return questions
+
+
+def expand_mixed(lists: Dict[str, List[Dict]], question_types: List[str]) -> List[Dict]:
+    """
+    Turns compact mixed-quiz output into question documents, grouped by type.
+
+    Each question is tagged with its "question_type", which
+    routes.firebase_utils.save_quiz_to_firebase stores with it.
+    """
+    questions = []
+    for question_type in question_types:
+        for question in expand_questions(lists.get(TYPE_CODES[question_type]) or [], question_type):
+            question["question_type"] = question_type
+            questions.append(question)
+    return questions
+
+
+def expand_flashcards(items: List[Dict], deck_id: str) -> List[Dict]:
+    """Turns compact flashcards into the shape create_bulk_flashcards expects."""
+    return [
+        {"front": item["f"], "back": item["b"], "deck_id": deck_id}
+        for item in items
+        if isinstance(item, dict) and item.get("f") and item.get("b")
+    ]
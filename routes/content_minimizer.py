@@ -0,0 +1,146 @@
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Dict, Optional
+
+# Rough Gemini tokenizer ratio for English prose; good enough for budgeting and logging
+CHARS_PER_TOKEN = 4
+MAX_CONTENT_TOKENS = 24_000
+
+IMAGE_PATTERN = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+LINK_PATTERN = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+BARE_URL_LINE_PATTERN = re.compile(r"^\s*(?:[-*]\s*)?<?https?://\S+>?\s*$", re.M)
+HTML_TAG_PATTERN = re.compile(r"</?[a-zA-Z][^>]*>")
+# Page chrome phrases; a line is boilerplate only when it is made up entirely of them,
+# so content that merely mentions cookies or subscriptions is kept
+BOILERPLATE_PHRASE_PATTERN = re.compile(
+    r"(?:(?:we|this (?:web)?site) uses? cookies\b.*|accept(?: all)? cookies|cookie (?:policy|settings|preferences)|"
+    r"(?:(?:©|\(c\)|copyright)\s*)?(?:\d{4}\s*)?(?:[\w.,&' -]+\s)?all rights reserved|"
+    r"skip to (?:main )?content|sign in|log in|sign up|register|"
+    r"subscribe(?: (?:to|for) (?:our|the) newsletter| now)?|(?:our )?newsletter|"
+    r"share(?: (?:on|this|via)(?: \w+)?)?|privacy(?: policy)?|terms(?: of (?:use|service))?|"
+    r"back to top|follow us(?: on \w+)?|advertisement|home|menu|search|next|previous|prev)",
+    re.I,
+)
+BOILERPLATE_SEPARATOR_PATTERN = re.compile(r"\s*[|·•]\s*|\s+(?:or|and|/)\s+", re.I)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of model tokens in a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def block_key(block: str) -> str:
+    """Hash of a block's words, ignoring case and spacing, for spotting repeats."""
+    return hashlib.sha1(" ".join(block.lower().split()).encode("utf-8")).hexdigest()
+
+
+def main_text(result: Dict) -> str:
+    """Returns only the readable text of a scrape result, without metadata or link lists."""
+    return result.get("markdown") or result.get("content") or ""
+
+
+def is_boilerplate_line(line: str) -> bool:
+    """Short lines that are page chrome rather than content, e.g. "Sign in | Subscribe"."""
+    if len(line.split()) > 8:
+        return False
+    parts = [part.strip(" .:!") for part in BOILERPLATE_SEPARATOR_PATTERN.split(line.strip(" #*->_"))]
+    parts = [part for part in parts if part]
+    return bool(parts) and all(BOILERPLATE_PHRASE_PATTERN.fullmatch(part) for part in parts)
+
+
+def clean_text(text: str) -> str:
+    """
+    Strips everything but the main text from scraped or pasted content.
+
+    Images, link targets, bare URLs and stray HTML tags are dropped, whitespace is
+    collapsed, short boilerplate lines are removed, and lines or paragraphs that
+    repeat (navigation, headers, footers) are kept only once.
+
+    Args:
+        text (str): The raw content.
+
+    Returns:
+        str: The cleaned content, paragraphs separated by blank lines.
+    """
+    text = IMAGE_PATTERN.sub("", text)
+    text = LINK_PATTERN.sub(r"\1", text)
+    text = BARE_URL_LINE_PATTERN.sub("", text)
+    text = HTML_TAG_PATTERN.sub("", text)
+    text = text.replace("\r\n", "\n").replace("\t", " ")
+
+    # Collapse spacing everywhere except inside code fences
+    lines = []
+    in_code = False
+    for line in text.split("\n"):
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+            lines.append(line.strip())
+        else:
+            lines.append(line.rstrip() if in_code else " ".join(line.split()))
+
+    # Menu-sized lines seen three or more times are navigation and repeated widgets
+    line_counts = Counter(
+        line for line in lines
+        if re.search(r"[a-zA-Z]", line) and len(line.split()) <= 4 and not line.startswith("#")
+    )
+
+    paragraphs = []
+    current = []
+    in_code = False
+    for line in lines + [""]:
+        if line.startswith("```"):
+            in_code = not in_code
+        if in_code or line.startswith("```"):
+            current.append(line)
+            continue
+        if line and not is_boilerplate_line(line) and line_counts.get(line, 0) < 3:
+            current.append(line)
+            continue
+        if not line and current:
+            paragraphs.append("\n".join(current))
+            current = []
+
+    seen = set()
+    unique = []
+    for paragraph in paragraphs:
+        key = block_key(paragraph)
+        if key not in seen:
+            seen.add(key)
+            unique.append(paragraph)
+    return "\n\n".join(unique)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to the token budget, at a paragraph boundary where possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n\n", 0, max_chars)
+    return text[: cut if cut > max_chars // 2 else max_chars]
+
+
+def minimize_content(text: str, max_tokens: Optional[int] = MAX_CONTENT_TOKENS, label: str = "content") -> str:
+    """
+    Cleans content and fits it into the token budget before it is sent to Gemini.
+
+    Input and output token counts are logged for every call so the savings per
+    request are visible.
+
+    Args:
+        text (str): The raw content.
+        max_tokens (Optional[int]): The token budget; None keeps the full cleaned text.
+        label (str): What the content is (a URL, "pasted text"), for the log line.
+
+    Returns:
+        str: The minimized content.
+    """
+    input_tokens = estimate_tokens(text)
+    minimized = clean_text(text)
+    if max_tokens is not None:
+        minimized = truncate_to_tokens(minimized, max_tokens)
+    output_tokens = estimate_tokens(minimized)
+    saved = 100 * (1 - output_tokens / input_tokens) if input_tokens else 0
+    print(f"Minimized {label}: {input_tokens} -> {output_tokens} tokens ({saved:.0f}% saved)")
+    return minimized
@@ -0,0 +1,190 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+# Context caching needs a pinned model version
+CACHE_MODEL = "models/gemini-1.5-flash-001"
+CACHE_TTL_MINUTES = 30
+# Files are cached from their second use on; Gemini refuses caches below this size
+CACHE_AFTER_USES = 2
+MIN_CACHE_TOKENS = 32_768
+# Uses of a file wait this long for another use's cache creation, then go uncached
+CACHE_WAIT_SECONDS = 60
+# Entries whose cache has expired are dropped once unused this long; the least
+# recently used are dropped beyond MAX_ENTRIES
+ENTRY_IDLE_SECONDS = CACHE_TTL_MINUTES * 60
+MAX_ENTRIES = 1000
+
+# One entry per Gemini file name, least recently used first
+_entries: "OrderedDict[str, Dict]" = OrderedDict()
+# Hits and savings of dropped entries, so the totals in cache_stats stay whole
+_dropped = {"hits": 0, "tokens_saved": 0}
+_entries_lock = threading.Lock()
+
+
+def _drop(file_name: str) -> None:
+    entry = _entries.pop(file_name)
+    _dropped["hits"] += entry["hits"]
+    _dropped["tokens_saved"] += entry["tokens_saved"]
+
+
+def _evict(now: float) -> None:
+    """Drops idle entries with no live cache, then the oldest to make room for one more; needs _entries_lock."""
+    for file_name, entry in list(_entries.items()):
+        if entry["expires"] <= now and entry["used"] < now - ENTRY_IDLE_SECONDS and entry["creating"] is None:
+            _drop(file_name)
+    while len(_entries) >= MAX_ENTRIES:
+        _drop(next(iter(_entries)))
+
+
+def _entry(file_name: str) -> Dict:
+    with _entries_lock:
+        entry = _entries.get(file_name)
+        if entry is None:
+            now = time.time()
+            _evict(now)
+            entry = _entries[file_name] = {
+                "lock": threading.Lock(),
+                "uses": 0,
+                "used": now,
+                "tokens": None,
+                "cache": None,
+                "expires": 0.0,
+                "creating": None,
+                "hits": 0,
+                "tokens_saved": 0,
+            }
+        else:
+            _entries.move_to_end(file_name)
+        return entry
+
+
+def _live_cache(entry: Dict) -> Optional[caching.CachedContent]:
+    """The entry's cache if it has not expired, counted as a hit; needs the entry's lock."""
+    if entry["cache"] is not None and entry["expires"] > time.time():
+        entry["hits"] += 1
+        return entry["cache"]
+    return None
+
+
+def use_file(file_name: str) -> Tuple[Optional[caching.CachedContent], Optional[object]]:
+    """
+    Looks up an uploaded file for a generation, through its context cache when it has one.
+
+    The first use returns the file itself. From the CACHE_AFTER_USES-th use on, a
+    file of at least MIN_CACHE_TOKENS tokens is put in a cached content handle
+    living CACHE_TTL_MINUTES, recreated when it expires, and later generations
+    are routed through it. Concurrent uses of the same file wait (up to
+    CACHE_WAIT_SECONDS) for one cache to be created instead of creating several;
+    the creation itself holds no lock. Only uses served by an existing cache count
+    as hits.
+
+    Args:
+        file_name (str): The name of the file uploaded to google files.
+
+    Returns:
+        Tuple[Optional[CachedContent], Optional[File]]: The cache to generate from,
+            or None and the file to pass to generate_content.
+    """
+    entry = _entry(file_name)
+    with entry["lock"]:
+        entry["uses"] += 1
+        entry["used"] = time.time()
+        cache = _live_cache(entry)
+        if cache is not None:
+            return cache, None
+        uncached = entry["uses"] < CACHE_AFTER_USES or (
+            entry["tokens"] is not None and entry["tokens"] < MIN_CACHE_TOKENS
+        )
+        creating = entry["creating"]
+        creator = not uncached and creating is None
+        if creator:
+            creating = entry["creating"] = threading.Event()
+    if uncached:
+        return None, genai.get_file(file_name)
+
+    if not creator:
+        # Another use of the file is creating the cache
+        creating.wait(CACHE_WAIT_SECONDS)
+        with entry["lock"]:
+            cache = _live_cache(entry)
+        return (cache, None) if cache is not None else (None, genai.get_file(file_name))
+
+    try:
+        files = genai.get_file(file_name)
+        try:
+            tokens = entry["tokens"]
+            if tokens is None:
+                tokens = genai.GenerativeModel(CACHE_MODEL).count_tokens([files]).total_tokens
+                with entry["lock"]:
+                    entry["tokens"] = tokens
+            if tokens < MIN_CACHE_TOKENS:
+                return None, files
+
+            start_time = time.time()
+            cache = caching.CachedContent.create(
+                model=CACHE_MODEL,
+                display_name=file_name,
+                contents=[files],
+                ttl=datetime.timedelta(minutes=CACHE_TTL_MINUTES),
+            )
+            with entry["lock"]:
+                entry["cache"] = cache
+                # Stop routing through the cache a little before Gemini drops it
+                entry["expires"] = start_time + CACHE_TTL_MINUTES * 60 - 30
+            print(f"Cached {file_name} ({tokens} tokens) in {time.time() - start_time:.2f} seconds")
+            return cache, None
+        except Exception as e:
+            # Caching is an optimization; the file still works uncached
+            print(f"Caching {file_name} failed: {str(e)}")
+            return None, files
+    finally:
+        with entry["lock"]:
+            entry["creating"] = None
+        creating.set()
+
+
+def cached_model(cache: caching.CachedContent, generation_config: Dict) -> genai.GenerativeModel:
+    """
+    A model generating from a context cache.
+
+    Cached contents carry no system instruction here, so callers put theirs at the
+    start of the prompt instead.
+    """
+    return genai.GenerativeModel.from_cached_content(cache, generation_config=generation_config)
+
+
+def record_cache_hit(file_name: str, response) -> None:
+    """Adds the input tokens a cached generation did not have to re-ingest to the file's savings."""
+    entry = _entry(file_name)
+    usage = getattr(response, "usage_metadata", None)
+    saved = getattr(usage, "cached_content_token_count", 0) or entry["tokens"] or 0
+    with entry["lock"]:
+        entry["tokens_saved"] += saved
+
+
+def cache_stats() -> Dict:
+    """Uses, cache hits and input tokens saved, per file and in total."""
+    now = time.time()
+    with _entries_lock:
+        files = {
+            file_name: {
+                "uses": entry["uses"],
+                "hits": entry["hits"],
+                "tokens": entry["tokens"],
+                "tokens_saved": entry["tokens_saved"],
+                "cached": entry["cache"] is not None and entry["expires"] > now,
+            }
+            for file_name, entry in _entries.items()
+        }
+        dropped = dict(_dropped)
+    return {
+        "files": files,
+        "hits": dropped["hits"] + sum(stats["hits"] for stats in files.values()),
+        "tokens_saved": dropped["tokens_saved"] + sum(stats["tokens_saved"] for stats in files.values()),
+    }
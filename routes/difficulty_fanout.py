@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Callable, Dict, List
+
+from routes.circuit_breaker import CircuitOpen
+from routes.rate_limit import RateLimited, with_caller
+from routes.resilience import DeadlineExceeded
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+
+def generate_by_difficulty(generate: Callable[..., List[Dict]], *args, **kwargs) -> List[Dict]:
+    """
+    Runs a quiz generator once per difficulty level, concurrently, and merges the results.
+
+    Each call is asked for number_of_questions questions of a single difficulty, so
+    output tokens for the three levels are produced in parallel instead of in one
+    long response. Questions whose "difficulty" does not match their call are
+    corrected, and if a level fails the other levels are still returned.
+
+    Args:
+        generate (Callable[..., List[Dict]]): A generate_quiz_* function accepting difficulty.
+        *args, **kwargs: The generator's usual arguments.
+
+    Returns:
+        List[Dict]: The merged quiz, Easy first.
+
+    Raises:
+        RateLimited, DeadlineExceeded, CircuitOpen: If every difficulty level failed because of one.
+        RuntimeError: If every difficulty level failed otherwise.
+    """
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=len(DIFFICULTIES)) as executor:
+        futures = {
+            difficulty: executor.submit(with_caller(generate), *args, difficulty=difficulty, **kwargs)
+            for difficulty in DIFFICULTIES
+        }
+
+    quiz = []
+    errors = {}
+    refused = None
+    corrected = 0
+    for difficulty, future in futures.items():
+        try:
+            questions = future.result()
+        except Exception as e:
+            if isinstance(e, (RateLimited, DeadlineExceeded, CircuitOpen)):
+                refused = e
+            errors[difficulty] = str(e)
+            print(f"{difficulty} questions failed: {str(e)}")
+            continue
+        for question in questions:
+            if not isinstance(question, dict):
+                continue
+            if question.get("difficulty") != difficulty:
+                question["difficulty"] = difficulty
+                corrected += 1
+            quiz.append(question)
+
+    if not quiz and refused:
+        raise refused
+    if not quiz:
+        raise RuntimeError(f"Quiz generation failed for every difficulty level: {errors}")
+    if corrected:
+        print(f"Corrected the difficulty of {corrected} questions")
+    elapsed_time = time.time() - start_time
+    print(f"Function executed in {elapsed_time:.2f} seconds")
+    return quiz
+
+
+def by_difficulty(generate: Callable[..., List[Dict]]) -> Callable[..., List[Dict]]:
+    """Wraps a generate_quiz_* function so it fans out per difficulty level."""
+
+    @wraps(generate)
+    def wrapper(*args, **kwargs):
+        return generate_by_difficulty(generate, *args, **kwargs)
+
+    return wrapper
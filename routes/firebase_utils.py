@@ -4,6 +4,9 @@ import firebase_admin
 import os
 import json
 from firebase_admin import credentials, firestore
+from routes.near_duplicates import dedupe_questions, index_saved_questions, mark_stale as mark_duplicates_stale
+from routes.question_index import index_questions, mark_stale as mark_questions_stale
+from routes.search_index import index_quiz_questions, mark_stale as mark_search_stale
 
 
 field_id = str(random.randint(10000, 99999))
@@ -32,8 +35,24 @@ def get_user_data(user_id):
         return None
 
 
-def save_quiz_to_firebase(user_id, quiz_id, quiz, question_type):
-    """Saves generated quiz to Firestore."""
+def update_index(description, update, mark_stale, user_id, *args):
+    """
+    Applies one change to one of a user's indexes. If it fails, the index is marked
+    stale so that it is rebuilt from Firestore instead of missing the change; the
+    other indexes and the saved documents are not affected.
+    """
+    try:
+        update(user_id, *args)
+    except Exception as e:
+        print(f"Updating the {description} of {user_id} failed: {str(e)}")
+        try:
+            mark_stale(user_id)
+        except Exception as e:
+            print(f"Marking the {description} of {user_id} stale failed: {str(e)}")
+
+
+def save_quiz_to_firebase(user_id, quiz_id, quiz, question_type, index=True):
+    """Saves generated quiz to Firestore, adding its questions to the user's question index unless index is False."""
     print('start....')
     db = firestore.client()
     user_ref = db.collection("users").document(user_id).collection("quizzes").document(quiz_id)
@@ -41,9 +60,36 @@ def save_quiz_to_firebase(user_id, quiz_id, quiz, question_type):
     questions_collection = user_ref.collection("questions")
     print('accessing doc....')
 
-    for q in quiz:
+    try:
+        questions, dropped = dedupe_questions(user_id, quiz_id, quiz)
+        if dropped:
+            print(f"Dropped {dropped} near-duplicate questions from quiz {quiz_id}")
+    except Exception as e:
+        print(f"Near-duplicate check of quiz {quiz_id} failed: {str(e)}")
+        questions = [(q, None, None) for q in quiz]
+
+    saved, signatures, searchable = [], [], []
+    for q, signature, duplicate_of in questions:
+        # Record the type on each question, so quizzes mixing several types can be told apart
+        q.setdefault("question_type", question_type)
+        if duplicate_of:
+            q["duplicate_of"] = duplicate_of
         # Create a new document for each question
         doc_ref = questions_collection.document()
         doc_ref.set(q)
+        searchable.append((doc_ref.id, q))
+        if signature is not None:
+            signatures.append((doc_ref.id, signature))
+        # The question bank already has the question a near-duplicate repeats
+        if not duplicate_of:
+            saved.append((doc_ref.id, q))
+
+    update_index(
+        "near-duplicate index", index_saved_questions, lambda user_id: mark_duplicates_stale(user_id, "questions"),
+        user_id, quiz_id, signatures,
+    )
+    if index:
+        update_index("question index", index_questions, mark_questions_stale, user_id, quiz_id, saved)
+    update_index("search index", index_quiz_questions, mark_search_stale, user_id, quiz_id, searchable)
 
 initialize_firebase()
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel
 from firebase_admin import firestore
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from routes.ai_flashcard import generate_flashcards
+from routes.firebase_utils import update_index
+from routes.near_duplicates import dedupe_flashcards, index_flashcards, mark_stale as mark_duplicates_stale
+from routes.search_index import index_flashcard_documents, mark_stale as mark_search_stale
+from routes.circuit_breaker import CircuitOpen
+from routes.idempotency import idempotent
+from routes.rate_limit import RateLimited, set_caller
+from routes.resilience import DeadlineExceeded, set_deadline
 from typing import List, Optional
 import math
+import asyncio
 
 load_dotenv()
 
@@ -31,8 +39,20 @@ class FlashcardCreate(BaseModel):
     back: str
     deck_id: str
 
+def index_saved_flashcards(user_id: str, saved: List, searchable: List) -> None:
+    """Adds saved flashcards to the user's near-duplicate and search indexes, each on its own (see update_index)."""
+    update_index(
+        "near-duplicate index", index_flashcards, lambda user_id: mark_duplicates_stale(user_id, "flashcards"), user_id, saved
+    )
+    update_index("search index", index_flashcard_documents, mark_search_stale, user_id, searchable)
+
 @router.post("/users/{user_id}/flashcards")
 async def create_flashcard(user_id: str, flashcard: Flashcard):
+    # The dedupe and indexing can load an index from Firestore, so they run off the event loop
+    unique, duplicates = await asyncio.to_thread(dedupe_flashcards, user_id, [flashcard.dict()])
+    if duplicates:
+        return {"id": duplicates[0][1], "duplicate": True, "message": "A near-identical flashcard already exists"}
+
     doc_ref = db.collection("users").document(user_id).collection("flashcards").document()
     doc_ref.set({
         "front": flashcard.front,
@@ -45,46 +65,71 @@ async def create_flashcard(user_id: str, flashcard: Flashcard):
         "interval": 0,
         "repetition": 0
     })
+    await asyncio.to_thread(index_saved_flashcards, user_id, [(doc_ref.id, unique[0][1])], [(doc_ref.id, unique[0][0])])
     return {"id": doc_ref.id, "message": "Flashcard created successfully"}
 
 @router.post("/users/{user_id}/quizzes/{quiz_id}/result/{result_id}/create-flashcards")
 async def create_flashcards_from_quiz(user_id: str, quiz_id: str, result_id: str):
     quiz_ref = db.collection("users").document(user_id).collection("quizzes").document(quiz_id).collection("results")
     quiz_refs = quiz_ref.document(result_id)
-    quiz_doc = quiz_ref.get()
+    quiz_doc = quiz_refs.get()
     
     if not quiz_doc.exists:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     quiz_data = quiz_doc.to_dict()
     flashcards_created = 0
+    flashcards_merged = 0
     
-    for question in quiz_data["questions"]:
-        if not question["is_correct"]:
-            flashcard_ref = db.collection("users").document(user_id).collection("flashcards").document()
-            flashcard_ref.set({
-                "front": question["question"],
-                "back": question["correct_answer"],
-                "created_at": datetime.now(),
-                "last_reviewed": None,
-                "next_review": datetime.now(),
-                "ease_factor": 2.5,
-                "interval": 0,
-                "repetition": 0,
-                "deck_id": quiz_data.get("deck_id", "quiz_fails"),
-                "source": "quiz_fail",
-                "associated_quiz_id": quiz_id
-            })
-            flashcards_created += 1
+    failed = [
+        {"front": question["question"], "back": question["correct_answer"]}
+        for question in quiz_data["questions"] if not question["is_correct"]
+    ]
+    unique, duplicates = await asyncio.to_thread(dedupe_flashcards, user_id, failed)
+    flashcards_ref = db.collection("users").document(user_id).collection("flashcards")
+
+    saved, searchable = [], []
+    for flashcard, signature in unique:
+        flashcard_ref = flashcards_ref.document()
+        flashcard_ref.set({
+            "front": flashcard["front"],
+            "back": flashcard["back"],
+            "created_at": datetime.now(),
+            "last_reviewed": None,
+            "next_review": datetime.now(),
+            "ease_factor": 2.5,
+            "interval": 0,
+            "repetition": 0,
+            "deck_id": quiz_data.get("deck_id", "quiz_fails"),
+            "source": "quiz_fail",
+            "associated_quiz_id": quiz_id
+        })
+        saved.append((flashcard_ref.id, signature))
+        searchable.append((flashcard_ref.id, flashcard))
+        flashcards_created += 1
+    await asyncio.to_thread(index_saved_flashcards, user_id, saved, searchable)
+
+    # A question failed again merges into its existing card, which is due for review right away
+    for flashcard, duplicate_of in duplicates:
+        if duplicate_of.startswith("new:"):
+            continue
+        flashcards_ref.document(duplicate_of).update({"next_review": datetime.now(), "repetition": 0, "interval": 0})
+        flashcards_merged += 1
     
-    return {"message": f"Created {flashcards_created} flashcards from failed quiz questions"}
+    return {
+        "message": f"Created {flashcards_created} flashcards from failed quiz questions",
+        "merged": flashcards_merged,
+    }
 
 @router.post("/users/{user_id}/flashcards/bulk")
 async def create_bulk_flashcards(user_id: str, flashcards: List[FlashcardCreate]):
     batch = db.batch()
     created_count = 0
 
-    for flashcard in flashcards:
+    # Cards come as request models or, from generate_ai_flashcards, as dicts
+    unique, duplicates = await asyncio.to_thread(dedupe_flashcards, user_id, [dict(flashcard) for flashcard in flashcards])
+    saved, searchable = [], []
+    for flashcard, signature in unique:
         doc_ref = db.collection("users").document(user_id).collection("flashcards").document()
         batch.set(doc_ref, {
             "front": flashcard["front"],
@@ -98,23 +143,35 @@ async def create_bulk_flashcards(user_id: str, flashcards: List[FlashcardCreate]
             "deck_id": flashcard["deck_id"],
             "source": "bulk_create"
         })
+        saved.append((doc_ref.id, signature))
+        searchable.append((doc_ref.id, flashcard))
         created_count += 1
 
     batch.commit()
-    return {"message": f"Created {created_count} flashcards"}
+    await asyncio.to_thread(index_saved_flashcards, user_id, saved, searchable)
+    return {"message": f"Created {created_count} flashcards", "skipped_duplicates": len(duplicates)}
 
 @router.post("/users/{user_id}/flashcards/generate")
-async def generate_ai_flashcards(user_id: str, request: AIFlashcardRequest):
+@idempotent
+async def generate_ai_flashcards(user_id: str, request: AIFlashcardRequest, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
     try:
         # Generate flashcards
         print("I am working on it....")
-        flashcards = generate_flashcards(request.message, request.deck_id, request.file_name)
+        flashcards = await asyncio.to_thread(generate_flashcards, request.message, request.deck_id, request.file_name)
         print("ready to generate....")
         # Create the flashcards in bulk
         created_flashcards = await create_bulk_flashcards(user_id, flashcards)
         print("bulk create")
         
         return {"message": "AI-generated flashcards created successfully", "flashcards": created_flashcards}
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
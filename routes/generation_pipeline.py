@@ -0,0 +1,350 @@
+import os
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+
+from routes.circuit_breaker import CircuitOpen, gemini_breaker
+from routes.compact_schema import compact_generation_config, expand_mixed, expand_questions, mixed_generation_config
+from routes.content_minimizer import estimate_tokens, minimize_content
+from routes.context_cache import cached_model, record_cache_hit, use_file
+from routes.difficulty_fanout import DIFFICULTIES
+from routes.model_routing import quiz_output_tokens, routed_model
+from routes.prompt_registry import MIXED, prompt_hash, render_mixed_prompt, render_prompt, render_repair_prompt
+from routes.question_validation import NoValidQuestions, salvage_mixed, salvage_questions, validate_questions
+from routes.rate_limit import RateLimited
+from routes.resilience import DeadlineExceeded, call_model, check_deadline, is_transient
+
+
+class PipelineRun:
+    """Timings and byte/token counts of one quiz generation, stage by stage."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.stages = []
+        self.start_time = time.perf_counter()
+        # Set by file_source when the file is served from its context cache
+        self.cache = None
+        self.cached_file = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times a stage. The stage fills in the yielded record, usually with "bytes"
+        and "tokens"; the record is kept even when the stage raises.
+        """
+        record = {"stage": name}
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start_time, 3)
+            self.stages.append(record)
+
+    def report(self) -> Dict:
+        """The stage records and the total time so far."""
+        return {
+            "source": self.source,
+            "seconds": round(time.perf_counter() - self.start_time, 3),
+            "stages": self.stages,
+        }
+
+    def summary(self) -> str:
+        """One log line per run, e.g. "link 7.41s: fetch 1.20s 48213B ~12053tok | ..."."""
+        parts = []
+        for record in self.stages:
+            part = f"{record['stage']} {record['seconds']:.2f}s"
+            if "bytes" in record:
+                part += f" {record['bytes']}B"
+            if "tokens" in record:
+                part += f" ~{record['tokens']}tok"
+            if "questions" in record:
+                part += f" {record['questions']} questions"
+            parts.append(part)
+        return f"{self.source} {time.perf_counter() - self.start_time:.2f}s: " + " | ".join(parts)
+
+
+def string_to_file(content: str) -> str:
+    """Writes the given string to a temporary file and returns the file path."""
+    temp_file_path = os.path.join("/tmp", f"{uuid.uuid4()}.txt")
+    with open(temp_file_path, "w", encoding="utf-8") as temp_file:
+        temp_file.write(content)
+    return temp_file_path
+
+
+def upload_text(run: PipelineRun, content: str):
+    """Upload stage: uploads text content to Gemini as a plain-text file."""
+    with run.stage("upload") as stage:
+        stage["bytes"] = len(content.encode("utf-8"))
+        stage["tokens"] = estimate_tokens(content)
+        # upload_file takes no timeout, so the deadline is checked before it starts
+        check_deadline("upload")
+        gemini_breaker.check()
+        temp_file_path = string_to_file(content)
+        try:
+            files = genai.upload_file(temp_file_path, display_name="content.txt", mime_type="text/plain")
+        except Exception as e:
+            if is_transient(e):
+                gemini_breaker.record_failure()
+            else:
+                gemini_breaker.record_success()
+            raise RuntimeError(f"Failed to upload file to Gemini: {str(e)}")
+        finally:
+            os.unlink(temp_file_path)
+        gemini_breaker.record_success()
+    print(f"Uploaded file '{files.display_name}' as: {files.uri}")
+    return files
+
+
+# Source adapters turn the source arguments of a generator into the Gemini content
+# parts placed before the prompt, recording their own stages on the run.
+def text_source(run: PipelineRun, content: str) -> List:
+    """Pasted text: minimized to its main text, then uploaded."""
+    with run.stage("minimize") as stage:
+        content = minimize_content(content, label="pasted text")
+        stage["bytes"] = len(content.encode("utf-8"))
+        stage["tokens"] = estimate_tokens(content)
+    return [upload_text(run, content)]
+
+
+def file_source(run: PipelineRun, file_name: str) -> List:
+    """A document or image already uploaded to Gemini files, from its context cache once reused."""
+    with run.stage("lookup") as stage:
+        try:
+            cache, files = use_file(file_name)
+        except Exception as e:
+            raise RuntimeError(f"Failed to upload file to Gemini: {str(e)}")
+        stage["cached"] = cache is not None
+        if cache is None:
+            stage["bytes"] = getattr(files, "size_bytes", 0)
+    if cache is not None:
+        run.cache, run.cached_file = cache, file_name
+        print(f"Generating from the context cache of '{file_name}'")
+        return []
+    print(f"Uploaded file '{files.name}' as: {files.uri}")
+    return [files]
+
+
+def topic_source(run: PipelineRun) -> List:
+    """A topic and subject: everything is in the prompt."""
+    return []
+
+
+# routes.quiz_link registers the "link" adapter, which needs its scraper
+SOURCE_ADAPTERS: Dict[str, Callable[..., List]] = {
+    "text": text_source,
+    "document": file_source,
+    "image": file_source,
+    "topic": topic_source,
+}
+
+
+def parse_questions(text: str, question_type: str, compact: bool, question_types: Optional[List[str]] = None) -> Tuple[List[Dict], int]:
+    """
+    Parses model output into valid questions.
+
+    The items of broken JSON that still parse are salvaged, compact output is
+    expanded, and the whole batch is validated against its question type's model
+    (routes.question_validation).
+
+    Args:
+        text (str): The model output.
+        question_type (str): The type of questions.
+        compact (bool): Whether the output uses the short-key contract.
+        question_types (Optional[List[str]]): For a mixed quiz, its question types.
+
+    Returns:
+        Tuple[List[Dict], int]: The valid questions and the number of unusable items.
+    """
+    if question_types:
+        lists = salvage_mixed(text)
+        received = sum(len(items) for items in lists.values() if isinstance(items, list))
+        questions = expand_mixed(lists, question_types)
+        quiz = []
+        for name in question_types:
+            valid, _ = validate_questions([q for q in questions if q["question_type"] == name], name)
+            quiz += valid
+    else:
+        items = salvage_questions(text)
+        received = len(items)
+        quiz, _ = validate_questions(expand_questions(items, question_type) if compact else items, question_type)
+    return quiz, received - len(quiz)
+
+
+def slot(question: Dict, difficulty: Optional[str], mixed: bool) -> str:
+    """The slot a question fills: its type in a mixed quiz, otherwise its difficulty level."""
+    if mixed:
+        return question["question_type"]
+    return difficulty or question["difficulty"]
+
+
+def missing_slots(quiz: List[Dict], wanted: Dict[str, int], difficulty: Optional[str], mixed: bool) -> Dict[str, int]:
+    """The number of questions still needed per slot."""
+    have = Counter(slot(question, difficulty, mixed) for question in quiz)
+    return {name: count - have[name] for name, count in wanted.items() if count > have[name]}
+
+
+def run_pipeline(
+    source: str,
+    source_args: Dict,
+    number_of_questions: int,
+    question_type: str,
+    user_data: Dict,
+    difficulty: Optional[str] = None,
+    lean: bool = False,
+    compact: bool = True,
+    focus: Optional[str] = None,
+    prompt_values: Optional[Dict] = None,
+    question_counts: Optional[Dict[str, int]] = None,
+) -> Tuple[List[Dict], Dict]:
+    """
+    Generates a quiz from any source, in explicit stages.
+
+    The stages are: prompt (render the template), the source adapter's own stages
+    (fetch, minimize, upload or lookup), generate (the Gemini call), parse (JSON
+    salvage, compact expansion and validation) and, when questions are missing or
+    invalid, repair (one follow-up call for just those). Each stage records its
+    time and byte/token counts; the run is logged as one line and returned as a report.
+
+    Args:
+        source (str): One of SOURCE_ADAPTERS ("text", "link", "document", "image", "topic").
+        source_args (Dict): Keyword arguments for the source adapter.
+        number_of_questions (int): The number of questions per difficulty level,
+            or in total when difficulty is given.
+        question_type (str): The type of questions to generate.
+        user_data (Dict): User-specific data to personalize the quiz.
+        difficulty (Optional[str]): Generate only this difficulty level.
+        lean (bool): Leave out explanations and hints.
+        compact (bool): Use the short-key output contract of routes.compact_schema.
+        focus (Optional[str]): Restrict the questions to this part of the source.
+        prompt_values (Optional[Dict]): Other template placeholders (topic and subject).
+        question_counts (Optional[Dict[str, int]]): For a mixed quiz, the number of
+            questions of each type per difficulty level (or in total when difficulty
+            is given). All types are asked for in one call; question_type should be
+            MIXED and number_of_questions is ignored. Output is always compact.
+
+    Returns:
+        Tuple[List[Dict], Dict]: The generated quiz and the run report.
+
+    Raises:
+        NoValidQuestions: If the model output has no usable question, even after repair.
+        RateLimited: If the rate limiter refuses the Gemini call.
+        DeadlineExceeded: If the request's deadline passes before the quiz is ready.
+        CircuitOpen: If Gemini's circuit breaker is open.
+        RuntimeError: If any other stage fails.
+    """
+    run = PipelineRun(source)
+    try:
+        # Configure Gemini API
+        genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+
+        # Multiply the number of questions by 3 for diverse difficulty levels,
+        # unless only one difficulty level is requested
+        num = number_of_questions if difficulty else number_of_questions * 3
+
+        with run.stage("prompt") as stage:
+            if question_counts:
+                question_type = MIXED
+                question_types = list(question_counts)
+                counts = {
+                    name: count if difficulty else count * 3 for name, count in question_counts.items()
+                }
+                prompt = render_mixed_prompt(
+                    source, counts, difficulty=difficulty, lean=lean, focus=focus, **(prompt_values or {})
+                )
+                generation_config = mixed_generation_config(question_types, lean)
+            else:
+                prompt = render_prompt(
+                    source, question_type, num, difficulty=difficulty, lean=lean, compact=compact, focus=focus,
+                    **(prompt_values or {}),
+                )
+                generation_config = (
+                    compact_generation_config(question_type, lean) if compact
+                    else {"response_mime_type": "application/json"}
+                )
+            stage["bytes"] = len(prompt.encode("utf-8"))
+            stage["tokens"] = estimate_tokens(prompt)
+            stage["version"] = prompt_hash(source, question_type)
+
+        parts = SOURCE_ADAPTERS[source](run, **source_args)
+
+        with run.stage("generate") as stage:
+            system_instruction = (
+                f"Your given name is menttorix and you are an AI Buddy. "
+                f"You are great at generating quizzes. "
+                f"Use the following personal details to personalize the quiz to be unique to the user: "
+                f"{user_data}. Don't use it in making the quiz."
+            )
+            # Retried on transient errors, each attempt waiting its turn under the
+            # Gemini rate limits; the stage records attempts and queued_seconds
+            if run.cache is not None:
+                model = cached_model(run.cache, generation_config)
+                response = call_model("generate", model.generate_content, [system_instruction, prompt], stats=stage)
+                record_cache_hit(run.cached_file, response)
+            else:
+                # Documents and images are of unknown size, so they are never routed by it
+                input_tokens = None
+                if not any(record["stage"] == "lookup" for record in run.stages):
+                    input_tokens = sum(record.get("tokens", 0) for record in run.stages if record["stage"] in ("prompt", "upload"))
+                questions = sum(counts.values()) if question_counts else num
+                with routed_model(f"quiz_{source}", input_tokens, quiz_output_tokens(questions, lean)) as model_name:
+                    stage["model"] = model_name
+                    model = genai.GenerativeModel(
+                        model_name,
+                        system_instruction=system_instruction,
+                        generation_config=generation_config,
+                    )
+                    response = call_model("generate", model.generate_content, [*parts, prompt], stats=stage)
+            stage["bytes"] = len(response.text.encode("utf-8"))
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                stage["input_tokens"] = usage.prompt_token_count
+                stage["tokens"] = usage.candidates_token_count
+                stage["cached_tokens"] = getattr(usage, "cached_content_token_count", 0)
+
+        mixed = bool(question_counts)
+        with run.stage("parse") as stage:
+            quiz, stage["invalid"] = parse_questions(response.text, question_type, compact, question_types if mixed else None)
+            stage["questions"] = len(quiz)
+
+        # Questions per slot: per type in a mixed quiz, otherwise per difficulty level
+        if mixed:
+            wanted = counts
+        else:
+            wanted = {level: number_of_questions for level in ([difficulty] if difficulty else DIFFICULTIES)}
+        missing = missing_slots(quiz, wanted, difficulty, mixed)
+        if missing:
+            # Only the unusable or missing questions are asked for again, in one smaller call
+            try:
+                with run.stage("repair") as stage:
+                    stage["missing"] = sum(missing.values())
+                    repair_prompt = render_repair_prompt(prompt, missing, [question["question"] for question in quiz])
+                    contents = [system_instruction] if run.cache is not None else [*parts]
+                    response = call_model("repair", model.generate_content, [*contents, repair_prompt], stats=stage)
+                    replacements, stage["invalid"] = parse_questions(
+                        response.text, question_type, compact, question_types if mixed else None
+                    )
+                    for question in replacements:
+                        name = slot(question, difficulty, mixed)
+                        if missing.get(name, 0) > 0:
+                            missing[name] -= 1
+                            quiz.append(question)
+                    stage["questions"] = len(quiz)
+            except Exception as e:
+                if not quiz:
+                    raise
+                print(f"Repair failed, keeping {len(quiz)} questions: {str(e)}")
+        if not quiz:
+            raise NoValidQuestions("The model returned no usable questions")
+
+        return quiz, run.report()
+
+    except (RateLimited, DeadlineExceeded, CircuitOpen, NoValidQuestions):
+        raise
+    except Exception as e:
+        raise RuntimeError(f"An error occurred during quiz generation: {str(e)}")
+    finally:
+        print(f"Pipeline {run.summary()}")
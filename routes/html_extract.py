@@ -0,0 +1,387 @@
+import json
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from routes.resilience import bounded_timeout
+
+# Pages scoring below this are handed to Firecrawl instead
+MIN_QUALITY_SCORE = 0.5
+FETCH_TIMEOUT_SECONDS = 10
+MAX_HTML_BYTES = 3_000_000
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "html")
+
+# One pooled session for every local fetch, so repeated pages on the same site reuse connections
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+session.headers["User-Agent"] = "Mozilla/5.0 (compatible; Menttorix/1.0)"
+
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"}
+BOILERPLATE_TAGS = {"nav", "footer", "aside", "form", "button", "select", "dialog"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "header", "blockquote", "pre", "ul", "ol", "li",
+    "table", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "dl", "dt", "dd", "figure", "figcaption",
+}
+TAG_WEIGHTS = {
+    "article": 10, "main": 10, "div": 5, "section": 3, "pre": 3, "td": 3, "blockquote": 3,
+    "ol": -3, "ul": -3, "dl": -3, "li": -3, "form": -3,
+    "h1": -5, "h2": -5, "h3": -5, "h4": -5, "h5": -5, "h6": -5, "th": -5,
+}
+POSITIVE_HINTS = re.compile(r"article|body|content|entry|main|page|post|text|blog|story|lesson|chapter", re.I)
+NEGATIVE_HINTS = re.compile(
+    r"banner|breadcrumb|combx|comment|community|cookie|disqus|extra|foot|header|menu|meta|modal|nav|"
+    r"related|remark|rss|share|shoutbox|sidebar|skyscraper|social|sponsor|subscribe|popup|promo|\bad",
+    re.I,
+)
+
+
+class Node:
+    """A minimal DOM element; children are Nodes or text strings."""
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Node"] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children: List = []
+        self.score = 0.0
+
+    def text(self) -> str:
+        parts = []
+        for child in self.children:
+            parts.append(child.text() if isinstance(child, Node) else child)
+        return " ".join(" ".join(parts).split())
+
+    def raw_text(self) -> str:
+        return "".join(child.raw_text() if isinstance(child, Node) else child for child in self.children)
+
+    def link_text_length(self) -> int:
+        if self.tag == "a":
+            return len(self.text())
+        return sum(child.link_text_length() for child in self.children if isinstance(child, Node))
+
+    def iter(self):
+        yield self
+        for child in self.children:
+            if isinstance(child, Node):
+                yield from child.iter()
+
+    def hints(self) -> str:
+        return f"{self.attrs.get('class', '')} {self.attrs.get('id', '')}"
+
+
+class TreeBuilder(HTMLParser):
+    """Builds a forgiving Node tree, dropping scripts, styles and similar non-content tags."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("document", {})
+        self.stack = [self.root]
+        self.skip_depth = 0
+        self.title = ""
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth:
+            if tag in SKIPPED_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = 1
+            return
+        if tag == "title":
+            self.in_title = True
+        # <p> and <li> close implicitly in real-world HTML
+        if tag in ("p", "li") and self.stack[-1].tag == tag:
+            self.stack.pop()
+        node = Node(tag, {k: v or "" for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            if tag in SKIPPED_TAGS:
+                self.skip_depth -= 1
+            return
+        if tag == "title":
+            self.in_title = False
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.in_title:
+            self.title += data
+        elif data.strip():
+            self.stack[-1].children.append(data)
+
+
+def is_boilerplate(node: Node) -> bool:
+    """Navigation, footers, sidebars and similar page chrome."""
+    if node.tag in BOILERPLATE_TAGS:
+        return True
+    if node.tag == "header" and not any(p.tag in ("article", "main") for p in ancestors(node)):
+        return True
+    hints = node.hints()
+    return bool(
+        hints.strip()
+        and NEGATIVE_HINTS.search(hints)
+        and not POSITIVE_HINTS.search(hints)
+        and node.tag not in ("article", "main", "body")
+    )
+
+
+def ancestors(node: Node):
+    node = node.parent
+    while node is not None:
+        yield node
+        node = node.parent
+
+
+def strip_boilerplate(node: Node) -> None:
+    node.children = [
+        child for child in node.children if not (isinstance(child, Node) and is_boilerplate(child))
+    ]
+    for child in node.children:
+        if isinstance(child, Node):
+            strip_boilerplate(child)
+
+
+def link_density(node: Node) -> float:
+    text_length = len(node.text())
+    return node.link_text_length() / text_length if text_length else 1.0
+
+
+def class_weight(node: Node) -> int:
+    hints = node.hints()
+    weight = 0
+    if POSITIVE_HINTS.search(hints):
+        weight += 25
+    if NEGATIVE_HINTS.search(hints):
+        weight -= 25
+    return weight
+
+
+def find_content_root(root: Node) -> Node:
+    """
+    Picks the element holding the main content, readability style.
+
+    Every paragraph-like block scores its parent fully and its grandparent by half,
+    based on its length and comma count. Candidates get tag and class/id bonuses and
+    are discounted by link density; siblings scoring close to the winner are kept
+    with it by returning their common parent.
+    """
+    candidates = set()
+    for node in root.iter():
+        if node.tag not in ("p", "pre", "td", "blockquote", "li"):
+            continue
+        text = node.text()
+        if len(text) < 25:
+            continue
+        block_score = 1 + text.count(",") + min(len(text) / 100, 3)
+        for level, ancestor in enumerate(list(ancestors(node))[:2]):
+            if ancestor.tag == "document":
+                break
+            if ancestor not in candidates:
+                ancestor.score = TAG_WEIGHTS.get(ancestor.tag, 0) + class_weight(ancestor)
+                candidates.add(ancestor)
+            ancestor.score += block_score / (1 + level)
+
+    if not candidates:
+        body = next((node for node in root.iter() if node.tag == "body"), root)
+        return body
+
+    for candidate in candidates:
+        candidate.score *= 1 - link_density(candidate)
+    top = max(candidates, key=lambda node: node.score)
+
+    parent = top.parent
+    if parent is not None and parent.tag != "document":
+        threshold = max(10, top.score * 0.2)
+        strong_siblings = [
+            child for child in parent.children
+            if isinstance(child, Node) and child is not top and child in candidates and child.score >= threshold
+        ]
+        if strong_siblings:
+            return parent
+    return top
+
+
+def to_markdown(node: Node) -> str:
+    """Renders a Node tree as compact markdown."""
+    blocks: List[str] = []
+    inline: List[str] = []
+
+    def flush():
+        text = " ".join("".join(inline).split())
+        if text:
+            blocks.append(text)
+        inline.clear()
+
+    def walk(current, list_marker: Optional[str] = None):
+        if not isinstance(current, Node):
+            inline.append(current)
+            return
+        tag = current.tag
+        if tag == "br":
+            flush()
+            return
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            flush()
+            text = current.text()
+            if text:
+                blocks.append(f"{'#' * int(tag[1])} {text}")
+            return
+        if tag == "pre":
+            flush()
+            code = current.raw_text().strip("\n")
+            if code.strip():
+                blocks.append(f"```\n{code}\n```")
+            return
+        if tag in ("ul", "ol"):
+            flush()
+            items = [c.text() for c in current.children if isinstance(c, Node) and c.tag == "li"]
+            lines = [
+                f"{f'{position}.' if tag == 'ol' else '-'} {text}"
+                for position, text in enumerate((text for text in items if text), start=1)
+            ]
+            if lines:
+                blocks.append("\n".join(lines))
+            return
+        if tag == "table":
+            flush()
+            rows = []
+            for row in (n for n in current.iter() if n.tag == "tr"):
+                cells = [c.text() for c in row.children if isinstance(c, Node) and c.tag in ("td", "th")]
+                if any(cells):
+                    rows.append(" | ".join(cells))
+            if rows:
+                blocks.append("\n".join(rows))
+            return
+        if tag == "img":
+            return
+        if tag in BLOCK_TAGS:
+            flush()
+        if tag in ("strong", "b"):
+            inline.append(" **")
+        if tag in ("em", "i"):
+            inline.append(" _")
+        for child in current.children:
+            walk(child)
+        if tag in ("strong", "b"):
+            inline.append("** ")
+        if tag in ("em", "i"):
+            inline.append("_ ")
+        if tag in BLOCK_TAGS:
+            flush()
+
+    walk(node)
+    flush()
+    return "\n\n".join(blocks)
+
+
+def quality_score(markdown: str, density: float) -> float:
+    """
+    Rates how well a page was extracted, from 0 to 1.
+
+    Long, paragraph-rich text with few links scores high; script-rendered shells,
+    link farms and near-empty pages score low.
+    """
+    paragraphs = [block for block in markdown.split("\n\n") if len(block) >= 80]
+    length_score = min(len(markdown) / 1500, 1.0)
+    paragraph_score = min(len(paragraphs) / 4, 1.0)
+    return round(0.5 * length_score + 0.2 * paragraph_score + 0.3 * (1 - min(density, 1.0)), 3)
+
+
+def extract_page(html: str, url: str = "") -> Dict:
+    """
+    Extracts the main content of an HTML page as markdown.
+
+    Args:
+        html (str): The page source.
+        url (str): The page URL, used to resolve links.
+
+    Returns:
+        Dict: A Firecrawl-shaped result with "markdown", "metadata", "linksOnPage"
+            and the extraction "quality" score.
+    """
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    root = builder.root
+
+    links = []
+    for node in root.iter():
+        href = node.attrs.get("href") if node.tag == "a" else None
+        if href and not href.startswith(("#", "javascript:", "mailto:")):
+            links.append(urljoin(url, href))
+
+    strip_boilerplate(root)
+    content = find_content_root(root)
+    markdown = to_markdown(content)
+    title = " ".join(builder.title.split())
+    if title and not markdown.startswith("# "):
+        markdown = f"# {title}\n\n{markdown}" if markdown else ""
+
+    return {
+        "markdown": markdown,
+        "metadata": {"title": title, "sourceURL": url},
+        "linksOnPage": links,
+        "quality": quality_score(markdown, link_density(content)),
+    }
+
+
+def fetch_and_extract(url: str) -> Dict:
+    """
+    Fetches a page with the pooled session and extracts it locally.
+
+    Raises:
+        ValueError: If the response is not an HTML page.
+    """
+    start_time = time.time()
+    response = session.get(url, timeout=bounded_timeout(FETCH_TIMEOUT_SECONDS))
+    response.raise_for_status()
+    content_type = response.headers.get("Content-Type", "")
+    if "html" not in content_type:
+        raise ValueError(f"Unsupported content type for local extraction: {content_type}")
+    if response.encoding is None or response.encoding.lower() == "iso-8859-1":
+        response.encoding = response.apparent_encoding
+    result = extract_page(response.text[:MAX_HTML_BYTES], response.url)
+    elapsed_time = time.time() - start_time
+    print(f"Extracted {url} locally in {elapsed_time:.2f} seconds (quality {result['quality']})")
+    return result
+
+
+if __name__ == "__main__":
+    # Offline check against the saved pages: python -m routes.html_extract [fixtures dir]
+    fixtures_dir = sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR
+    with open(os.path.join(fixtures_dir, "expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+
+    failures = 0
+    for file_name, expectations in expected.items():
+        with open(os.path.join(fixtures_dir, file_name), encoding="utf-8") as f:
+            result = extract_page(f.read(), f"https://example.com/{file_name}")
+        local = result["quality"] >= MIN_QUALITY_SCORE
+        problems = []
+        if local != expectations["local"]:
+            problems.append(f"expected local={expectations['local']}")
+        problems += [f"missing {text!r}" for text in expectations.get("contains", []) if text not in result["markdown"]]
+        problems += [f"kept {text!r}" for text in expectations.get("excludes", []) if text in result["markdown"]]
+        failures += bool(problems)
+        status = "FAIL" if problems else "ok"
+        print(f"{status:4} {file_name:24} quality={result['quality']:.3f} {'; '.join(problems)}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Awaitable, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+# How long a response is replayed for its Idempotency-Key, and how many are kept
+IDEMPOTENCY_TTL_SECONDS = 60 * 60
+MAX_ENTRIES = 2000
+
+
+class _Entry:
+    """One idempotency key: the request it was first used with, and its running or finished work."""
+
+    def __init__(self, fingerprint: str, task: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires_at = time.monotonic() + IDEMPOTENCY_TTL_SECONDS
+
+
+# Entries of this worker's event loop by (user, key), oldest first
+_entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+_stats = {"executed": 0, "replayed": 0, "attached": 0, "conflicts": 0}
+
+
+def _expire(now: float) -> None:
+    for key in [key for key, entry in _entries.items() if entry.expires_at <= now]:
+        del _entries[key]
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+def request_fingerprint(endpoint: str, arguments: Dict) -> str:
+    """Hash of an endpoint and its path and body arguments, to tell a retry from a different request."""
+    values = {}
+    for name, value in arguments.items():
+        if isinstance(value, BaseModel):
+            values[name] = value.dict()
+        elif isinstance(value, (str, int, float, bool)) or value is None:
+            values[name] = value
+    payload = json.dumps([endpoint, values], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def run_once(user_id: str, key: str, fingerprint: str, run: Callable[[], Awaitable[Dict]]) -> Dict:
+    """
+    Runs a request once per idempotency key.
+
+    A retry with the same key gets the first request's response if it is finished,
+    or waits for it if it is still running, instead of doing the work again. Only
+    successes are kept: when the first request fails, every request waiting on it
+    gets the same error, and the next retry runs again.
+
+    Raises:
+        HTTPException: 422 if the key was first used with a different request.
+    """
+    now = time.monotonic()
+    _expire(now)
+    entry = _entries.get((user_id, key))
+    if entry is not None:
+        if entry.fingerprint != fingerprint:
+            _stats["conflicts"] += 1
+            raise HTTPException(status_code=422, detail="This Idempotency-Key was already used for a different request")
+        _stats["replayed" if entry.task.done() else "attached"] += 1
+        return await asyncio.shield(entry.task)
+
+    _stats["executed"] += 1
+    task = asyncio.ensure_future(run())
+    entry = _entries[(user_id, key)] = _Entry(fingerprint, task)
+
+    def forget_failure(task: asyncio.Future) -> None:
+        failed = task.cancelled() or task.exception() is not None
+        if failed and _entries.get((user_id, key)) is entry:
+            del _entries[(user_id, key)]
+
+    task.add_done_callback(forget_failure)
+    # Shielded, so a client that disconnects does not cancel the work its retry will attach to
+    return await asyncio.shield(task)
+
+
+def idempotent(endpoint: Callable) -> Callable:
+    """
+    Makes an endpoint honour the Idempotency-Key header. The endpoint takes user_id
+    and idempotency_key (a Header) arguments; requests without a key run as usual.
+    """
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        key = kwargs.get("idempotency_key")
+        if not key:
+            return await endpoint(*args, **kwargs)
+        fingerprint = request_fingerprint(endpoint.__name__, kwargs)
+        return await run_once(kwargs["user_id"], key, fingerprint, lambda: endpoint(*args, **kwargs))
+    return wrapper
+
+
+def idempotency_stats() -> Dict:
+    """Requests run, retries answered from a finished or attached to a running request, key conflicts, and keys kept."""
+    return {**_stats, "keys": len(_entries)}
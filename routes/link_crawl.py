@@ -0,0 +1,214 @@
+import asyncio
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from routes.content_minimizer import (
+    CHARS_PER_TOKEN,
+    block_key,
+    clean_text,
+    estimate_tokens,
+    main_text,
+)
+from routes.quiz_link import (
+    MAX_CONCURRENT_SCRAPES,
+    SCRAPE_TIMEOUT_SECONDS,
+    dedupe_blocks,
+    scrape_page,
+)
+from routes.resilience import bounded_timeout, run_within
+
+# Crawl limits
+MAX_CRAWL_DEPTH = 3
+MAX_CRAWL_PAGES = 30
+CRAWL_TOKEN_BUDGET = 30_000
+
+# Politeness: requests in flight against the site, and the gap between request starts
+CRAWL_HOST_CONCURRENCY = 2
+CRAWL_HOST_DELAY_SECONDS = 0.5
+
+LINK_PATTERN = re.compile(r"\]\((https?://[^)\s]+|/[^)\s]*)")
+WORD_PATTERN = re.compile(r"[a-zA-Z]{4,}")
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".zip", ".mp3", ".mp4", ".css", ".js",
+)
+
+
+def normalize_url(url: str) -> str:
+    """Drops the fragment and trailing slash so the same page is only fetched once."""
+    url, _ = urldefrag(url.strip())
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/") or "/"
+    query = f"?{parsed.query}" if parsed.query else ""
+    return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}{path}{query}"
+
+
+def page_links(result: Dict, base_url: str) -> List[str]:
+    """Returns the absolute links found on a scraped page."""
+    links = result.get("linksOnPage") or LINK_PATTERN.findall(main_text(result))
+    return [urljoin(base_url, link) for link in links]
+
+
+def in_scope(url: str, host: str, path_prefix: str) -> bool:
+    """Keeps the crawl on the course site, below the root page's directory."""
+    parsed = urlparse(url)
+    return (
+        parsed.scheme in ("http", "https")
+        and parsed.netloc.lower() == host
+        and parsed.path.startswith(path_prefix)
+        and not parsed.path.lower().endswith(SKIPPED_EXTENSIONS)
+    )
+
+
+def rank_pages(pages: List[Tuple[str, int, str]]) -> List[Tuple[str, str]]:
+    """
+    Orders crawled pages by how closely they follow the root page.
+
+    Each page is scored by the share of the root page's most frequent terms it
+    contains, discounted by its link depth, so the chapter itself comes before
+    loosely related pages further away.
+
+    Args:
+        pages (List[Tuple[str, int, str]]): (url, depth, text) triples; the root page first.
+
+    Returns:
+        List[Tuple[str, str]]: (url, text) pairs, best first.
+    """
+    root_terms = {
+        term for term, _ in Counter(w.lower() for w in WORD_PATTERN.findall(pages[0][2])).most_common(40)
+    }
+
+    def score(page: Tuple[str, int, str]) -> float:
+        _, depth, text = page
+        if depth == 0:
+            return float("inf")
+        terms = {w.lower() for w in WORD_PATTERN.findall(text)}
+        overlap = len(terms & root_terms) / max(len(root_terms), 1)
+        return overlap / (1 + 0.5 * depth)
+
+    return [(url, text) for url, _, text in sorted(pages, key=score, reverse=True)]
+
+
+def build_corpus(pages: List[Tuple[str, str]], max_tokens: int) -> Tuple[str, int]:
+    """
+    Concatenates ranked pages, without repeated blocks, until the token budget is spent.
+
+    Returns:
+        Tuple[str, int]: The corpus and the number of pages it includes.
+    """
+    remaining = max_tokens * CHARS_PER_TOKEN
+    sections = []
+    for url, text in dedupe_blocks(pages):
+        if remaining <= 0:
+            break
+        text = text[:remaining]
+        remaining -= len(text)
+        sections.append(f"Source: {url}\n\n{text}")
+    return "\n\n---\n\n".join(sections), len(sections)
+
+
+async def crawl_site(root_url: str, depth: int, page_budget: int) -> Tuple[str, Dict]:
+    """
+    Crawls a course site from a root page and builds a generation corpus.
+
+    Pages are fetched level by level, each level in parallel, with a cap on requests
+    in flight and a minimum gap between request starts. URLs are deduplicated before
+    fetching and pages with identical text after.
+
+    Args:
+        root_url (str): The page to start from.
+        depth (int): How many links away from the root page to follow.
+        page_budget (int): The maximum number of pages to fetch.
+
+    Returns:
+        Tuple[str, Dict]: The ranked, token-budgeted corpus and the crawl stats.
+    """
+    depth = max(0, min(depth, MAX_CRAWL_DEPTH))
+    page_budget = max(1, min(page_budget, MAX_CRAWL_PAGES))
+
+    root = normalize_url(root_url)
+    parsed_root = urlparse(root)
+    host = parsed_root.netloc
+    # From the root as given, as normalizing drops the trailing slash of a directory
+    root_path = urlparse(urldefrag(root_url.strip())[0]).path or "/"
+    path_prefix = root_path if root_path.endswith("/") else root_path.rsplit("/", 1)[0] + "/"
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.BoundedSemaphore(min(MAX_CONCURRENT_SCRAPES, CRAWL_HOST_CONCURRENCY))
+    pacing_lock = asyncio.Lock()
+    last_request = [0.0]
+
+    async def fetch(url: str) -> Optional[Dict]:
+        async with semaphore:
+            async with pacing_lock:
+                wait = last_request[0] + CRAWL_HOST_DELAY_SECONDS - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                last_request[0] = loop.time()
+            try:
+                timeout = bounded_timeout(SCRAPE_TIMEOUT_SECONDS)
+                return await asyncio.wait_for(
+                    asyncio.to_thread(run_within, timeout, scrape_page, url), timeout=timeout
+                )
+            except Exception as e:
+                print(f"Crawling {url} failed: {str(e) or type(e).__name__}")
+                return None
+
+    stats = {
+        "root_url": root,
+        "depth": depth,
+        "page_budget": page_budget,
+        "pages_fetched": 0,
+        "pages_failed": 0,
+        "duplicate_pages": 0,
+        "pages_used": 0,
+        "max_depth_reached": 0,
+        "corpus_tokens": 0,
+        "elapsed_seconds": 0.0,
+    }
+    start_time = time.time()
+
+    seen_urls = {root}
+    seen_content = set()
+    pages = []
+    frontier = [root]
+    for level in range(depth + 1):
+        if not frontier:
+            break
+        results = await asyncio.gather(*(fetch(url) for url in frontier))
+        next_frontier = []
+        for url, result in zip(frontier, results):
+            if result is None:
+                stats["pages_failed"] += 1
+                continue
+            stats["pages_fetched"] += 1
+            text = clean_text(main_text(result))
+            key = block_key(text)
+            if not text or key in seen_content:
+                stats["duplicate_pages"] += 1
+                continue
+            seen_content.add(key)
+            pages.append((url, level, text))
+            stats["max_depth_reached"] = level
+
+            if level == depth:
+                continue
+            for link in page_links(result, url):
+                link = normalize_url(link)
+                if len(seen_urls) >= page_budget:
+                    break
+                if link not in seen_urls and in_scope(link, host, path_prefix):
+                    seen_urls.add(link)
+                    next_frontier.append(link)
+        frontier = next_frontier
+
+    if not pages or pages[0][1] != 0:
+        raise RuntimeError(f"Failed to crawl {root}")
+
+    corpus, stats["pages_used"] = build_corpus(rank_pages(pages), CRAWL_TOKEN_BUDGET)
+    stats["corpus_tokens"] = estimate_tokens(corpus)
+    stats["elapsed_seconds"] = round(time.time() - start_time, 2)
+    print(f"Crawled {stats['pages_fetched']} pages from {root} in {stats['elapsed_seconds']:.2f} seconds")
+    return corpus, stats
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from routes.circuit_breaker import breaker_stats
+from routes.context_cache import cache_stats
+from routes.idempotency import idempotency_stats
+from routes.model_routing import routing_stats
+from routes.rate_limit import rate_limit_stats
+from routes.resilience import call_stats
+from routes.singleflight import singleflight_stats
+
+router = APIRouter()
+
+
+# In-process counters of the generation optimizations, per worker
+@router.get("/metrics")
+async def get_metrics():
+    return {
+        "context_cache": cache_stats(),
+        "singleflight": singleflight_stats(),
+        "rate_limit": rate_limit_stats(),
+        "model_calls": call_stats(),
+        "circuit_breakers": breaker_stats(),
+        "model_routing": routing_stats(),
+        "idempotency": idempotency_stats(),
+    }
@@ -0,0 +1,154 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Rough model output per generated question, with and without explanations and hints
+QUESTION_OUTPUT_TOKENS = 150
+LEAN_QUESTION_OUTPUT_TOKENS = 70
+FLASHCARDS_OUTPUT_TOKENS = 2000
+# Per question, for an explanation and a hint
+DETAILS_OUTPUT_TOKENS = 100
+
+DEFAULT_MODEL = "models/gemini-1.5-flash"
+# Rules are tried in order and the first that matches picks the model. A rule
+# matches a task in its "tasks" (any task without them) whose estimated input and
+# output tokens are within its limits, as long as its model's recent p95 latency
+# is under max_p95_seconds. An estimate that is not known never fits a limit.
+# Override with a JSON list of rules in MODEL_ROUTES.
+DEFAULT_ROUTES = [
+    {
+        "model": "models/gemini-1.5-flash-8b",
+        "tasks": ["quiz_topic", "quiz_text", "quiz_link", "flashcards", "details"],
+        "max_input_tokens": 8000,
+        "max_output_tokens": 4000,
+        "max_p95_seconds": 20,
+    },
+    {"model": DEFAULT_MODEL},
+]
+ROUTES: List[Dict] = json.loads(os.environ["MODEL_ROUTES"]) if os.environ.get("MODEL_ROUTES") else DEFAULT_ROUTES
+
+LATENCY_WINDOW = 100
+MIN_LATENCY_SAMPLES = 10
+# Older latencies are forgotten, so a model passed over for being slow is tried again
+LATENCY_MAX_AGE_SECONDS = 10 * 60
+# A call that fails transiently or times out counts as at least this slow, so a
+# failing model is passed over like a slow one
+FAILURE_PENALTY_SECONDS = 60.0
+
+_latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_decisions: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_lock = threading.Lock()
+# The routing decision the current with block's model calls report to
+_route: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("model_route", default=None)
+
+
+def quiz_output_tokens(number_of_questions: int, lean: bool = False) -> int:
+    """Estimated output tokens of a quiz of number_of_questions questions."""
+    return number_of_questions * (LEAN_QUESTION_OUTPUT_TOKENS if lean else QUESTION_OUTPUT_TOKENS)
+
+
+def _recent(model: str) -> List[float]:
+    oldest = time.monotonic() - LATENCY_MAX_AGE_SECONDS
+    return sorted(seconds for at, seconds in _latencies[model] if at >= oldest)
+
+
+def _p95(model: str) -> Optional[float]:
+    with _lock:
+        samples = _recent(model)
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95)]
+
+
+def _fits(limit: Optional[float], value: Optional[float]) -> bool:
+    return limit is None or (value is not None and value <= limit)
+
+
+def choose_model(task: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> str:
+    """
+    Picks a model for a call from the routing table.
+
+    Args:
+        task (str): The kind of call, e.g. "quiz_topic", "flashcards" or "details".
+        input_tokens (Optional[int]): Estimated input tokens, None when unknown.
+        output_tokens (Optional[int]): Estimated output tokens, None when unknown.
+
+    Returns:
+        str: The model name; DEFAULT_MODEL when no rule matches.
+    """
+    for rule in ROUTES:
+        if "tasks" in rule and task not in rule["tasks"]:
+            continue
+        if not _fits(rule.get("max_input_tokens"), input_tokens) or not _fits(rule.get("max_output_tokens"), output_tokens):
+            continue
+        latency = _p95(rule["model"])
+        if latency is not None and not _fits(rule.get("max_p95_seconds"), latency):
+            continue
+        return rule["model"]
+    return DEFAULT_MODEL
+
+
+def record_call(seconds: float, failed: bool = False) -> None:
+    """
+    Records one model call made inside a routed_model block against the routed
+    model; a failed call counts as at least FAILURE_PENALTY_SECONDS. Calls outside
+    a block are not recorded.
+    """
+    route = _route.get()
+    if route is None:
+        return
+    route["seconds"] += seconds
+    route["calls"] += 1
+    route["failures"] += failed
+    with _lock:
+        _latencies[route["model"]].append((time.monotonic(), max(seconds, FAILURE_PENALTY_SECONDS) if failed else seconds))
+
+
+@contextmanager
+def routed_model(task: str, input_tokens: Optional[int], output_tokens: Optional[int]):
+    """
+    Chooses the model for a call made in the with block, and logs the decision.
+
+    The model calls made in the block (see routes.resilience.call_model) record
+    their own latencies, without rate-limit queueing or retry backoff, and later
+    decisions take them into account.
+
+    Yields:
+        str: The model name.
+    """
+    model = choose_model(task, input_tokens, output_tokens)
+    route = {"model": model, "seconds": 0.0, "calls": 0, "failures": 0}
+    token = _route.set(route)
+    outcome = "failed"
+    try:
+        yield model
+        outcome = "ok"
+    finally:
+        _route.reset(token)
+        with _lock:
+            _decisions[task][model] += 1
+        print(
+            f"Routed {task} (~{input_tokens} in, ~{output_tokens} out tokens) to {model}: {outcome}, "
+            f"{route['calls']} call(s) ({route['failures']} failed) in {route['seconds']:.2f}s"
+        )
+
+
+def routing_stats() -> Dict:
+    """Decisions per task and model, and each model's recent p50/p95 latency."""
+    with _lock:
+        latencies = {}
+        for model in _latencies:
+            samples = _recent(model)
+            latencies[model] = {
+                "p50_seconds": round(samples[len(samples) // 2], 3) if samples else None,
+                "p95_seconds": round(samples[int(len(samples) * 0.95)], 3) if samples else None,
+            }
+        return {
+            "decisions": {task: dict(models) for task, models in _decisions.items()},
+            "latency": latencies,
+        }
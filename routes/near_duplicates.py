@@ -0,0 +1,433 @@
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from firebase_admin import firestore
+
+# MinHash signatures of NUM_PERM hashes, split into BANDS bands for LSH. With
+# 16 bands of 4 rows, items of similarity 0.8 share a band 99.9% of the time;
+# candidates are then confirmed against DUPLICATE_SIMILARITY.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DUPLICATE_SIMILARITY = 0.8
+# Texts of fewer words are only duplicates when they are the same once normalized
+SHORT_TEXT_WORDS = 8
+# Indexes of this many (user, kind) pairs are kept in memory, least recently used first out
+MAX_CACHED_INDEXES = 400
+# Changes are persisted as append-only deltas, compacted into a snapshot once a
+# user has more than MAX_DELTAS; a delta holds at most DELTA_ITEMS items to stay
+# under Firestore's 1 MiB. Bump DELTA_VERSION when signatures change.
+MAX_DELTAS = 32
+DELTA_ITEMS = 2000
+DELTA_VERSION = 2
+# Cached indexes pick up deltas written by other workers after this long
+REFRESH_SECONDS = 60
+
+_PRIME = np.uint64(4_294_967_311)  # the first prime above 2**32
+_rng = np.random.RandomState(20240815)
+_A = _rng.randint(1, 2**31, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2**32, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase words separated by single spaces, punctuation dropped."""
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+def shingles(text: str) -> set:
+    """
+    A text's words and word pairs, each tagged with all the numbers in the text.
+
+    A short text is a single shingle, as one changed word ("Capital of France" and
+    "Capital of Spain") makes it another item. The number tag makes templated items
+    that differ only in their numbers, e.g. "What is 12 + 15?" and "What is 12 + 16?",
+    share no shingle at all.
+    """
+    words = normalize_text(text).split()
+    numbers = " ".join(sorted({word for word in words if any(character.isdigit() for character in word)}))
+    if len(words) < SHORT_TEXT_WORDS:
+        pieces = {" ".join(words)}
+    else:
+        pieces = {*words, *(f"{first} {second}" for first, second in zip(words, words[1:]))}
+    return {f"{numbers}|{piece}" for piece in pieces}
+
+
+def signature(text: str) -> np.ndarray:
+    """The MinHash signature of a text's shingles, as NUM_PERM uint32 values."""
+    text_shingles = shingles(text)
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in text_shingles), np.uint64, len(text_shingles))
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def flashcard_text(flashcard: Dict) -> str:
+    return f"{flashcard.get('front', '')} {flashcard.get('back', '')}"
+
+
+def question_text(question: Dict) -> str:
+    """A question's stem, options and answer: the same stem with other options is another question."""
+    # Sorted, as shuffled options do not make another question
+    options = sorted(map(str, question.get("options") or [])) if isinstance(question.get("options"), list) else []
+    return " ".join([str(question.get("question", "")), *options, str(question.get("answer", ""))])
+
+
+class DuplicateIndex:
+    """
+    A MinHash LSH index of one user's flashcards or questions.
+
+    Items are kept by id with their signature; each band of a signature maps to
+    the ids sharing it.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(BANDS)]
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def add(self, item_id: str, item_signature: np.ndarray) -> None:
+        if item_id in self.signatures:
+            return
+        self.ids.append(item_id)
+        self.signatures[item_id] = item_signature
+        for band, buckets in enumerate(self.buckets):
+            buckets.setdefault(item_signature[band * ROWS:(band + 1) * ROWS].tobytes(), []).append(item_id)
+
+    def remove(self, item_id: str) -> None:
+        item_signature = self.signatures.pop(item_id, None)
+        if item_signature is None:
+            return
+        self.ids.remove(item_id)
+        for band, buckets in enumerate(self.buckets):
+            bucket = buckets.get(item_signature[band * ROWS:(band + 1) * ROWS].tobytes(), [])
+            if item_id in bucket:
+                bucket.remove(item_id)
+
+    def find(self, item_signature: np.ndarray, prefix: str = "") -> Optional[Tuple[str, float]]:
+        """
+        The most similar indexed item, if any is at least DUPLICATE_SIMILARITY similar.
+
+        Args:
+            item_signature (np.ndarray): The signature to look up.
+            prefix (str): Only consider ids starting with this, e.g. "quiz_id/".
+
+        Returns:
+            Optional[Tuple[str, float]]: The id and estimated Jaccard similarity.
+        """
+        candidates = set()
+        for band, buckets in enumerate(self.buckets):
+            candidates.update(buckets.get(item_signature[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+        best = None
+        for candidate in candidates:
+            if not candidate.startswith(prefix):
+                continue
+            similarity = float(np.count_nonzero(self.signatures[candidate] == item_signature)) / NUM_PERM
+            if similarity >= DUPLICATE_SIMILARITY and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def to_bytes(self) -> bytes:
+        ids = "\n".join(self.ids).encode("utf-8")
+        signatures = np.stack([self.signatures[item_id] for item_id in self.ids]) if self.ids else np.zeros((0, NUM_PERM), np.uint32)
+        return zlib.compress(len(ids).to_bytes(4, "big") + ids + signatures.astype("<u4").tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DuplicateIndex":
+        data = zlib.decompress(data)
+        size = int.from_bytes(data[:4], "big")
+        ids = data[4:4 + size].decode("utf-8").split("\n") if size else []
+        signatures = np.frombuffer(data[4 + size:], dtype="<u4").reshape(-1, NUM_PERM).astype(np.uint32)
+        index = cls()
+        for item_id, item_signature in zip(ids, signatures):
+            index.add(item_id, item_signature)
+        return index
+
+
+# Per (user, kind): the index, its own lock, the last delta sequence applied, the
+# delta count and the load time. The global lock only guards this cache; loading,
+# refreshing and writing a user's index happens under that user's lock.
+_indexes: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _deltas_ref(user_id: str, kind: str):
+    return firestore.client().collection("users").document(user_id).collection(f"near_duplicates_{kind}")
+
+
+def _sequence() -> str:
+    """A delta sequence, ordered by write time and unique across workers."""
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+def write_delta(user_id: str, kind: str, added: DuplicateIndex, removed: List[str] = ()) -> str:
+    """Appends the items added to and the ids removed from a user's index; returns its sequence."""
+    sequence = _sequence()
+    _deltas_ref(user_id, kind).document(sequence).set({
+        "seq": sequence,
+        "version": DELTA_VERSION,
+        "data": added.to_bytes(),
+        "removed": list(removed),
+    })
+    return sequence
+
+
+def mark_stale(user_id: str, kind: str) -> None:
+    """
+    Records that a change could not be added to a user's index, so the next load
+    or refresh of it, in any worker, rebuilds it from Firestore.
+    """
+    sequence = _sequence()
+    _deltas_ref(user_id, kind).document(sequence).set({"seq": sequence, "stale": True})
+
+
+def _apply(entry: Dict, delta: Dict) -> None:
+    # Deltas of another signature version are skipped; the next rebuild replaces them
+    if delta.get("version") == DELTA_VERSION:
+        for item_id in delta["removed"]:
+            entry["index"].remove(item_id)
+        added = DuplicateIndex.from_bytes(delta["data"])
+        for item_id in added.ids:
+            entry["index"].add(item_id, added.signatures[item_id])
+    entry["seq"], entry["deltas"] = delta["seq"], entry["deltas"] + 1
+
+
+def _refresh(user_id: str, kind: str, entry: Dict) -> None:
+    """Applies the deltas other workers wrote since the index was loaded, rebuilding it if one is marked stale."""
+    deltas = [doc.to_dict() for doc in _deltas_ref(user_id, kind).where("seq", ">", entry["seq"]).order_by("seq").stream()]
+    if any(delta.get("stale") for delta in deltas):
+        _rebuild(user_id, kind, entry, deltas[-1]["seq"])
+    else:
+        for delta in deltas:
+            _apply(entry, delta)
+    entry["loaded"] = time.time()
+
+
+def compact(user_id: str, kind: str, entry: Dict) -> None:
+    """Rewrites a user's deltas as a snapshot of the whole index, in deltas of up to DELTA_ITEMS items."""
+    _refresh(user_id, kind, entry)
+    old = list(_deltas_ref(user_id, kind).stream())
+    index = entry["index"]
+    entry["deltas"] = 0
+    for start in range(0, max(len(index.ids), 1), DELTA_ITEMS):
+        chunk = DuplicateIndex()
+        for item_id in index.ids[start:start + DELTA_ITEMS]:
+            chunk.add(item_id, index.signatures[item_id])
+        entry["seq"] = write_delta(user_id, kind, chunk)
+        entry["deltas"] += 1
+    # Deltas written by other workers meanwhile are kept; they come before the snapshot
+    for start in range(0, len(old), 500):
+        batch = firestore.client().batch()
+        for doc in old[start:start + 500]:
+            batch.delete(doc.reference)
+        batch.commit()
+
+
+def build_duplicate_index(user_id: str, kind: str) -> DuplicateIndex:
+    """
+    Builds a user's index of "flashcards" or "questions" from Firestore.
+
+    Flashcards are indexed by document id, questions as "quiz_id/question_id".
+    """
+    db = firestore.client()
+    user_ref = db.collection("users").document(user_id)
+    index = DuplicateIndex()
+    if kind == "flashcards":
+        for doc in user_ref.collection("flashcards").stream():
+            index.add(doc.id, signature(flashcard_text(doc.to_dict())))
+    else:
+        for quiz in user_ref.collection("quizzes").stream():
+            for doc in quiz.reference.collection("questions").stream():
+                index.add(f"{quiz.id}/{doc.id}", signature(question_text(doc.to_dict())))
+    return index
+
+
+def _rebuild(user_id: str, kind: str, entry: Dict, seen: str) -> None:
+    """Replaces an index with one built from Firestore, and its deltas up to seen with a snapshot."""
+    # The build already reflects the deltas up to seen, so they are not applied again
+    entry.update(index=build_duplicate_index(user_id, kind), seq=seen, deltas=0)
+    compact(user_id, kind, entry)
+    print(f"Built the near-duplicate index of {user_id}'s {kind}: {len(entry['index'])} items")
+
+
+def _load(user_id: str, kind: str, entry: Dict) -> None:
+    """Loads a user's index from their deltas, building it first if they have none of this version or it is marked stale."""
+    deltas = [doc.to_dict() for doc in _deltas_ref(user_id, kind).order_by("seq").stream()]
+    entry.update(index=DuplicateIndex(), seq="", deltas=0)
+    try:
+        if deltas and all(delta.get("version") == DELTA_VERSION for delta in deltas):
+            for delta in deltas:
+                _apply(entry, delta)
+            if entry["deltas"] > MAX_DELTAS:
+                compact(user_id, kind, entry)
+        else:
+            _rebuild(user_id, kind, entry, deltas[-1]["seq"] if deltas else "")
+    except Exception:
+        entry["index"] = None
+        raise
+    entry["loaded"] = time.time()
+
+
+def _entry(user_id: str, kind: str) -> Dict:
+    key = (user_id, kind)
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is None:
+            entry = _indexes[key] = {"lock": threading.RLock(), "index": None, "seq": "", "deltas": 0, "loaded": 0.0}
+            if len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+        return entry
+
+
+@contextmanager
+def duplicate_index(user_id: str, kind: str):
+    """
+    A user's index, loaded or refreshed from Firestore as needed, held under the
+    user's lock for the with block.
+
+    Yields:
+        Dict: The cache entry; its "index" is the DuplicateIndex.
+    """
+    entry = _entry(user_id, kind)
+    with entry["lock"]:
+        if entry["index"] is None:
+            _load(user_id, kind, entry)
+        elif time.time() - entry["loaded"] > REFRESH_SECONDS:
+            _refresh(user_id, kind, entry)
+        yield entry
+
+
+def _add_items(user_id: str, kind: str, items: List[Tuple[str, np.ndarray]]) -> None:
+    with duplicate_index(user_id, kind) as entry:
+        # Catch up first, so this worker's sequence does not skip another's deltas
+        _refresh(user_id, kind, entry)
+        added = DuplicateIndex()
+        for item_id, item_signature in items:
+            entry["index"].add(item_id, item_signature)
+            added.add(item_id, item_signature)
+        entry["seq"] = write_delta(user_id, kind, added)
+        entry["deltas"] += 1
+        if entry["deltas"] > MAX_DELTAS:
+            compact(user_id, kind, entry)
+
+
+def dedupe_flashcards(user_id: str, flashcards: List[Dict]) -> Tuple[List[Tuple[Dict, np.ndarray]], List[Tuple[Dict, str]]]:
+    """
+    Splits new flashcards into unique ones and near-duplicates.
+
+    Cards are compared with the user's existing flashcards and with each other.
+
+    Returns:
+        Tuple[List[Tuple[Dict, np.ndarray]], List[Tuple[Dict, str]]]: The unique cards
+            with their signatures, to be passed to index_flashcards once saved, and
+            the duplicate cards with the id of the card they duplicate (a
+            "new:<position>" id for a duplicate of an earlier card in the same list).
+    """
+    unique, duplicates = [], []
+    with duplicate_index(user_id, "flashcards") as entry:
+        index = entry["index"]
+        batch = DuplicateIndex()
+        for position, flashcard in enumerate(flashcards):
+            card_signature = signature(flashcard_text(flashcard))
+            match = index.find(card_signature) or batch.find(card_signature)
+            if match:
+                duplicates.append((flashcard, match[0]))
+                continue
+            batch.add(f"new:{position}", card_signature)
+            unique.append((flashcard, card_signature))
+    return unique, duplicates
+
+
+def index_flashcards(user_id: str, saved: List[Tuple[str, np.ndarray]]) -> None:
+    """Adds saved (flashcard_id, signature) pairs to the user's index and persists them as a delta."""
+    if saved:
+        _add_items(user_id, "flashcards", saved)
+
+
+def dedupe_questions(user_id: str, quiz_id: str, quiz: List[Dict]) -> Tuple[List[Tuple[Dict, np.ndarray, Optional[str]]], int]:
+    """
+    Drops questions nearly repeating one already in the same quiz.
+
+    Questions repeating one of another quiz are kept, as each quiz needs its own
+    questions, but come back with the "quiz_id/question_id" they duplicate.
+
+    Returns:
+        Tuple[List[Tuple[Dict, np.ndarray, Optional[str]]], int]: The questions to
+            save with their signatures and what they duplicate, and the number dropped.
+    """
+    kept, dropped = [], 0
+    with duplicate_index(user_id, "questions") as entry:
+        index = entry["index"]
+        batch = DuplicateIndex()
+        for position, question in enumerate(quiz):
+            question_signature = signature(question_text(question))
+            if index.find(question_signature, prefix=f"{quiz_id}/") or batch.find(question_signature):
+                dropped += 1
+                continue
+            batch.add(f"new:{position}", question_signature)
+            match = index.find(question_signature)
+            kept.append((question, question_signature, match[0] if match else None))
+    return kept, dropped
+
+
+def index_saved_questions(user_id: str, quiz_id: str, saved: List[Tuple[str, np.ndarray]]) -> None:
+    """Adds saved (question_id, signature) pairs of a quiz to the user's index and persists them as a delta."""
+    if saved:
+        _add_items(user_id, "questions", [(f"{quiz_id}/{question_id}", question_signature) for question_id, question_signature in saved])
+
+
+def forget_quiz_questions(user_id: str, quiz_id: str) -> None:
+    """Drops a deleted quiz's questions from the user's index."""
+    with duplicate_index(user_id, "questions") as entry:
+        _refresh(user_id, "questions", entry)
+        index = entry["index"]
+        removed = [item_id for item_id in index.ids if item_id.startswith(f"{quiz_id}/")]
+        if not removed:
+            return
+        for item_id in removed:
+            index.remove(item_id)
+        entry["seq"] = write_delta(user_id, "questions", DuplicateIndex(), removed)
+        entry["deltas"] += 1
+
+
+def rebuild_duplicate_index(user_id: str, kind: str) -> DuplicateIndex:
+    """Rebuilds a user's index from Firestore and replaces their deltas with it."""
+    entry = _entry(user_id, kind)
+    with entry["lock"]:
+        latest = _deltas_ref(user_id, kind).order_by("seq", direction=firestore.Query.DESCENDING).limit(1).stream()
+        try:
+            _rebuild(user_id, kind, entry, next((doc.to_dict()["seq"] for doc in latest), ""))
+        except Exception:
+            entry["index"] = None
+            raise
+        entry["loaded"] = time.time()
+        return entry["index"]
+
+
+def rebuild_all() -> int:
+    """Batch job: rebuilds and persists both near-duplicate indexes of every user."""
+    db = firestore.client()
+    users = 0
+    for user in db.collection("users").list_documents():
+        for kind in ("flashcards", "questions"):
+            try:
+                rebuild_duplicate_index(user.id, kind)
+            except Exception as e:
+                print(f"Rebuilding the near-duplicate index of {user.id}'s {kind} failed: {str(e)}")
+        users += 1
+    return users
+
+
+if __name__ == "__main__":
+    # python -m routes.near_duplicates
+    from routes.firebase_utils import initialize_firebase  # noqa: F401, initializes Firebase on import
+    print(f"Rebuilt the near-duplicate indexes of {rebuild_all()} users")
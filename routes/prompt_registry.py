@@ -0,0 +1,207 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from routes.compact_schema import compact_instructions, mixed_instructions
+from routes.prompts import document, image, link, mixed, text, topic
+
+# Bump when a template's meaning changes without its text changing (e.g. new
+# placeholder values); text changes already change PROMPT_HASHES.
+PROMPT_VERSION = 2
+
+# Templates are loaded once, at import; only the selected one is rendered per call
+TEMPLATES = {
+    "document": document.TEMPLATES,
+    "image": image.TEMPLATES,
+    "link": link.TEMPLATES,
+    "text": text.TEMPLATES,
+    "topic": topic.TEMPLATES,
+}
+QUESTION_TYPES = tuple(topic.TEMPLATES)
+# The prompt of a quiz mixing several question types, see render_mixed_prompt
+MIXED = "Mixed"
+
+# Directives appended to a template, in this order, when their option is set
+DIFFICULTY_DIRECTIVE = """
+            DIFFICULTY
+            Ignore the difficulty distribution above: all {num} questions must be {difficulty}, with "difficulty" set to "{difficulty}".
+            """
+LEAN_DIRECTIVE = """
+            LEAN_OUTPUT
+            Leave the "explanation" and "hint" fields out of every question; they are written later on request.
+            """
+FOCUS_DIRECTIVE = """
+            FOCUS
+            Only use this part of the document and ignore the rest: {focus}
+            """
+# Appended to a prompt whose answer had unusable questions, to ask for replacements only
+REPAIR_DIRECTIVE = """
+            REPLACEMENTS
+            Some questions of an earlier answer to this prompt were unusable. Ignore the number of questions
+            and the difficulty distribution above, and only write these replacements: {counts}.
+            Do not repeat any of these questions:
+{existing}
+            """
+# Existing questions listed in a repair prompt
+MAX_REPAIR_EXISTING = 50
+
+
+def template_hash(source: str, question_type: str) -> str:
+    """Hashes everything that can end up in a prompt for one source and question type."""
+    parts = [
+        str(PROMPT_VERSION), source, question_type, DIFFICULTY_DIRECTIVE, LEAN_DIRECTIVE, FOCUS_DIRECTIVE, REPAIR_DIRECTIVE
+    ]
+    if question_type == MIXED:
+        parts += [mixed.TEMPLATE, mixed.SOURCES[source], *mixed.TYPE_RULES.values()]
+        parts += [mixed_instructions(QUESTION_TYPES, False), mixed_instructions(QUESTION_TYPES, True)]
+    else:
+        parts += [
+            TEMPLATES[source][question_type],
+            compact_instructions(question_type, False),
+            compact_instructions(question_type, True),
+        ]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+PROMPT_HASHES = {
+    (source, question_type): template_hash(source, question_type)
+    for source, templates in TEMPLATES.items()
+    for question_type in (*templates, MIXED)
+}
+
+
+def prompt_hash(source: str, question_type: str) -> str:
+    """
+    The version hash of the prompt for a source and question type.
+
+    It changes whenever the template, a directive or PROMPT_VERSION changes, so it
+    can be part of a cache key for anything generated from the prompt.
+
+    Raises:
+        ValueError: If the source or question type has no template.
+    """
+    try:
+        return PROMPT_HASHES[(source, question_type)]
+    except KeyError:
+        raise ValueError(f"Invalid question type: {question_type}")
+
+
+def render_prompt(
+    source: str,
+    question_type: str,
+    num: int,
+    difficulty: Optional[str] = None,
+    lean: bool = False,
+    compact: bool = True,
+    focus: Optional[str] = None,
+    **values: Dict,
+) -> str:
+    """
+    Renders the quiz prompt for one source and question type.
+
+    Args:
+        source (str): One of TEMPLATES ("document", "image", "link", "text", "topic").
+        question_type (str): One of QUESTION_TYPES.
+        num (int): The number of questions the prompt asks for.
+        difficulty (Optional[str]): Ask for this difficulty level only.
+        lean (bool): Ask for questions without explanations and hints.
+        compact (bool): Ask for the short-key output of routes.compact_schema.
+        focus (Optional[str]): Restrict the questions to this part of the source.
+        **values: The template's other placeholders (topic and subject for "topic").
+
+    Returns:
+        str: The prompt.
+
+    Raises:
+        ValueError: If the source or question type has no template.
+    """
+    template = TEMPLATES.get(source, {}).get(question_type)
+    if template is None:
+        raise ValueError(f"Invalid question type: {question_type}")
+
+    prompt = template.format(num=num, **values)
+    if difficulty:
+        prompt += DIFFICULTY_DIRECTIVE.format(num=num, difficulty=difficulty)
+    if lean:
+        prompt += LEAN_DIRECTIVE
+    if compact:
+        prompt += compact_instructions(question_type, lean)
+    if focus:
+        prompt += FOCUS_DIRECTIVE.format(focus=focus)
+    return prompt
+
+
+def render_mixed_prompt(
+    source: str,
+    question_counts: Dict[str, int],
+    difficulty: Optional[str] = None,
+    lean: bool = False,
+    focus: Optional[str] = None,
+    **values: Dict,
+) -> str:
+    """
+    Renders one prompt asking for several question types at once.
+
+    The output is always compact, one list per type (see
+    routes.compact_schema.mixed_generation_config).
+
+    Args:
+        source (str): One of TEMPLATES.
+        question_counts (Dict[str, int]): The total number of questions of each type.
+        difficulty (Optional[str]): Ask for this difficulty level only.
+        lean (bool): Ask for questions without explanations and hints.
+        focus (Optional[str]): Restrict the questions to this part of the source.
+        **values: Placeholders of the source description (topic and subject for "topic").
+
+    Returns:
+        str: The prompt.
+
+    Raises:
+        ValueError: If the source or a question type is unknown.
+    """
+    if source not in mixed.SOURCES:
+        raise ValueError(f"Invalid source: {source}")
+    for question_type in question_counts:
+        if question_type not in mixed.TYPE_RULES:
+            raise ValueError(f"Invalid question type: {question_type}")
+
+    source_description = mixed.SOURCES[source].format(**values)
+    prompt = mixed.TEMPLATE.format(
+        source=source_description,
+        levels=f"{difficulty} only" if difficulty else "Easy, Medium, and Hard difficulty levels",
+        counts="\n".join(
+            f"                - {count} {question_type} questions" for question_type, count in question_counts.items()
+        ),
+        rules="\n".join(
+            f"                - {question_type}: {mixed.TYPE_RULES[question_type]}" for question_type in question_counts
+        ),
+        total=sum(question_counts.values()),
+    )
+    if difficulty:
+        prompt += f"""
+            DIFFICULTY
+            All questions must be {difficulty}, with "difficulty" set to "{difficulty}".
+            """
+    if lean:
+        prompt += LEAN_DIRECTIVE
+    prompt += mixed_instructions(list(question_counts), lean)
+    if focus:
+        prompt += FOCUS_DIRECTIVE.format(focus=focus)
+    return prompt
+
+
+def render_repair_prompt(prompt: str, missing: Dict[str, int], existing: List[str]) -> str:
+    """
+    Renders the follow-up prompt asking only for replacements of unusable questions.
+
+    Args:
+        prompt (str): The prompt of the generation being repaired.
+        missing (Dict[str, int]): The number of questions still needed, by difficulty
+            level or, for a mixed quiz, by question type.
+        existing (List[str]): The usable questions, which must not be repeated.
+
+    Returns:
+        str: The prompt.
+    """
+    counts = ", ".join(f"{count} {name} questions" for name, count in missing.items())
+    existing_lines = "\n".join(f"            - {question}" for question in existing[:MAX_REPAIR_EXISTING])
+    return prompt + REPAIR_DIRECTIVE.format(counts=counts, existing=existing_lines or "            (none)")
@@ -0,0 +1,50 @@
+# Quiz prompt mixing several question types in one call, for any source.
+# Rendered with str.format by routes.prompt_registry; literal braces are doubled.
+
+TEMPLATE = """
+                OBJECTIVE_AND_PERSONA
+                You are an expert quiz creator specializing in quizzes that mix several question types. Your task is to create a personalized quiz based on {source}, tailored to the user's background without directly referencing their personal details.
+
+                INSTRUCTIONS
+                To complete the task, you need to follow these steps:
+                1. Carefully analyze {source}.
+                2. Generate exactly these questions, each question type evenly distributed across {levels}:
+{counts}
+                3. Follow the rules of each question type listed in QUESTION_TYPES.
+                4. Use the user's personal details to inform the relevance of questions, without including these details in the questions themselves.
+                5. Format the quiz in JSON structure as specified in the OUTPUT_FORMAT section.
+
+                QUESTION_TYPES
+{rules}
+
+                CONSTRAINTS
+                1. Dos
+                - Strictly adhere to {source}
+                - Cover different aspects across all question types instead of asking the same thing in different forms
+                - Maintain an equal distribution of difficulty levels within each question type
+                2. Don'ts
+                - Don't use personal info/house details in questions
+                - Don't create questions unrelated to {source}
+                - Don't make the correct answer obvious or stand out
+
+                RECAP
+                Remember to create {total} questions in total, with exactly the number of each question type listed above, based solely on {source}. Use the user's background to inform relevance, but never include personal details in the questions.
+"""
+
+# How each source is referred to in TEMPLATE
+SOURCES = {
+    "document": "the provided document",
+    "image": "the provided image",
+    "link": "the provided web page content",
+    "text": "the provided text",
+    "topic": "the topic {topic} within the subject {subject}",
+}
+
+# The rules of each question type, condensed from its single-type template
+TYPE_RULES = {
+    "Multiple Choice": "4 options with only one correct answer; make the distractors plausible and related to the material.",
+    "True/False": "clear, unambiguous statements with a balanced mix of true and false; avoid 'always' or 'never' unless explicitly true.",
+    "Fill in the space": "one blank per question, shown with underscores; answers of 1-5 words that test key terms or concepts.",
+    "Short Answer": "specific, concise answers of at most 15 words; no questions that can be answered with 'yes' or 'no'.",
+    "Open End": "questions that encourage analytical thinking, interpretation or application, with no single correct answer, a suggested response length and 3-5 key points.",
+}
@@ -0,0 +1,111 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import google.generativeai as genai
+from firebase_admin import firestore
+
+from routes.content_minimizer import estimate_tokens
+from routes.model_routing import DETAILS_OUTPUT_TOKENS, routed_model
+from routes.rate_limit import with_caller
+from routes.resilience import call_model
+
+# Questions per details call, and details calls in flight for one request
+DETAILS_BATCH_SIZE = 10
+DETAILS_CONCURRENCY = 3
+DETAIL_FIELDS = ("explanation", "hint")
+
+
+def generate_details(questions: List[Dict]) -> Dict[str, Dict]:
+    """
+    Generates explanations and hints for a batch of questions in one Gemini call.
+
+    Args:
+        questions (List[Dict]): Questions with "id", "question", "answer" and, when
+            they have them, "options" or "keyPoints".
+
+    Returns:
+        Dict[str, Dict]: {"explanation": ..., "hint": ...} keyed by question id.
+    """
+    genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+    items = [
+        {key: question[key] for key in ("id", "question", "answer", "options", "keyPoints") if key in question}
+        for question in questions
+    ]
+    prompt = f"""
+        For each quiz question below, write:
+        - "explanation": why the answer is correct (2-3 sentences, not restricted to the source document)
+        - "hint": a short hint that does not reveal the answer
+        Return a JSON list with one item per question, shaped like:
+        {{"id": "question id", "explanation": "...", "hint": "..."}}
+
+        QUESTIONS
+        {json.dumps(items, ensure_ascii=False)}
+        """
+    with routed_model("details", estimate_tokens(prompt), DETAILS_OUTPUT_TOKENS * len(questions)) as model_name:
+        model = genai.GenerativeModel(
+            model_name,
+            system_instruction="Your given name is menttorix and you are an AI Buddy. "
+                               "You explain quiz answers clearly and give hints that help without giving the answer away.",
+            generation_config={"response_mime_type": "application/json"},
+        )
+        response = call_model("details", model.generate_content, prompt)
+    return {
+        str(item["id"]): {field: item.get(field, "") for field in DETAIL_FIELDS}
+        for item in json.loads(response.text)
+        if isinstance(item, dict) and "id" in item
+    }
+
+
+def get_question_details(user_id: str, quiz_id: str, question_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Returns explanations and hints, generating and caching the missing ones.
+
+    Details already stored on a question document are served as they are. The
+    missing ones are generated in batches of DETAILS_BATCH_SIZE, with up to
+    DETAILS_CONCURRENCY batches in parallel, and written back so each question
+    pays for its details at most once.
+
+    Args:
+        user_id (str): The quiz owner.
+        quiz_id (str): The quiz folder id.
+        question_ids (List[str]): The questions to explain.
+
+    Returns:
+        Dict[str, Dict]: {"explanation": ..., "hint": ...} keyed by question id;
+            unknown ids are left out.
+    """
+    db = firestore.client()
+    questions_ref = (
+        db.collection("users").document(user_id).collection("quizzes").document(quiz_id).collection("questions")
+    )
+    refs = [questions_ref.document(question_id) for question_id in dict.fromkeys(question_ids)]
+
+    details = {}
+    missing = []
+    for doc in db.get_all(refs):
+        if not doc.exists:
+            continue
+        question = doc.to_dict()
+        if question.get("explanation"):
+            details[doc.id] = {field: question.get(field, "") for field in DETAIL_FIELDS}
+        else:
+            missing.append(question | {"id": doc.id})
+
+    if missing:
+        batches = [missing[i:i + DETAILS_BATCH_SIZE] for i in range(0, len(missing), DETAILS_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=DETAILS_CONCURRENCY) as executor:
+            generated = {}
+            for batch_details in executor.map(with_caller(generate_details), batches):
+                generated.update(batch_details)
+
+        batch = db.batch()
+        for question in missing:
+            if question["id"] in generated:
+                batch.update(questions_ref.document(question["id"]), generated[question["id"]])
+                details[question["id"]] = generated[question["id"]]
+        batch.commit()
+        print(f"Generated details for {len(missing)} questions in {len(batches)} batches")
+
+    return details
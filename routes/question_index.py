@@ -0,0 +1,401 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+# Indexes of this many users are kept in memory, least recently used first out
+MAX_CACHED_INDEXES = 200
+SNAPSHOT_VERSION = 1
+# Changes are persisted as append-only deltas, compacted into a snapshot once a
+# user has more than MAX_DELTAS; a delta holds at most DELTA_QUESTIONS questions
+# to stay under Firestore's 1 MiB
+MAX_DELTAS = 32
+DELTA_QUESTIONS = 2000
+# Cached indexes pick up deltas written by other workers after this long
+REFRESH_SECONDS = 60
+
+STOPWORDS = frozenset(
+    "the and for are but not you all any can had her was one our out has his how its may new now old see "
+    "two way who did get let put say she too use what when where which while with that this from they them "
+    "then than there their these those been being have into more most other some such only also very will "
+    "would could should about after before between each does doing during under over again further once "
+    "here why both few own same just true false following".split()
+)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a text, without stopwords and tokens under 3 characters."""
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if len(token) > 2 and token not in STOPWORDS]
+
+
+def question_terms(question: Dict) -> List[str]:
+    """
+    The index terms of a question: "topic:" and "kw:" tokens, "difficulty:" and "type:".
+
+    Keywords come from the question, its answer, options and key points.
+    """
+    terms = {f"topic:{token}" for token in tokenize(str(question.get("topic", "")))}
+    text = [str(question.get("question", "")), str(question.get("answer", ""))]
+    text += [str(item) for item in question.get("options") or []]
+    text += [str(item) for item in question.get("keyPoints") or []]
+    terms |= {f"kw:{token}" for token in tokenize(" ".join(text))}
+    if question.get("difficulty"):
+        terms.add(f"difficulty:{question['difficulty']}")
+    if question.get("question_type"):
+        terms.add(f"type:{question['question_type']}")
+    return sorted(terms)
+
+
+class QuestionIndex:
+    """
+    Inverted index from question terms to a user's questions.
+
+    Questions are referenced as "quiz_id/question_id" strings, stored once and
+    numbered; posting lists are arrays of those numbers. Removed questions are
+    left in the postings and skipped until the next snapshot compacts them away.
+    """
+
+    def __init__(self):
+        self.refs: List[str] = []
+        self.ref_ids: Dict[str, int] = {}
+        self.postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        self.removed = set()
+
+    def __len__(self) -> int:
+        return len(self.refs) - len(self.removed)
+
+    def add(self, quiz_id: str, question_id: str, question: Dict) -> None:
+        ref = f"{quiz_id}/{question_id}"
+        if ref in self.ref_ids:
+            return
+        ref_id = len(self.refs)
+        self.refs.append(ref)
+        self.ref_ids[ref] = ref_id
+        for term in question_terms(question):
+            self.postings[term].append(ref_id)
+
+    def remove_quiz(self, quiz_id: str) -> int:
+        prefix = f"{quiz_id}/"
+        removed = {ref_id for ref, ref_id in self.ref_ids.items() if ref.startswith(prefix)}
+        self.removed |= removed
+        return len(removed)
+
+    def search(
+        self,
+        text: str,
+        question_type: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        exclude_quiz_ids: Iterable[str] = (),
+    ) -> List[Tuple[str, float]]:
+        """
+        Finds questions matching a topic or keywords, best first.
+
+        Each query token scores by how rare it is among the user's questions
+        (inverse document frequency), twice as much when it matches the topic.
+
+        Returns:
+            List[Tuple[str, float]]: ("quiz_id/question_id", score) pairs.
+        """
+        allowed = None
+        for term in (f"type:{question_type}" if question_type else None, f"difficulty:{difficulty}" if difficulty else None):
+            if term:
+                ids = set(self.postings.get(term, ()))
+                allowed = ids if allowed is None else allowed & ids
+
+        scores = defaultdict(float)
+        total = max(len(self.refs), 1)
+        for token in set(tokenize(text)):
+            for prefix, weight in (("topic:", 2.0), ("kw:", 1.0)):
+                ref_ids = self.postings.get(prefix + token)
+                if not ref_ids:
+                    continue
+                idf = math.log(1 + total / len(ref_ids))
+                for ref_id in ref_ids:
+                    scores[ref_id] += weight * idf
+
+        excluded = {f"{quiz_id}/" for quiz_id in exclude_quiz_ids}
+        results = [
+            (self.refs[ref_id], score) for ref_id, score in scores.items()
+            if ref_id not in self.removed
+            and (allowed is None or ref_id in allowed)
+            and not any(self.refs[ref_id].startswith(prefix) for prefix in excluded)
+        ]
+        results.sort(key=lambda result: result[1], reverse=True)
+        return results
+
+    def live_refs(self) -> List[int]:
+        return [ref_id for ref_id in range(len(self.refs)) if ref_id not in self.removed]
+
+    def to_bytes(self, ref_ids: Optional[List[int]] = None) -> bytes:
+        """A compressed snapshot of the given questions, all but removed ones by default."""
+        keep = self.live_refs() if ref_ids is None else ref_ids
+        renumber = {ref_id: new_id for new_id, ref_id in enumerate(keep)}
+        postings = {}
+        for term, term_ref_ids in self.postings.items():
+            kept = [renumber[ref_id] for ref_id in term_ref_ids if ref_id in renumber]
+            if kept:
+                postings[term] = kept
+        snapshot = {"version": SNAPSHOT_VERSION, "refs": [self.refs[ref_id] for ref_id in keep], "postings": postings}
+        return zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Optional["QuestionIndex"]:
+        snapshot = json.loads(zlib.decompress(data))
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+        index = cls()
+        index.refs = snapshot["refs"]
+        index.ref_ids = {ref: ref_id for ref_id, ref in enumerate(index.refs)}
+        for term, ref_ids in snapshot["postings"].items():
+            index.postings[term] = array("I", ref_ids)
+        return index
+
+    def merge(self, other: "QuestionIndex") -> None:
+        """Adds the questions of another index, e.g. a delta, that this one does not have."""
+        renumber = {}
+        for other_id, ref in enumerate(other.refs):
+            if ref not in self.ref_ids and other_id not in other.removed:
+                renumber[other_id] = self.ref_ids[ref] = len(self.refs)
+                self.refs.append(ref)
+        for term, ref_ids in other.postings.items():
+            self.postings[term].extend(renumber[ref_id] for ref_id in ref_ids if ref_id in renumber)
+
+
+# Per user: the index, its own lock, the last delta sequence applied, the delta
+# count and the load time. The global lock only guards this cache; loading,
+# refreshing and writing a user's index happens under that user's lock.
+_indexes: "OrderedDict[str, Dict]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _deltas_ref(user_id: str):
+    return firestore.client().collection("users").document(user_id).collection("question_index")
+
+
+def _sequence() -> str:
+    """A delta sequence, ordered by write time and unique across workers."""
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+def write_delta(user_id: str, data: bytes, removed_quizzes: List[str] = ()) -> str:
+    """Appends added questions (a snapshot) and removed quiz ids to a user's index; returns its sequence."""
+    sequence = _sequence()
+    _deltas_ref(user_id).document(sequence).set({
+        "seq": sequence,
+        "version": SNAPSHOT_VERSION,
+        "data": data,
+        "removed_quizzes": list(removed_quizzes),
+    })
+    return sequence
+
+
+def mark_stale(user_id: str) -> None:
+    """
+    Records that a change could not be added to a user's index, so the next load
+    or refresh of it, in any worker, rebuilds it from Firestore.
+    """
+    sequence = _sequence()
+    _deltas_ref(user_id).document(sequence).set({"seq": sequence, "stale": True})
+
+
+def _apply(entry: Dict, delta: Dict) -> None:
+    for quiz_id in delta["removed_quizzes"]:
+        entry["index"].remove_quiz(quiz_id)
+    added = QuestionIndex.from_bytes(delta["data"])
+    # Deltas of another snapshot version are skipped; the next rebuild replaces them
+    if added is not None:
+        entry["index"].merge(added)
+    entry["seq"], entry["deltas"] = delta["seq"], entry["deltas"] + 1
+
+
+def _refresh(user_id: str, entry: Dict) -> None:
+    """Applies the deltas other workers wrote since the index was loaded, rebuilding it if one is marked stale."""
+    deltas = [doc.to_dict() for doc in _deltas_ref(user_id).where("seq", ">", entry["seq"]).order_by("seq").stream()]
+    if any(delta.get("stale") for delta in deltas):
+        _rebuild(user_id, entry, deltas[-1]["seq"])
+    else:
+        for delta in deltas:
+            _apply(entry, delta)
+    entry["loaded"] = time.time()
+
+
+def compact(user_id: str, entry: Dict) -> None:
+    """Rewrites a user's deltas as a snapshot without removed questions, in deltas of up to DELTA_QUESTIONS."""
+    _refresh(user_id, entry)
+    old = list(_deltas_ref(user_id).stream())
+    live = entry["index"].live_refs()
+    chunks = [entry["index"].to_bytes(live[start:start + DELTA_QUESTIONS]) for start in range(0, max(len(live), 1), DELTA_QUESTIONS)]
+    index = QuestionIndex()
+    for data in chunks:
+        entry["seq"] = write_delta(user_id, data)
+        index.merge(QuestionIndex.from_bytes(data))
+    entry.update(index=index, deltas=len(chunks))
+    # Deltas written by other workers meanwhile are kept; they come before the snapshot
+    for start in range(0, len(old), 500):
+        batch = firestore.client().batch()
+        for doc in old[start:start + 500]:
+            batch.delete(doc.reference)
+        batch.commit()
+
+
+def build_index(user_id: str) -> QuestionIndex:
+    """
+    Builds a user's index from all their saved questions.
+
+    Questions saved before types were recorded on them are left out, as a quiz
+    assembled from them could not say what type they are.
+    """
+    db = firestore.client()
+    index = QuestionIndex()
+    for quiz in db.collection("users").document(user_id).collection("quizzes").stream():
+        for question in quiz.reference.collection("questions").stream():
+            question_data = question.to_dict()
+            if question_data.get("question_type"):
+                index.add(quiz.id, question.id, question_data)
+    return index
+
+
+def _rebuild(user_id: str, entry: Dict, seen: str) -> None:
+    """Replaces an index with one built from Firestore, and its deltas up to seen with a snapshot."""
+    # The build already reflects the deltas up to seen, so they are not applied again
+    entry.update(index=build_index(user_id), seq=seen, deltas=0)
+    compact(user_id, entry)
+    print(f"Built the question index of {user_id}: {len(entry['index'])} questions")
+
+
+def _load(user_id: str, entry: Dict) -> None:
+    """Loads a user's index from their deltas, building it first if they have none of this version or it is marked stale."""
+    deltas = [doc.to_dict() for doc in _deltas_ref(user_id).order_by("seq").stream()]
+    entry.update(index=QuestionIndex(), seq="", deltas=0)
+    try:
+        if deltas and all(delta.get("version") == SNAPSHOT_VERSION for delta in deltas):
+            for delta in deltas:
+                _apply(entry, delta)
+            if entry["deltas"] > MAX_DELTAS:
+                compact(user_id, entry)
+        else:
+            _rebuild(user_id, entry, deltas[-1]["seq"] if deltas else "")
+    except Exception:
+        entry["index"] = None
+        raise
+    entry["loaded"] = time.time()
+
+
+def _entry(user_id: str) -> Dict:
+    with _indexes_lock:
+        entry = _indexes.get(user_id)
+        if entry is None:
+            entry = _indexes[user_id] = {"lock": threading.RLock(), "index": None, "seq": "", "deltas": 0, "loaded": 0.0}
+            if len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(user_id)
+        return entry
+
+
+@contextmanager
+def question_index(user_id: str):
+    """
+    A user's index, loaded or refreshed from Firestore as needed, held under the
+    user's lock for the with block.
+
+    Yields:
+        Dict: The cache entry; its "index" is the QuestionIndex.
+    """
+    entry = _entry(user_id)
+    with entry["lock"]:
+        if entry["index"] is None:
+            _load(user_id, entry)
+        elif time.time() - entry["loaded"] > REFRESH_SECONDS:
+            _refresh(user_id, entry)
+        yield entry
+
+
+def rebuild_index(user_id: str) -> QuestionIndex:
+    """Rebuilds a user's index from Firestore and replaces their deltas with it."""
+    entry = _entry(user_id)
+    with entry["lock"]:
+        latest = _deltas_ref(user_id).order_by("seq", direction=firestore.Query.DESCENDING).limit(1).stream()
+        try:
+            _rebuild(user_id, entry, next((doc.to_dict()["seq"] for doc in latest), ""))
+        except Exception:
+            entry["index"] = None
+            raise
+        entry["loaded"] = time.time()
+        return entry["index"]
+
+
+def index_questions(user_id: str, quiz_id: str, questions: List[Tuple[str, Dict]]) -> None:
+    """Adds newly saved (question_id, question) pairs to the user's index and persists them as a delta."""
+    if not questions:
+        return
+    added = QuestionIndex()
+    for question_id, question in questions:
+        added.add(quiz_id, question_id, question)
+    with question_index(user_id) as entry:
+        # Catch up first, so this worker's sequence does not skip another's deltas
+        _refresh(user_id, entry)
+        entry["index"].merge(added)
+        entry["seq"] = write_delta(user_id, added.to_bytes())
+        entry["deltas"] += 1
+        if entry["deltas"] > MAX_DELTAS:
+            compact(user_id, entry)
+
+
+def forget_quiz(user_id: str, quiz_id: str) -> None:
+    """Drops a deleted quiz's questions from the user's index."""
+    with question_index(user_id) as entry:
+        _refresh(user_id, entry)
+        if entry["index"].remove_quiz(quiz_id):
+            entry["seq"] = write_delta(user_id, QuestionIndex().to_bytes(), [quiz_id])
+            entry["deltas"] += 1
+
+
+def assemble_quiz(
+    user_id: str,
+    text: str,
+    number_of_questions: int,
+    question_type: Optional[str] = None,
+    exclude_quiz_ids: Iterable[str] = (),
+) -> List[Dict]:
+    """
+    Assembles a quiz from a user's existing questions, without a model call.
+
+    Args:
+        user_id (str): The user whose questions are searched.
+        text (str): A topic or keywords.
+        number_of_questions (int): The number of questions per difficulty level.
+        question_type (Optional[str]): Only use questions of this type.
+        exclude_quiz_ids (Iterable[str]): Quizzes not to take questions from.
+
+    Returns:
+        List[Dict]: The best matching questions, up to number_of_questions per
+            difficulty level, Easy first; fewer when the user has too few matches.
+    """
+    with question_index(user_id) as entry:
+        index = entry["index"]
+        picked = []
+        for difficulty in ("Easy", "Medium", "Hard"):
+            matches = index.search(text, question_type, difficulty, exclude_quiz_ids)
+            # Take from the best matches, shuffled, so the same query does not always give the same quiz
+            best = [ref for ref, _ in matches[:number_of_questions * 3]]
+            picked += random.sample(best, min(number_of_questions, len(best)))
+
+    db = firestore.client()
+    quizzes_ref = db.collection("users").document(user_id).collection("quizzes")
+    refs = [
+        quizzes_ref.document(ref.split("/")[0]).collection("questions").document(ref.split("/")[1])
+        for ref in picked
+    ]
+    return [doc.to_dict() for doc in db.get_all(refs) if doc.exists]
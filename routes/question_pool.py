@@ -0,0 +1,168 @@
+import threading
+from typing import Dict, List
+
+from firebase_admin import firestore
+
+from routes.content_minimizer import MAX_CONTENT_TOKENS, block_key, truncate_to_tokens
+from routes.firebase_utils import get_user_data, save_quiz_to_firebase
+from routes.quiz_document import generate_quiz_document
+from routes.quiz_image import generate_quiz_image
+from routes.quiz_link import generate_quiz_link
+from routes.quiz_topic import generate_quiz_topic
+from routes.quiz_txt import generate_quiz
+
+# Lazy pools start with this many questions per difficulty level...
+INITIAL_PER_DIFFICULTY = 2
+# ...and top a level up by this many once it has LOW_WATERMARK unserved questions left
+TOP_UP_SIZE = 3
+LOW_WATERMARK = 1
+
+# One generator call per source, fed from the spec stored on the quiz document
+GENERATORS = {
+    "text": lambda args, n, question_type, user_data, **options: generate_quiz(
+        args["content"], n, question_type, user_data, **options
+    ),
+    "link": lambda args, n, question_type, user_data, **options: generate_quiz_link(
+        None, n, question_type, user_data, content=args["content"], **options
+    ),
+    "topic": lambda args, n, question_type, user_data, **options: generate_quiz_topic(
+        args["topic"], args["subject"], question_type, n, user_data, **options
+    ),
+    "image": lambda args, n, question_type, user_data, **options: generate_quiz_image(
+        args["file_name"], n, question_type, user_data, **options
+    ),
+    "document": lambda args, n, question_type, user_data, **options: generate_quiz_document(
+        args["file_name"], n, question_type, user_data, **options
+    ),
+}
+
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def initial_count(number_of_questions: int) -> int:
+    """The number of questions per difficulty level to generate up front for a lazy pool."""
+    return min(number_of_questions, INITIAL_PER_DIFFICULTY)
+
+
+def start_pool(
+    user_id: str,
+    quiz_id: str,
+    source: str,
+    source_args: Dict,
+    question_type: str,
+    number_of_questions: int,
+    quiz: List[Dict],
+    lean: bool = False,
+) -> None:
+    """
+    Records how a lazily generated quiz was made, so its pool can be topped up later.
+
+    Content in source_args (pasted text, scraped pages) is stored in its own
+    document, not on the quiz document, which is read on every answer and is
+    limited to 1 MiB.
+
+    Args:
+        user_id (str): The quiz owner.
+        quiz_id (str): The quiz folder id.
+        source (str): One of GENERATORS ("text", "link", "topic", "image", "document").
+        source_args (Dict): What the generator needs to run again (content, topic, file name...).
+        question_type (str): The type of questions in the quiz.
+        number_of_questions (int): The requested questions per difficulty level; pools
+            are never topped up past it.
+        quiz (List[Dict]): The initially generated questions.
+        lean (bool): Whether questions are generated without explanations and hints.
+    """
+    generated = {"Easy": 0, "Medium": 0, "Hard": 0}
+    for question in quiz:
+        if question.get("difficulty") in generated:
+            generated[question["difficulty"]] += 1
+
+    db = firestore.client()
+    quiz_ref = db.collection("users").document(user_id).collection("quizzes").document(quiz_id)
+    source_args = dict(source_args)
+    if "content" in source_args:
+        content = truncate_to_tokens(source_args.pop("content"), MAX_CONTENT_TOKENS)
+        _content_ref(quiz_ref).set({"content": content})
+        source_args["content_stored"] = True
+    quiz_ref.set({
+        "question_pool": {
+            "source": source,
+            "source_args": source_args,
+            "question_type": question_type,
+            "target_per_difficulty": number_of_questions,
+            "generated": generated,
+            "lean": lean,
+        }
+    }, merge=True)
+
+
+def _content_ref(quiz_ref):
+    return quiz_ref.collection("pool_source").document("content")
+
+
+def replenish_pool(user_id: str, quiz_id: str, difficulty: str) -> int:
+    """
+    Generates more questions of one difficulty level for a lazy pool.
+
+    At most one top-up per quiz and difficulty runs at a time; callers that find one
+    in flight return straight away. Questions repeating ones already in the quiz are
+    dropped.
+
+    Returns:
+        int: The number of questions added.
+    """
+    key = (user_id, quiz_id, difficulty)
+    with _in_flight_lock:
+        if key in _in_flight:
+            return 0
+        _in_flight.add(key)
+
+    try:
+        db = firestore.client()
+        quiz_ref = db.collection("users").document(user_id).collection("quizzes").document(quiz_id)
+        quiz_doc = quiz_ref.get()
+        pool = quiz_doc.to_dict().get("question_pool") if quiz_doc.exists else None
+        if not pool:
+            return 0
+
+        missing = pool["target_per_difficulty"] - pool["generated"].get(difficulty, 0)
+        if missing <= 0:
+            return 0
+        count = min(TOP_UP_SIZE, missing)
+
+        source_args = pool["source_args"]
+        if source_args.get("content_stored"):
+            source_args = {**source_args, "content": _content_ref(quiz_ref).get().to_dict()["content"]}
+
+        user_data = get_user_data(user_id) or {}
+        generate = GENERATORS[pool["source"]]
+        questions = generate(
+            source_args, count, pool["question_type"], user_data,
+            difficulty=difficulty, lean=pool.get("lean", False),
+        )
+
+        existing = {
+            block_key(str(doc.to_dict().get("question", "")))
+            for doc in quiz_ref.collection("questions").stream()
+        }
+        new_questions = []
+        for question in questions:
+            question_key = block_key(str(question.get("question", "")))
+            if question_key in existing:
+                continue
+            existing.add(question_key)
+            question["difficulty"] = difficulty
+            new_questions.append(question)
+
+        save_quiz_to_firebase(user_id, quiz_id, new_questions, pool["question_type"])
+        # Count what was asked for, so a model repeating itself cannot keep the pool topping up forever
+        quiz_ref.update({f"question_pool.generated.{difficulty}": firestore.Increment(count)})
+        print(f"Added {len(new_questions)} {difficulty} questions to quiz {quiz_id}")
+        return len(new_questions)
+    except Exception as e:
+        print(f"Replenishing {difficulty} questions for quiz {quiz_id} failed: {str(e)}")
+        return 0
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(key)
@@ -0,0 +1,177 @@
+import json
+import re
+from typing import Annotated, Any, Dict, List, Literal, Tuple
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    StringConstraints,
+    TypeAdapter,
+    ValidationError,
+    WrapValidator,
+    field_validator,
+    model_validator,
+)
+
+from routes.compact_schema import TYPE_CODES
+
+Text = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
+class NoValidQuestions(ValueError):
+    """Model output without a single usable question."""
+
+
+class Question(BaseModel):
+    """The fields every stored question has; explanation and hint are left out of lean quizzes."""
+
+    model_config = ConfigDict(extra="allow")
+
+    question: Text
+    difficulty: Literal["Easy", "Medium", "Hard"]
+    topic: str = ""
+    explanation: str = ""
+    hint: str = ""
+
+    @field_validator("difficulty", mode="before")
+    @classmethod
+    def capitalize_difficulty(cls, value: Any) -> Any:
+        return value.strip().capitalize() if isinstance(value, str) else value
+
+
+class MultipleChoiceQuestion(Question):
+    options: List[Text] = Field(min_length=2)
+    answer: Text
+
+    @model_validator(mode="after")
+    def check_options(self) -> "MultipleChoiceQuestion":
+        if len({option.casefold() for option in self.options}) < len(self.options):
+            raise ValueError("options are not distinct")
+        if self.answer not in self.options:
+            raise ValueError("answer is not one of the options")
+        return self
+
+
+class TrueFalseQuestion(Question):
+    answer: Literal["True", "False"]
+    options: List[str] = ["True", "False"]
+
+    @field_validator("answer", mode="before")
+    @classmethod
+    def answer_text(cls, value: Any) -> Any:
+        if isinstance(value, bool):
+            return "True" if value else "False"
+        return value.strip().capitalize() if isinstance(value, str) else value
+
+
+class AnswerQuestion(Question):
+    """Fill in the space and Short Answer questions."""
+
+    answer: Text
+
+
+class OpenEndQuestion(Question):
+    suggestedResponseLength: Literal["Brief", "Moderate", "Extensive"] = "Moderate"
+    keyPoints: List[Text] = Field(min_length=1)
+
+
+class Invalid:
+    """Stands in for a batch item that failed validation, with its errors."""
+
+    def __init__(self, errors: List[Dict]):
+        self.errors = errors
+
+
+def _keep_invalid(value: Any, handler) -> Any:
+    # Failing items become Invalid instead of failing the batch, so one pass checks them all
+    try:
+        return handler(value)
+    except ValidationError as e:
+        return Invalid(e.errors(include_url=False))
+
+
+QUESTION_MODELS = {
+    "Multiple Choice": MultipleChoiceQuestion,
+    "True/False": TrueFalseQuestion,
+    "Fill in the space": AnswerQuestion,
+    "Short Answer": AnswerQuestion,
+    "Open End": OpenEndQuestion,
+}
+# One compiled validator per question type, built at import
+BATCH_VALIDATORS = {
+    question_type: TypeAdapter(List[Annotated[model, WrapValidator(_keep_invalid)]])
+    for question_type, model in QUESTION_MODELS.items()
+}
+
+
+def validate_questions(questions: List[Any], question_type: str) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Validates a batch of stored-shape questions of one type in one pass.
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: The valid questions, normalized (e.g.
+            "easy" becomes "Easy"), and for each invalid one its position and errors.
+    """
+    results = BATCH_VALIDATORS[question_type].validate_python(questions)
+    valid, invalid = [], []
+    for position, result in enumerate(results):
+        if isinstance(result, Invalid):
+            errors = [f"{'.'.join(map(str, error['loc'])) or 'question'}: {error['msg']}" for error in result.errors]
+            invalid.append({"position": position, "errors": errors})
+        else:
+            valid.append(result.model_dump(exclude_unset=True))
+    return valid, invalid
+
+
+def _objects(text: str) -> List[Dict]:
+    """Every JSON object that can be read in text, in order, skipping broken ones."""
+    decoder = json.JSONDecoder()
+    objects = []
+    position = text.find("{")
+    while position != -1:
+        try:
+            value, end = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            position = text.find("{", position + 1)
+            continue
+        if isinstance(value, dict):
+            objects.append(value)
+        position = text.find("{", end)
+    return objects
+
+
+def salvage_questions(text: str) -> List[Dict]:
+    """
+    The question objects of a JSON list, even when the list itself is broken (e.g.
+    cut off or with a malformed item): every item that still parses is kept.
+    """
+    try:
+        items = json.loads(text)
+        if isinstance(items, list):
+            return items
+    except json.JSONDecodeError:
+        pass
+    start = text.find("[")
+    return _objects(text[start + 1:] if start != -1 else text)
+
+
+def salvage_mixed(text: str) -> Dict[str, List[Dict]]:
+    """salvage_questions for mixed-quiz output: the items of each per-type list that still parse."""
+    try:
+        lists = json.loads(text)
+        if isinstance(lists, dict):
+            return lists
+    except json.JSONDecodeError:
+        pass
+    # Each list runs from its key to the next list's key
+    starts = sorted(
+        (match.end(), code)
+        for code in TYPE_CODES.values()
+        for match in re.finditer(rf'"{code}"\s*:\s*\[', text)
+    )
+    lists = {}
+    for number, (start, code) in enumerate(starts):
+        end = starts[number + 1][0] if number + 1 < len(starts) else len(text)
+        lists.setdefault(code, []).extend(_objects(text[start:end]))
+    return lists
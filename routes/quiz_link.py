@@ -1,454 +1,267 @@
 import os
 import random
-import uuid
-import json
+import asyncio
+import re
 import requests_cache
 import time
-from typing import Dict
-import google.generativeai as genai
+from typing import Dict, List, Optional, Tuple
 from firecrawl import FirecrawlApp
 from dotenv import load_dotenv
+from routes.html_extract import MIN_QUALITY_SCORE, fetch_and_extract
+from routes.content_minimizer import block_key, estimate_tokens, main_text, minimize_content
+from routes.generation_pipeline import SOURCE_ADAPTERS, PipelineRun, run_pipeline, upload_text
+from routes.circuit_breaker import CircuitOpen, firecrawl_breaker
+from routes.resilience import DeadlineExceeded, bounded_timeout, check_deadline, is_transient, run_within
 
 
 load_dotenv()
 
 field_id = random.randint(1000, 9999)
 
+# Multi-link scraping limits
+MAX_CONCURRENT_SCRAPES = 4
+SCRAPE_TIMEOUT_SECONDS = 45
+MAX_LINK_CONTENT_CHARS = 120_000
 
-def link_content(url: str) -> str:
-    """Fetches and returns content from the given URL using Firecrawl."""
+
+def firecrawl_page(url: str) -> Dict:
+    """
+    Scrapes the given URL with Firecrawl and returns the raw result. Raises on failure,
+    and straight away (CircuitOpen) while Firecrawl's circuit breaker is open.
+    """
+    # Firecrawl's timeout is in milliseconds and may not outlast the request's deadline
+    timeout = bounded_timeout(SCRAPE_TIMEOUT_SECONDS)
+    firecrawl_breaker.check()
     app = FirecrawlApp(api_key=os.environ["FIRECRAWL_API_KEY"])
-    start_time = time.time()
     try:
         with requests_cache.disabled():  # Ensure FirecrawlApp uses fresh requests if it doesn't use requests
-            result = app.scrape_url(url)
-        elapsed_time = time.time() - start_time
-        print(f"Function executed in {elapsed_time:.2f} seconds")
-        return str(result)  # Ensure the result is converted to a string
+            result = app.scrape_url(url, timeout=int(timeout * 1000))
+    except Exception as e:
+        # A page Firecrawl rejects (a bad URL, an unsupported site) says nothing about Firecrawl itself
+        if is_transient(e):
+            firecrawl_breaker.record_failure()
+        else:
+            firecrawl_breaker.record_success()
+        raise
+    firecrawl_breaker.record_success()
+    return result
+
+
+def scrape_page(url: str) -> Dict:
+    """
+    Scrapes the given URL, trying the local extractor before Firecrawl.
+
+    Static pages are fetched and extracted locally; Firecrawl is only called when
+    the local result scores below MIN_QUALITY_SCORE (script-rendered pages, link
+    indexes, non-HTML files) or the local fetch fails. If Firecrawl then fails, or
+    its circuit breaker is open, a weak local result is still better than nothing.
+
+    Raises:
+        CircuitOpen, DeadlineExceeded: If Firecrawl was refused and there is no local result.
+        RuntimeError: If neither the local extractor nor Firecrawl returned content.
+    """
+    local_result = None
+    try:
+        local_result = fetch_and_extract(url)
+        if local_result["quality"] >= MIN_QUALITY_SCORE:
+            return local_result
     except Exception as e:
+        print(f"Local extraction of {url} failed: {str(e)}")
+
+    try:
+        return firecrawl_page(url)
+    except Exception as e:
+        if local_result and local_result["markdown"]:
+            print(f"Firecrawl failed for {url}, using the local extraction: {str(e)}")
+            return local_result
+        if isinstance(e, (CircuitOpen, DeadlineExceeded)):
+            raise
+        raise RuntimeError(f"Failed to fetch content from {url}: {str(e)}")
+
+
+def link_content(url: str) -> str:
+    """Fetches the given URL and returns only its minimized main text."""
+    start_time = time.time()
+    try:
+        result = scrape_page(url)
+        return minimize_content(main_text(result), label=url)
+    finally:
         elapsed_time = time.time() - start_time
         print(f"Function executed in {elapsed_time:.2f} seconds")
-        return f"Error: crawl job failed or was stopped: {str(e)}"
 
 
-def string_to_file(content: str) -> str:
-    """Writes the given string to a temporary file and returns the file path."""
+async def gather_link_content(urls: List[str]) -> str:
+    """
+    Scrapes several URLs concurrently and merges them into a single generation input.
+
+    Scrapes run through link_content in worker threads, gated by a bounded semaphore
+    and a per-URL timeout, so the total wait is close to the slowest page rather than
+    the sum of all pages. Pages that fail or time out are skipped.
+
+    Args:
+        urls (List[str]): The URLs to fetch content from.
+
+    Returns:
+        str: The merged, deduplicated and size-budgeted content.
+
+    Raises:
+        DeadlineExceeded: If no page could be scraped before the request's deadline.
+        CircuitOpen: If no page could be scraped while Firecrawl's circuit is open.
+        RuntimeError: If no page could be scraped otherwise.
+    """
+    semaphore = asyncio.BoundedSemaphore(MAX_CONCURRENT_SCRAPES)
+    refused = []
+
+    async def scrape(url: str) -> Optional[str]:
+        async with semaphore:
+            try:
+                # No scrape may outlast the request's deadline, and the thread's own
+                # requests are cut to the same timeout so it does not run on
+                timeout = bounded_timeout(SCRAPE_TIMEOUT_SECONDS)
+                return await asyncio.wait_for(asyncio.to_thread(run_within, timeout, link_content, url), timeout=timeout)
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                print(f"Scraping {url} ran out of time")
+                return None
+            except CircuitOpen as e:
+                print(f"Scraping {url} failed: {str(e)}")
+                refused.append(e)
+                return None
+            except Exception as e:
+                print(f"Scraping {url} failed: {str(e)}")
+                return None
+
+    # Keep the caller's order but never scrape the same URL twice
+    unique_urls = list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+
     start_time = time.time()
-    temp_file_path = os.path.join("/tmp", f"{uuid.uuid4()}.txt")
-    with open(temp_file_path, "w", encoding="utf-8") as temp_file:
-        temp_file.write(content)
+    results = await asyncio.gather(*(scrape(url) for url in unique_urls))
     elapsed_time = time.time() - start_time
-    print(f"Function executed in {elapsed_time:.2f} seconds")
-    return temp_file_path
+    print(f"Scraped {len(unique_urls)} links in {elapsed_time:.2f} seconds")
+
+    pages = [
+        (url, result)
+        for url, result in zip(unique_urls, results)
+        if result
+    ]
+    if not pages:
+        # Every page failed: because the request ran out of time, Firecrawl is
+        # unavailable, or otherwise
+        check_deadline("scraping")
+        if refused:
+            raise refused[0]
+        raise RuntimeError("None of the provided links could be scraped")
+
+    return merge_link_content(pages, MAX_LINK_CONTENT_CHARS)
+
+
+def merge_link_content(pages: List[Tuple[str, str]], max_chars: int) -> str:
+    """
+    Merges scraped pages into one document.
+
+    Blocks (paragraph-sized chunks) repeated across pages, such as shared navigation
+    or footers, are kept only once. The character budget is split fairly between
+    pages: short pages keep everything and their unused share goes to longer ones.
+
+    Args:
+        pages (List[Tuple[str, str]]): (url, content) pairs in priority order.
+        max_chars (int): The maximum size of the merged content.
+
+    Returns:
+        str: The merged content with a header per source page.
+    """
+    deduped = dedupe_blocks(pages)
+
+    # Water-fill the budget, smallest pages first
+    budgets = {}
+    remaining = max_chars
+    by_size = sorted(range(len(deduped)), key=lambda i: len(deduped[i][1]))
+    for position, index in enumerate(by_size):
+        share = remaining // (len(by_size) - position)
+        budgets[index] = min(len(deduped[index][1]), share)
+        remaining -= budgets[index]
+
+    sections = []
+    for index, (url, text) in enumerate(deduped):
+        sections.append(f"Source: {url}\n\n{text[:budgets[index]]}")
+    return "\n\n---\n\n".join(sections)
+
+
+def dedupe_blocks(pages: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    Drops paragraph-sized blocks already seen on an earlier page.
+
+    Args:
+        pages (List[Tuple[str, str]]): (url, content) pairs in priority order.
+
+    Returns:
+        List[Tuple[str, str]]: The pages with repeated blocks removed; pages left
+            empty are dropped.
+    """
+    seen = set()
+    deduped = []
+    for url, content in pages:
+        blocks = []
+        for block in re.split(r"\n\s*\n", content):
+            block = block.strip()
+            if not block:
+                continue
+            key = block_key(block)
+            if key in seen:
+                continue
+            seen.add(key)
+            blocks.append(block)
+        if blocks:
+            deduped.append((url, "\n\n".join(blocks)))
+    return deduped
+
+
+def link_source(run: PipelineRun, url: Optional[str] = None, content: Optional[str] = None) -> List:
+    """Pipeline source adapter: scrapes the URL unless its content is given, then uploads it."""
+    if content is None:
+        with run.stage("fetch") as stage:
+            content = link_content(url)
+            stage["bytes"] = len(content.encode("utf-8"))
+            stage["tokens"] = estimate_tokens(content)
+    return [upload_text(run, content)]
+
+
+SOURCE_ADAPTERS["link"] = link_source
 
 
 def generate_quiz_link(
-    url: str, number_of_questions: int, question_type: str, user_data: Dict
+    url: Optional[str],
+    number_of_questions: int,
+    question_type: str,
+    user_data: Dict,
+    content: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    lean: bool = False,
+    compact: bool = True,
 ) -> Dict:
     """
     Generates a quiz based on content fetched from the given URL.
 
     Args:
-        url (str): The URL to fetch content from.
+        url (Optional[str]): The URL to fetch content from.
         number_of_questions (int): The number of questions to generate.
         question_type (str): The type of questions to generate.
         user_data (Dict): User-specific data to personalize the quiz.
+        content (Optional[str]): Already fetched content (e.g. merged from several
+            links with gather_link_content). When given, url is not scraped.
+        difficulty (Optional[str]): Generate only this difficulty level ("Easy", "Medium",
+            "Hard"), number_of_questions questions in total. Used to split a quiz
+            into concurrent calls per difficulty.
+        lean (bool): Leave out explanations and hints; they are generated on
+            request with routes.question_details.
+        compact (bool): Have the model answer in the short-key contract from
+            routes.compact_schema, enforced with response_schema, and expand it
+            to the stored shape.
 
     Returns:
         Dict: The generated quiz in JSON format.
     """
-    global temp_file_path
-    try:
-        # Configure Gemini API
-        genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
-
-        # Multiply the number of questions by 3 for diverse difficulty levels
-        num = number_of_questions * 3
-
-        multiple_choice_prompt = f"""
-            OBJECTIVE_AND_PERSONA
-            You are an expert quiz creator specializing in multiple-choice questions. Your task is to create a personalized multiple-choice quiz based on a given document, tailored to the user's background without directly referencing their personal details.
-
-            INSTRUCTIONS
-            To complete the task, you need to follow these steps:
-            1. Thoroughly analyze the provided document.
-            2. Generate {num} multiple-choice questions, evenly distributed across Easy, Medium, and Hard difficulty levels.
-            3. Each question should have 4 options, with only one correct answer.
-            4. Use the user's personal details to inform the relevance of questions, without including these details in the questions themselves.
-            5. Format the quiz in JSON structure as specified in the OUTPUT_FORMAT section.
-
-            CONSTRAINTS
-            1. Dos
-            - Strictly adhere to the content provided in the document
-            - Ensure questions are relevant to the user's context
-            - Maintain an equal distribution of difficulty levels
-            - Make distractors (incorrect options) plausible
-            2. Don'ts
-            - Don't use personal info/house details in questions
-            - Don't create questions unrelated to the document content
-            - Don't make the correct answer obvious or stand out
-
-            CONTEXT
-            The quiz is based on the given document. The user's personal details are provided for context but should not be directly referenced in the questions.
-
-            OUTPUT_FORMAT
-            The output format must be:
-            - Each question should include:
-            {{
-            "question": "Question",
-            "answer": "correct answer",
-            "options": ["option 1", "option 2", "option 3", "option 4"],
-            "explanation": "explanation(explain why the answer is so and not restricted to the document)",
-            "hint": "Short Hint",
-            "difficulty": "Difficulty level(Easy, Medium, Hard)",
-            "topic": "Topic on which the quiz was generated on",
-            }}
-
-            <FEW_SHOT_EXAMPLES>
-            Here we provide an example Output:
-            [
-            {{
-                "question": "What is the process of converting raw data into a meaningful format called?",
-                "answer": "Data processing",
-                "options": ["Data mining", "Data warehousing", "Data cleansing", "Data processing"],
-                "explanation": "Data processing involves organizing, manipulating, and transforming raw data into a usable format.",
-                "hint": "Think about what happens to data before analysis.",
-                "difficulty": "Medium",
-                "topic": "Technology"
-            }},
-            {{
-                "question": "Which programming language is widely used for web development and is known for its simplicity?",
-                "answer": "Python",
-                "options": ["Java", "C++", "Python", "JavaScript"],
-                "explanation": "Python is a versatile language suitable for various applications including web development, data science, and machine learning.",
-                "hint": "Consider a language often used for data analysis and machine learning.",
-                "difficulty": "Easy",
-                "topic": "Technology"
-            }}
-            ]
-            </FEW_SHOT_EXAMPLES>
-
-            RECAP
-            Remember to create {num} multiple-choice questions based solely on the document content. Use the user's background to inform relevance, but never include personal details in the questions. Maintain equal distribution of difficulty levels and ensure all questions have 4 options with only one correct answer.
-            """
-
-
-        true_false_prompt = f"""
-                OBJECTIVE_AND_PERSONA
-                You are a precision-focused quiz master specializing in True/False questions. Your task is to create a personalized True/False quiz based on a given document, tailored to the user's background without directly referencing their personal details.
-
-                INSTRUCTIONS
-                To complete the task, you need to follow these steps:
-                1. Carefully analyze the provided document.
-                2. Generate {num} True/False questions, evenly distributed across Easy, Medium, and Hard difficulty levels.
-                3. Ensure a balanced mix of true and false statements.
-                4. Use the user's personal details to inform the relevance of questions, without including these details in the questions themselves.
-                5. Format the quiz in JSON structure as specified in the OUTPUT_FORMAT section.
-
-                CONSTRAINTS
-                1. Dos
-                - Strictly adhere to the content provided in the document
-                - Ensure questions are relevant to the user's context
-                - Maintain an equal distribution of difficulty levels
-                - Create clear, unambiguous statements
-                2. Don'ts
-                - Don't use personal info/house details in questions
-                - Don't create questions unrelated to the document content
-                - Don't use absolute terms like 'always' or 'never' unless explicitly true
-
-                CONTEXT
-                The quiz is based on the given document. The user's personal details are provided for context but should not be directly referenced in the questions.
-
-                OUTPUT_FORMAT
-                The output format must be:
-                - Each question should include:
-                {{
-                "question": "Question",
-                "answer": "correct answer",
-                "options": ["True", "False"],
-                "explanation": "explanation(explain why the answer is so and not restricted to the document)",
-                "hint": "Short Hint",
-                "difficulty": "Difficulty level(Easy, Medium, Hard)",
-                "topic": "Topic on which the quiz was generated on",
-                }}
-
-                <FEW_SHOT_EXAMPLES>
-                Here we provide an example Output:
-                [
-                {{
-                    "question": "Python is an interpreted language.",
-                    "answer": "True",
-                    "options": ["True", "False"],
-                    "explanation": "Python is an interpreted language, meaning code is executed line by line without requiring compilation.",
-                    "hint": "Think about how Python code runs.",
-                    "difficulty": "Easy",
-                    "topic": "Technology"
-                }},
-                {{
-                    "question": "HTML is a programming language.",
-                    "answer": "False",
-                    "options": ["True", "False"],
-                    "explanation": "HTML is a markup language used for structuring web content, not a programming language.",
-                    "hint": "Consider the purpose of HTML.",
-                    "difficulty": "Medium",
-                    "topic": "Technology"
-                }}
-                ]
-                </FEW_SHOT_EXAMPLES>
-
-                RECAP
-                Remember to create {num} True/False questions based solely on the document content. Use the user's background to inform relevance, but never include personal details in the questions. Maintain equal distribution of difficulty levels and ensure a balanced mix of true and false statements.
-            """
-
-        fill_in_the_blank_prompt = f"""
-                OBJECTIVE_AND_PERSONA
-                You are a language expert specializing in Fill in the Blank questions. Your task is to create a personalized Fill in the Blank quiz based on a given document, tailored to the user's background without directly referencing their personal details.
-
-                INSTRUCTIONS
-                To complete the task, you need to follow these steps:
-                1. Thoroughly analyze the provided document.
-                2. Generate {num} Fill in the Blank questions, evenly distributed across Easy, Medium, and Hard difficulty levels.
-                3. Use underscores to indicate blank spaces in the questions.
-                4. Ensure answers are brief: single words or short phrases (maximum 5 words).
-                5. Use the user's personal details to inform the relevance of questions, without including these details in the questions themselves.
-                6. Format the quiz in JSON structure as specified in the OUTPUT_FORMAT section.
-
-                CONSTRAINTS
-                1. Dos
-                - Strictly adhere to the content provided in the document
-                - Ensure questions are relevant to the user's context
-                - Maintain an equal distribution of difficulty levels
-                - Make sure blanks test key concepts or information
-                2. Don'ts
-                - Don't use personal info/house details in questions
-                - Don't create questions unrelated to the document content
-                - Don't make answers longer than 5 words
-                - Don't use more than one blank per question
-
-                CONTEXT
-                The quiz is based on the given document. The user's personal details are provided for context but should not be directly referenced in the questions.
-
-                OUTPUT_FORMAT
-                The output format must be:
-                - Each question should include:
-                {{
-                "question": "question text (with blank indicated by underscores)",
-                "answer": "correct answer (less than 5 words)",
-                "explanation": "explanation(explain why the answer is so and not restricted to the document)",
-                "hint": "Short Hint",
-                "difficulty": "Difficulty level(Easy, Medium, Hard)",
-                "topic": "Topic on which the quiz was generated on",
-                }}
-
-                <FEW_SHOT_EXAMPLES>
-                Here we provide an example Output:
-                [
-                {{
-                    "question": "The central processing unit is the _____ of a computer.",
-                    "answer": "brain",
-                    "explanation": "The CPU is responsible for processing instructions and data, making it the 'brain' of a computer.",
-                    "hint": "Think about how Python code runs.",
-                    "difficulty": "Easy",
-                    "topic": "Technology"
-                }},
-                {{
-                    "question": "HTML stands for _____.",
-                    "answer": "Hypertext Markup Language",
-                    "explanation": "HTML is the standard markup language for creating web pages and web applications.",
-                    "hint": "Think of the language used to structure web content.",
-                    "difficulty": "Medium",
-                    "topic": "Technology"
-                }}
-                ]
-                </FEW_SHOT_EXAMPLES>
-
-                RECAP
-                Remember to create {num} Fill in the Blank questions based solely on the document content. Use the user's background to inform relevance, but never include personal details in the questions. Maintain equal distribution of difficulty levels and ensure all answers are brief (1-5 words).
-                """
-
-        short_ans_prompt = f"""
-                OBJECTIVE_AND_PERSONA
-                You are a concise communication expert specializing in Short Answer questions. Your task is to create a personalized Short Answer quiz based on a given document, tailored to the user's background without directly referencing their personal details.
-
-                INSTRUCTIONS
-                To complete the task, you need to follow these steps:
-                1. Carefully analyze the provided document.
-                2. Generate {num} Short Answer questions, evenly distributed across Easy, Medium, and Hard difficulty levels.
-                3. Ensure answers are brief: phrases or short sentences (maximum 15 words).
-                4. Use the user's personal details to inform the relevance of questions, without including these details in the questions themselves.
-                5. Format the quiz in JSON structure as specified in the OUTPUT_FORMAT section.
-
-                CONSTRAINTS
-                1. Dos
-                - Strictly adhere to the content provided in the document
-                - Ensure questions are relevant to the user's context
-                - Maintain an equal distribution of difficulty levels
-                - Create questions that require specific, concise answers
-                2. Don'ts
-                - Don't use personal info/house details in questions
-                - Don't create questions unrelated to the document content
-                - Don't make answers longer than 15 words
-                - Don't create questions that could be answered with just 'yes' or 'no'
-
-                CONTEXT
-                The quiz is based on the given document. The user's personal details are provided for context but should not be directly referenced in the questions.
-
-                OUTPUT_FORMAT
-                The output format must be:
-                - Each question should include:
-                {{
-                "question": "question text",
-                "answer": "correct answer (less than 15 words)",
-                "explanation": "explanation(explain why the answer is so and not restricted to the document)",
-                "hint": "Short Hint",
-                "difficulty": "Difficulty level(Easy, Medium, Hard)",
-                "topic": "Topic on which the quiz was generated on",
-                }}
-
-                <FEW_SHOT_EXAMPLES>
-                Here we provide an example Output:
-                [
-                {{
-                    "question": "What is the process of converting raw data into a meaningful format?",
-                    "answer": "Data Processing",
-                    "explanation": "Data processing involves organizing, manipulating, and transforming raw data into a usable format.",
-                    "hint": "Think about what happens to data before analysis.",
-                    "difficulty": "Medium",
-                    "topic": "Technology"
-                }},
-                {{
-                    "question": "What is the most popular programming language for web development?",
-                    "answer": "Python",
-                    "explanation": "Python is a versatile language suitable for various applications including web development, data science, and machine learning.",
-                    "hint": "Consider a language often used for data analysis and machine learning.",
-                    "difficulty": "Easy",
-                    "topic": "Technology"
-                }}
-                ]
-                </FEW_SHOT_EXAMPLES>
-
-                RECAP
-                Remember to create {num} Short Answer questions based solely on the document content. Use the user's background to inform relevance, but never include personal details in the questions. Maintain equal distribution of difficulty levels and ensure all sample answers are concise (maximum 15 words).
-                """
-
-        open_ended_prompt = f"""
-                OBJECTIVE_AND_PERSONA
-                You are a critical thinking expert specializing in Open-Ended questions. Your task is to create a personalized Open-Ended quiz based on a given document, tailored to the user's background without directly referencing their personal details.
-
-                INSTRUCTIONS
-                To complete the task, you need to follow these steps:
-                1. Thoroughly analyze the provided document.
-                2. Generate {num} Open-Ended questions, evenly distributed across Easy, Medium, and Hard difficulty levels.
-                3. Create questions that encourage analytical thinking, interpretation, or application of knowledge.
-                4. Use the user's personal details to inform the relevance of questions, without including these details in the questions themselves.
-                5. Format the quiz in JSON structure as specified in the OUTPUT_FORMAT section.
-
-                CONSTRAINTS
-                1. Dos
-                - Strictly adhere to the content provided in the document
-                - Ensure questions are relevant to the user's context
-                - Maintain an equal distribution of difficulty levels
-                - Create questions that promote critical thinking and in-depth responses
-                2. Don'ts
-                - Don't use personal info/house details in questions
-                - Don't create questions unrelated to the document content
-                - Don't create questions with single correct answers
-                - Don't make questions that can be answered with 'yes' or 'no'
-
-                CONTEXT
-                The quiz is based on the given document. The user's personal details are provided for context but should not be directly referenced in the questions.
-
-                OUTPUT_FORMAT
-                The output format must be:
-                - Each question should include:
-                {{
-                "question": "Question",
-                "suggestedResponseLength": "suggested response length (Brief|Moderate|Extensive)",
-                "keyPoints": "key points (3-5 points that a good answer might cover)",
-                "explanation": "explanation(explain why the answer is so and not restricted to the document)",
-                "difficulty": "Difficulty level(Easy, Medium, Hard)",
-                "topic": "Topic on which the quiz was generated on",
-                }}
-
-                <FEW_SHOT_EXAMPLES>
-                Here we provide an example Output:
-                [
-                {{
-                    "question": "What are the key benefits of cloud computing?",
-                    "suggestedResponseLength": "Moderate",
-                    "keyPoints": ["Cost-effectiveness", "Scalability", "Accessibility", "Data security"],
-                    "explanation": "Cloud computing offers a range of advantages including reduced IT infrastructure costs, flexible resource allocation, remote access, and enhanced data protection.",
-                    "difficulty": "Easy",
-                    "topic": "Technology"
-                }},
-                {{
-                    "question": "Discuss the ethical implications of artificial intelligence.",
-                    "suggestedResponseLength": "Extensive",
-                    "keyPoints": ["Job Displacement", "Privacy concerns", "Bias and discrimination", "Autonomous weapons"],
-                    "explanation": "AI has the potential to revolutionize various industries, but it also raises ethical questions about its impact on society, employment, privacy, and human rights.",
-                    "difficulty": "Medium",
-                    "topic": "Technology"
-                }}
-                ]
-                </FEW_SHOT_EXAMPLES>
-
-                RECAP
-                Remember to create {num} Open-Ended questions based solely on the document content. Use the user's background to inform relevance, but never include personal details in the questions. Maintain equal distribution of difficulty levels and ensure all questions encourage critical thinking and in-depth responses.
-                """
-        # Define prompts based on question type
-        prompts = {
-            "Multiple Choice": multiple_choice_prompt,
-            "True/False": true_false_prompt,
-            "Fill in the space": fill_in_the_blank_prompt,
-            "Open End": open_ended_prompt,
-            "Short Answer": short_ans_prompt,
-        }
-
-        # Select the appropriate prompt
-        selected_prompt = prompts.get(question_type)
-        if not selected_prompt:
-            raise ValueError(f"Invalid question type: {question_type}")
-
-        # Fill in the prompt with the correct number of questions
-        # filled_prompt = selected_prompt.format(num=num)
-
-        # Crawl the URL to get the content
-        content = link_content(url)
-
-        # Save content to a temporary file
-        temp_file_path = string_to_file(content)
-
-        # Upload the file to Gemini
-        try:
-            files = genai.upload_file(
-                temp_file_path, display_name="content.txt", mime_type="text/plain"
-            )
-            print(f"Uploaded file '{files.display_name}' as: {files.uri}")
-        except Exception as e:
-            raise RuntimeError(f"Failed to upload file to Gemini: {str(e)}")
-
-        # Generate quiz using Gemini API
-        model = genai.GenerativeModel(
-            "models/gemini-1.5-flash",
-            system_instruction=f"Your given name is menttorix and you are an AI Buddy. "
-            f"You are great at generating quizzes. "
-            f"Use the following personal details to personalize the quiz to be unique to the user: "
-            f"{user_data}. Don't use it in making the quiz.",
-            generation_config={"response_mime_type": "application/json"},
-        )
-
-        # Generate content
-        response = model.generate_content([files, selected_prompt])
-        # print(response)
-        # Parse and return the generated quiz
-        quiz = json.loads(response.text)
-        return quiz
-
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse quiz JSON: {str(e)}")
-    except Exception as e:
-        raise RuntimeError(f"An error occurred during quiz generation: {str(e)}")
-    finally:
-        # Clean up the temporary file
-        if "temp_file_path" in locals():
-            os.unlink(temp_file_path)
+    quiz, _ = run_pipeline(
+        "link", {"url": url, "content": content}, number_of_questions, question_type, user_data,
+        difficulty=difficulty, lean=lean, compact=compact,
+    )
+    return quiz
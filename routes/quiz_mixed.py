@@ -0,0 +1,91 @@
+from typing import Dict, List, Optional
+
+import routes.quiz_link  # noqa: F401  registers the "link" source adapter
+from routes.generation_pipeline import run_pipeline
+from routes.prompt_registry import MIXED, QUESTION_TYPES
+
+
+def mixed_source_args(source: str, content: Optional[str] = None, link: Optional[str] = None, file_name: Optional[str] = None) -> Dict:
+    """
+    The source adapter arguments of a mixed quiz.
+
+    Raises:
+        ValueError: If the source is unknown or its input is missing.
+    """
+    # The request field each source needs, and the adapter argument it feeds
+    inputs = {
+        "text": ("content", "content", content),
+        "link": ("link", "url", link),
+        "document": ("file_name", "file_name", file_name),
+        "image": ("file_name", "file_name", file_name),
+    }
+    if source == "topic":
+        return {}
+    if source not in inputs:
+        raise ValueError(f"Invalid source: {source}")
+    field, argument, value = inputs[source]
+    if value is None:
+        raise ValueError(f"Missing {field} for a {source} quiz")
+    return {argument: value}
+
+
+def mixed_question_counts(question_counts: Dict[str, int]) -> Dict[str, int]:
+    """
+    The question types a mixed quiz asks for, without those asked zero times.
+
+    Raises:
+        ValueError: If a question type is unknown or no questions are asked for.
+    """
+    unknown = [name for name in question_counts if name not in QUESTION_TYPES]
+    if unknown:
+        raise ValueError(f"Invalid question type: {', '.join(unknown)}; expected one of {', '.join(QUESTION_TYPES)}")
+    question_counts = {name: count for name, count in question_counts.items() if count > 0}
+    if not question_counts:
+        raise ValueError("Ask for at least one question")
+    return question_counts
+
+
+def generate_quiz_mixed(
+    source: str,
+    source_args: Dict,
+    question_counts: Dict[str, int],
+    user_data: Dict,
+    prompt_values: Optional[Dict] = None,
+    difficulty: Optional[str] = None,
+    lean: bool = False,
+) -> List[Dict]:
+    """
+    Generates a quiz mixing several question types in one model call.
+
+    The source is read once and all types come back in one response, instead of
+    one generate_quiz_* call per type.
+
+    Args:
+        source (str): "text", "link", "document", "image" or "topic".
+        source_args (Dict): The source adapter's arguments, see mixed_source_args.
+        question_counts (Dict[str, int]): The number of questions of each type per
+            difficulty level, e.g. {"Multiple Choice": 3, "True/False": 2}.
+        user_data (Dict): User-specific data to personalize the quiz.
+        prompt_values (Optional[Dict]): The topic and subject of a "topic" quiz.
+        difficulty (Optional[str]): Generate only this difficulty level, with the
+            counts as totals. Used to split a quiz into concurrent calls per difficulty.
+        lean (bool): Leave out explanations and hints; they are generated on
+            request with routes.question_details.
+
+    Returns:
+        List[Dict]: The questions grouped by type, each with its "question_type".
+    """
+    question_counts = mixed_question_counts(question_counts)
+    quiz, _ = run_pipeline(
+        source, source_args, sum(question_counts.values()), MIXED, user_data,
+        difficulty=difficulty, lean=lean, prompt_values=prompt_values, question_counts=question_counts,
+    )
+    return quiz
+
+
+def split_by_type(quiz: List[Dict]) -> Dict[str, List[Dict]]:
+    """Groups the questions of a mixed quiz by their "question_type"."""
+    groups = {}
+    for question in quiz:
+        groups.setdefault(question["question_type"], []).append(question)
+    return groups
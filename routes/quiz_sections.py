@@ -0,0 +1,190 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import google.generativeai as genai
+
+from routes.content_minimizer import block_key
+from routes.context_cache import cached_model, record_cache_hit, use_file
+from routes.difficulty_fanout import DIFFICULTIES
+from routes.model_routing import routed_model
+from routes.question_validation import salvage_questions
+from routes.quiz_document import generate_quiz_document
+from routes.circuit_breaker import CircuitOpen
+from routes.rate_limit import RateLimited, with_caller
+from routes.resilience import DeadlineExceeded, call_model
+
+# Large-document mode limits
+MAX_SECTIONS = 8
+SECTION_CONCURRENCY = 3
+
+
+def outline_document(file_name: str, max_sections: int = MAX_SECTIONS) -> List[Dict]:
+    """
+    Asks Gemini for the main sections of an uploaded document.
+
+    Args:
+        file_name (str): The name of the file uploaded to google files.
+        max_sections (int): The maximum number of sections to return.
+
+    Returns:
+        List[Dict]: Sections in reading order, each with "title", "pages" and a
+            relative "weight" (share of the document's content). Empty when the
+            outline cannot be read, so the document is generated in a single call.
+    """
+    genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+    prompt = f"""
+        Split the document into at most {max_sections} consecutive sections that together cover all of it,
+        following its own chapters or headings where it has them.
+        Return a JSON list in reading order, each item shaped like:
+        {{"title": "section title", "pages": "page range such as 4-12, or empty if unknown", "weight": 1-10}}
+        where weight is the section's share of the document's content.
+        """
+    # The section calls that follow reuse the document, so from the first of
+    # them on it is read from its context cache (see routes.context_cache)
+    generation_config = {"response_mime_type": "application/json"}
+    cache, files = use_file(file_name)
+    if cache is not None:
+        response = call_model("outline", cached_model(cache, generation_config).generate_content, prompt)
+        record_cache_hit(file_name, response)
+    else:
+        with routed_model("outline", None, None) as model_name:
+            model = genai.GenerativeModel(model_name, generation_config=generation_config)
+            response = call_model("outline", model.generate_content, [files, prompt])
+    # A cut-off or malformed outline keeps the sections that still parse; a
+    # blocked response has no text at all (ValueError)
+    try:
+        sections = salvage_questions(response.text)
+    except ValueError as e:
+        print(f"Outline could not be read: {str(e)}")
+        sections = []
+    sections = [
+        section for section in sections
+        if isinstance(section, dict) and section.get("title")
+    ]
+    for section in sections:
+        if not isinstance(section.get("weight"), (int, float)):
+            section["weight"] = 1
+    return sections[:max_sections]
+
+
+def allocate_questions(total: int, weights: List[float]) -> List[int]:
+    """
+    Splits a question count across sections in proportion to their weights.
+
+    Uses the largest-remainder method, so the counts always add up to total.
+    """
+    weights = [max(float(weight), 0.0) or 1.0 for weight in weights]
+    scale = total / sum(weights)
+    exact = [weight * scale for weight in weights]
+    counts = [int(share) for share in exact]
+    by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - counts[i], reverse=True)
+    for index in by_remainder[: total - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+def merge_section_quizzes(section_quizzes: List[List[Dict]], number_of_questions: int) -> List[Dict]:
+    """
+    Merges per-section questions into one quiz.
+
+    Repeated questions are dropped, then each difficulty level is filled to
+    number_of_questions by taking questions from the sections in turn, so every
+    section stays represented at every level.
+    """
+    seen = set()
+    buckets = {difficulty: [[] for _ in section_quizzes] for difficulty in DIFFICULTIES}
+    for index, questions in enumerate(section_quizzes):
+        for question in questions:
+            key = block_key(str(question.get("question", "")))
+            difficulty = question.get("difficulty")
+            if key in seen or difficulty not in buckets:
+                continue
+            seen.add(key)
+            buckets[difficulty][index].append(question)
+
+    quiz = []
+    for difficulty in DIFFICULTIES:
+        per_section = buckets[difficulty]
+        picked = []
+        while len(picked) < number_of_questions and any(per_section):
+            for questions in per_section:
+                if questions and len(picked) < number_of_questions:
+                    picked.append(questions.pop(0))
+        quiz.extend(picked)
+    return quiz
+
+
+def generate_quiz_document_sections(
+    file_name: str, number_of_questions: int, question_type: str, user_data: Dict, lean: bool = False
+) -> Tuple[List[Dict], Dict]:
+    """
+    Generates a quiz from a large document section by section (map-reduce).
+
+    The document is outlined into sections, the question count is allocated across
+    them by weight, each section is generated in parallel (at most
+    SECTION_CONCURRENCY at a time) and the results are merged, deduplicated and
+    balanced across difficulty levels.
+
+    Args:
+        file_name (str): The name of the file uploaded to google files.
+        number_of_questions (int): The number of questions per difficulty level.
+        question_type (str): The type of questions to generate.
+        user_data (Dict): User-specific data to personalize the quiz.
+        lean (bool): Leave out explanations and hints.
+
+    Returns:
+        Tuple[List[Dict], Dict]: The quiz and a report with per-section timings.
+    """
+    start_time = time.time()
+    sections = outline_document(file_name)
+    outline_seconds = time.time() - start_time
+    if len(sections) < 2:
+        # Nothing to split; a single call is cheaper
+        quiz = generate_quiz_document(file_name, number_of_questions, question_type, user_data, lean=lean)
+        return quiz, {"sections": [], "outline_seconds": round(outline_seconds, 2)}
+
+    counts = allocate_questions(number_of_questions, [s.get("weight", 1) for s in sections])
+    work = [(section, count) for section, count in zip(sections, counts) if count > 0]
+
+    def generate_section(item: Tuple[Dict, int]) -> Tuple[List[Dict], Dict]:
+        section, count = item
+        focus = section["title"] + (f" (pages {section['pages']})" if section.get("pages") else "")
+        section_start = time.time()
+        timing = {"title": section["title"], "questions_requested": count * 3}
+        try:
+            questions = generate_quiz_document(
+                file_name, count, question_type, user_data, focus=focus, lean=lean
+            )
+            for question in questions:
+                question["section"] = section["title"]
+            timing["questions_returned"] = len(questions)
+        except Exception as e:
+            if isinstance(e, (RateLimited, DeadlineExceeded, CircuitOpen)):
+                refused.append(e)
+            print(f"Section '{section['title']}' failed: {str(e)}")
+            questions = []
+            timing["error"] = str(e)
+        timing["seconds"] = round(time.time() - section_start, 2)
+        print(f"Section '{section['title']}' executed in {timing['seconds']:.2f} seconds")
+        return questions, timing
+
+    refused = []
+    with ThreadPoolExecutor(max_workers=SECTION_CONCURRENCY) as executor:
+        results = list(executor.map(with_caller(generate_section), work))
+
+    section_quizzes = [questions for questions, _ in results]
+    if not any(section_quizzes) and refused:
+        raise refused[0]
+    if not any(section_quizzes):
+        raise RuntimeError("Every section of the document failed to generate")
+
+    quiz = merge_section_quizzes(section_quizzes, number_of_questions)
+    report = {
+        "outline_seconds": round(outline_seconds, 2),
+        "total_seconds": round(time.time() - start_time, 2),
+        "sections": [timing for _, timing in results],
+    }
+    print(f"Function executed in {report['total_seconds']:.2f} seconds")
+    return quiz, report
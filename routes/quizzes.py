@@ -1,12 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Header
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from firebase_admin import firestore
 from routes.firebase_utils import initialize_firebase, get_user_data, save_quiz_to_firebase
 from routes.quiz_document import generate_quiz_document
-from routes.quiz_link import generate_quiz_link
+from routes.quiz_link import generate_quiz_link, gather_link_content, link_content
+from routes.link_crawl import crawl_site
 from routes.quiz_topic import generate_quiz_topic
 from routes.quiz_image import generate_quiz_image
+from routes.quiz_txt import generate_quiz
+from routes.quiz_sections import generate_quiz_document_sections
+from routes.quiz_mixed import generate_quiz_mixed, mixed_question_counts, mixed_source_args, split_by_type
+from routes.difficulty_fanout import by_difficulty
+from routes.question_pool import initial_count, start_pool
+from routes.content_minimizer import minimize_content
+from routes.question_details import get_question_details
+from routes.prompt_registry import prompt_hash
+from routes.singleflight import generation_key, normalize, personalize_quiz, singleflight
+from routes.topic_bank import record_topic_request, serve_from_bank
+from routes.question_index import assemble_quiz, forget_quiz
+from routes.near_duplicates import forget_quiz_questions
+from routes.search_index import forget_quiz_documents
+from routes.circuit_breaker import CircuitOpen, gemini_breaker
+from routes.idempotency import idempotent
+from routes.rate_limit import RateLimited, set_caller
+from routes.resilience import DeadlineExceeded, set_deadline
 
 router = APIRouter()
 
@@ -16,22 +35,58 @@ class QuizText(BaseModel):
     content: str
     number_of_questions: int
     question_type: str
+    split_by_difficulty: bool = False
+    lazy_pool: bool = False
+    lean: bool = False
 
 class QuizLink(BaseModel):
-    link: str
+    link: Optional[str] = None
+    links: Optional[List[str]] = None
     number_of_questions: int
     question_type: str
+    split_by_difficulty: bool = False
+    lazy_pool: bool = False
+    lean: bool = False
+    crawl: bool = False
+    crawl_depth: int = 1
+    crawl_page_budget: int = 10
 
 class QuizFile(BaseModel):
     file_name: str
     number_of_questions: int
     question_type: str
+    split_by_difficulty: bool = False
+    lazy_pool: bool = False
+    lean: bool = False
+    large_document: bool = False
 
 class QuizTopic(BaseModel):
     topic: str
     subject: str
     number_of_questions: int
     question_type: str
+    split_by_difficulty: bool = False
+    lazy_pool: bool = False
+    lean: bool = False
+    coalesce: bool = True
+    fresh: bool = False
+
+class QuizMixed(BaseModel):
+    source: str  # "text", "link", "document", "image" or "topic"
+    question_counts: Dict[str, int]  # questions of each type per difficulty level
+    content: Optional[str] = None
+    link: Optional[str] = None
+    file_name: Optional[str] = None
+    topic: Optional[str] = None
+    subject: Optional[str] = None
+    split_by_difficulty: bool = False
+    lean: bool = False
+
+class QuizAssemble(BaseModel):
+    text: str  # a topic or keywords
+    number_of_questions: int  # per difficulty level
+    question_type: Optional[str] = None
+    exclude_quiz_ids: List[str] = []
 
 class QuizFolder(BaseModel):
     title: str
@@ -39,6 +94,9 @@ class QuizFolder(BaseModel):
     category: str
     total_questions: Optional[int] = None
 
+class QuestionDetailsRequest(BaseModel):
+    question_ids: List[str]
+
 class QuizUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -49,96 +107,406 @@ class QuizUpdate(BaseModel):
 def get_db():
     return firestore.client()
 
+def saved_questions_quiz(user_id: str, quiz_id: str, text: str, number_of_questions: int, question_type: str, error: CircuitOpen) -> Dict:
+    """
+    The fallback while Gemini's circuit is open: the user's own saved questions that
+    best match the requested material, saved as the quiz.
+
+    Raises:
+        CircuitOpen: error, when none of the user's saved questions match.
+    """
+    quiz = assemble_quiz(user_id, text, number_of_questions, question_type=question_type, exclude_quiz_ids=[quiz_id])
+    if not quiz:
+        raise error
+    print(f"Gemini unavailable, quiz {quiz_id} assembled from {len(quiz)} saved questions")
+    save_quiz_to_firebase(user_id, quiz_id, quiz, question_type, index=False)
+    return {"message": "Quiz assembled from your saved questions while generation is unavailable", "quiz": quiz, "degraded": True}
+
+def forget_quiz_everywhere(user_id: str, quiz_id: str) -> None:
+    """Drops a deleted quiz's questions from the user's question, near-duplicate and search indexes."""
+    forget_quiz(user_id, quiz_id)
+    forget_quiz_questions(user_id, quiz_id)
+    forget_quiz_documents(user_id, quiz_id)
+
 # Routes
 @router.post("/users/{user_id}/quizzes/{quiz_id}/generate_quiz")
-async def create_quiz(quiz_input: QuizText, user_id: str, quiz_id: str):
+@idempotent
+async def create_quiz(quiz_input: QuizText, user_id: str, quiz_id: str, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
     try:
         user_data = get_user_data(user_id)
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
         
-        quiz = generate_quiz_document(
-            quiz_input.content,
-            quiz_input.number_of_questions,
-            quiz_input.question_type,
-            user_data
-        )
-        save_quiz_to_firebase(user_id, quiz_id, quiz, quiz_input.question_type)
+        # Lazy pools start small and are topped up per difficulty while the quiz is taken
+        number_of_questions = quiz_input.number_of_questions
+        if quiz_input.lazy_pool:
+            number_of_questions = initial_count(number_of_questions)
+
+        generate = by_difficulty(generate_quiz) if quiz_input.split_by_difficulty else generate_quiz
+        # Generations wait on the rate limiter and Gemini, so they run in a worker thread
+        # (which keeps the request's caller and deadline) instead of blocking the event loop
+        try:
+            quiz = await asyncio.to_thread(
+                generate,
+                quiz_input.content,
+                number_of_questions,
+                quiz_input.question_type,
+                user_data,
+                lean=quiz_input.lean,
+            )
+        except CircuitOpen as e:
+            return await asyncio.to_thread(saved_questions_quiz, user_id, quiz_id, quiz_input.content, quiz_input.number_of_questions, quiz_input.question_type, e)
+        # Saving dedupes and indexes the questions, which can load an index from
+        # Firestore, so it runs off the event loop like the generation
+        await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, quiz, quiz_input.question_type)
+        if quiz_input.lazy_pool:
+            source_args = {"content": minimize_content(quiz_input.content, label="pasted text")}
+            start_pool(user_id, quiz_id, "text", source_args, quiz_input.question_type, quiz_input.number_of_questions, quiz, lean=quiz_input.lean)
         return {"message": "Quiz generated and saved successfully", "quiz": quiz}
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/quizzes/{quiz_id}/generate_quiz_link")
-async def create_quiz_link(quiz_input: QuizLink, user_id: str, quiz_id: str):
+@idempotent
+async def create_quiz_link(quiz_input: QuizLink, user_id: str, quiz_id: str, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
+    urls = quiz_input.links or ([quiz_input.link] if quiz_input.link else [])
+    if not urls:
+        raise HTTPException(status_code=400, detail="Provide a link or a list of links")
     try:
         user_data = get_user_data(user_id)
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        quiz = generate_quiz_link(
-            quiz_input.link,
-            quiz_input.number_of_questions,
-            quiz_input.question_type,
-            user_data
-        )
-        save_quiz_to_firebase(user_id, quiz_id, quiz, quiz_input.question_type)
-        return {"message": "Quiz generated and saved successfully", "quiz": quiz}
+
+        # Several readings are scraped concurrently and merged into one input,
+        # a crawl follows the root page's links within the same course site
+        content, crawl_stats = None, None
+        if quiz_input.crawl:
+            content, crawl_stats = await crawl_site(
+                urls[0], quiz_input.crawl_depth, quiz_input.crawl_page_budget
+            )
+        elif len(urls) > 1:
+            content = await gather_link_content(urls)
+        elif quiz_input.split_by_difficulty or quiz_input.lazy_pool:
+            # Scrape once instead of once per difficulty level or pool top-up
+            content = await asyncio.to_thread(link_content, urls[0])
+
+        number_of_questions = quiz_input.number_of_questions
+        if quiz_input.lazy_pool:
+            number_of_questions = initial_count(number_of_questions)
+
+        generate = by_difficulty(generate_quiz_link) if quiz_input.split_by_difficulty else generate_quiz_link
+        try:
+            quiz = await asyncio.to_thread(
+                generate,
+                urls[0] if content is None else None,
+                number_of_questions,
+                quiz_input.question_type,
+                user_data,
+                content=content,
+                lean=quiz_input.lean,
+            )
+        except CircuitOpen as e:
+            # Scraping does not need Gemini, so the page still tells which saved questions match
+            if content is None:
+                content = await asyncio.to_thread(link_content, urls[0])
+            return await asyncio.to_thread(saved_questions_quiz, user_id, quiz_id, content, quiz_input.number_of_questions, quiz_input.question_type, e)
+        await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, quiz, quiz_input.question_type)
+        if quiz_input.lazy_pool:
+            start_pool(user_id, quiz_id, "link", {"content": content}, quiz_input.question_type, quiz_input.number_of_questions, quiz, lean=quiz_input.lean)
+        result = {"message": "Quiz generated and saved successfully", "quiz": quiz}
+        if crawl_stats is not None:
+            result["crawl_stats"] = crawl_stats
+        return result
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/quizzes/{quiz_id}/generate_quiz_topic")
-async def create_quiz_topic(quiz_input: QuizTopic, user_id: str, quiz_id: str):
+@idempotent
+async def create_quiz_topic(quiz_input: QuizTopic, user_id: str, quiz_id: str, background_tasks: BackgroundTasks, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
     try:
         user_data = get_user_data(user_id)
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
         
-        quiz = generate_quiz_topic(
-            quiz_input.topic,
-            quiz_input.subject,
-            quiz_input.question_type,
-            quiz_input.number_of_questions,
-            user_data
-        )
-        print(type(quiz))
-        save_quiz_to_firebase(user_id, quiz_id, quiz, quiz_input.question_type)
-        return {"message": "Quiz generated and saved successfully", "quiz": quiz}
+        number_of_questions = quiz_input.number_of_questions
+        if quiz_input.lazy_pool:
+            number_of_questions = initial_count(number_of_questions)
+
+        # Requests feed the topic popularity the bank warmer works from, and popular
+        # topics are served from their shared bank unless a fresh quiz is asked for,
+        # or Gemini's circuit is open and the bank is all there is
+        background_tasks.add_task(record_topic_request, quiz_input.topic, quiz_input.subject, quiz_input.question_type)
+        quiz = None
+        if not quiz_input.fresh or gemini_breaker.is_open():
+            quiz = serve_from_bank(
+                quiz_input.topic, quiz_input.subject, quiz_input.question_type, number_of_questions, user_id
+            )
+
+        generate = by_difficulty(generate_quiz_topic) if quiz_input.split_by_difficulty else generate_quiz_topic
+        from_bank = quiz is not None
+        try:
+            if from_bank:
+                quiz = personalize_quiz(quiz, user_id)
+            elif quiz_input.coalesce:
+                # A request identical to one already generating (e.g. a class assignment)
+                # shares that generation, shuffled per user. The first request is generated
+                # with its own full profile, so a request nobody joins loses no personalization
+                key = generation_key(
+                    normalize(quiz_input.topic),
+                    normalize(quiz_input.subject),
+                    quiz_input.question_type,
+                    number_of_questions,
+                    quiz_input.lean,
+                    prompt_hash("topic", quiz_input.question_type),
+                    user_data=user_data,
+                )
+                shared_quiz, _ = await singleflight(key, lambda: generate(
+                    quiz_input.topic,
+                    quiz_input.subject,
+                    quiz_input.question_type,
+                    number_of_questions,
+                    user_data,
+                    lean=quiz_input.lean,
+                ))
+                quiz = personalize_quiz(shared_quiz, user_id)
+            else:
+                quiz = await asyncio.to_thread(
+                    generate,
+                    quiz_input.topic,
+                    quiz_input.subject,
+                    quiz_input.question_type,
+                    number_of_questions,
+                    user_data,
+                    lean=quiz_input.lean,
+                )
+        except CircuitOpen as e:
+            topic_text = f"{quiz_input.topic} {quiz_input.subject}"
+            return await asyncio.to_thread(saved_questions_quiz, user_id, quiz_id, topic_text, quiz_input.number_of_questions, quiz_input.question_type, e)
+        await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, quiz, quiz_input.question_type)
+        if quiz_input.lazy_pool:
+            source_args = {"topic": quiz_input.topic, "subject": quiz_input.subject}
+            start_pool(user_id, quiz_id, "topic", source_args, quiz_input.question_type, quiz_input.number_of_questions, quiz, lean=quiz_input.lean)
+        return {"message": "Quiz generated and saved successfully", "quiz": quiz, "from_bank": from_bank}
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/quizzes/{quiz_id}/generate_quiz_image")
-async def create_quiz_image(quiz_input: QuizFile, user_id: str, quiz_id: str):
+@idempotent
+async def create_quiz_image(quiz_input: QuizFile, user_id: str, quiz_id: str, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
     try:
         user_data = get_user_data(user_id)
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
         
-        quiz = generate_quiz_image(
+        number_of_questions = quiz_input.number_of_questions
+        if quiz_input.lazy_pool:
+            number_of_questions = initial_count(number_of_questions)
+
+        generate = by_difficulty(generate_quiz_image) if quiz_input.split_by_difficulty else generate_quiz_image
+        quiz = await asyncio.to_thread(
+            generate,
             quiz_input.file_name,
-            quiz_input.number_of_questions,
+            number_of_questions,
             quiz_input.question_type,
-            user_data
+            user_data,
+            lean=quiz_input.lean,
         )
-        save_quiz_to_firebase(user_id, quiz_id, quiz, quiz_input.question_type)
+        await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, quiz, quiz_input.question_type)
+        if quiz_input.lazy_pool:
+            source_args = {"file_name": quiz_input.file_name}
+            start_pool(user_id, quiz_id, "image", source_args, quiz_input.question_type, quiz_input.number_of_questions, quiz, lean=quiz_input.lean)
         return {"message": "Quiz generated and saved successfully", "quiz": quiz}
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.post("/users/{user_id}/quizzes/{quiz_id}/generate_quiz_document")
-async def create_quiz_document(quiz_input: QuizFile, user_id: str, quiz_id: str):
+@idempotent
+async def create_quiz_document(quiz_input: QuizFile, user_id: str, quiz_id: str, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
     try:
         user_data = get_user_data(user_id)
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        quiz = generate_quiz_image(
-            quiz_input.file_name,
-            quiz_input.number_of_questions,
-            quiz_input.question_type,
-            user_data
+
+        # Long documents are generated section by section in parallel
+        sections_report = None
+        if quiz_input.large_document:
+            quiz, sections_report = await asyncio.to_thread(
+                generate_quiz_document_sections,
+                quiz_input.file_name,
+                quiz_input.number_of_questions,
+                quiz_input.question_type,
+                user_data,
+                lean=quiz_input.lean,
+            )
+        else:
+            number_of_questions = quiz_input.number_of_questions
+            if quiz_input.lazy_pool:
+                number_of_questions = initial_count(number_of_questions)
+
+            generate = by_difficulty(generate_quiz_document) if quiz_input.split_by_difficulty else generate_quiz_document
+            quiz = await asyncio.to_thread(
+                generate,
+                quiz_input.file_name,
+                number_of_questions,
+                quiz_input.question_type,
+                user_data,
+                lean=quiz_input.lean,
+            )
+        await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, quiz, quiz_input.question_type)
+        if quiz_input.lazy_pool and not quiz_input.large_document:
+            source_args = {"file_name": quiz_input.file_name}
+            start_pool(user_id, quiz_id, "document", source_args, quiz_input.question_type, quiz_input.number_of_questions, quiz, lean=quiz_input.lean)
+        result = {"message": "Quiz generated and saved successfully", "quiz": quiz}
+        if sections_report is not None:
+            result["sections_report"] = sections_report
+        return result
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/users/{user_id}/quizzes/{quiz_id}/generate_quiz_mixed")
+@idempotent
+async def create_quiz_mixed(quiz_input: QuizMixed, user_id: str, quiz_id: str, idempotency_key: Optional[str] = Header(None)):
+    set_caller(user_id)
+    set_deadline()
+    try:
+        source_args = mixed_source_args(
+            quiz_input.source, content=quiz_input.content, link=quiz_input.link, file_name=quiz_input.file_name
         )
-        save_quiz_to_firebase(user_id, quiz_id, quiz, quiz_input.question_type)
+        question_counts = mixed_question_counts(quiz_input.question_counts)
+        prompt_values = None
+        if quiz_input.source == "topic":
+            if not quiz_input.topic or not quiz_input.subject:
+                raise ValueError("Missing topic and subject for a topic quiz")
+            prompt_values = {"topic": quiz_input.topic, "subject": quiz_input.subject}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        user_data = get_user_data(user_id)
+        if user_data is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        # One call covers every question type; the output is saved per type
+        generate = by_difficulty(generate_quiz_mixed) if quiz_input.split_by_difficulty else generate_quiz_mixed
+        quiz = await asyncio.to_thread(
+            generate,
+            quiz_input.source,
+            source_args,
+            question_counts,
+            user_data,
+            prompt_values=prompt_values,
+            lean=quiz_input.lean,
+        )
+        for question_type, questions in split_by_type(quiz).items():
+            await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, questions, question_type)
         return {"message": "Quiz generated and saved successfully", "quiz": quiz}
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/users/{user_id}/quizzes/{quiz_id}/assemble_quiz")
+async def create_quiz_assembled(quiz_input: QuizAssemble, user_id: str, quiz_id: str):
+    try:
+        # Reuses the user's own saved questions through their question index, with no model call
+        quiz = await asyncio.to_thread(
+            assemble_quiz,
+            user_id,
+            quiz_input.text,
+            quiz_input.number_of_questions,
+            question_type=quiz_input.question_type,
+            exclude_quiz_ids=[*quiz_input.exclude_quiz_ids, quiz_id],
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not quiz:
+        raise HTTPException(status_code=404, detail="No saved questions match")
+    try:
+        for question_type, questions in split_by_type(quiz).items():
+            await asyncio.to_thread(save_quiz_to_firebase, user_id, quiz_id, questions, question_type, index=False)
+        return {
+            "message": "Quiz assembled and saved successfully",
+            "quiz": quiz,
+            "requested": quiz_input.number_of_questions * 3,
+            "found": len(quiz),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/users/{user_id}/quizzes/{quiz_id}/questions/{question_id}/details")
+async def get_details(user_id: str, quiz_id: str, question_id: str):
+    set_caller(user_id)
+    set_deadline()
+    try:
+        details = await asyncio.to_thread(get_question_details, user_id, quiz_id, [question_id])
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if question_id not in details:
+        raise HTTPException(status_code=404, detail="Question not found")
+    return details[question_id]
+
+@router.post("/users/{user_id}/quizzes/{quiz_id}/questions/details")
+async def get_details_batch(user_id: str, quiz_id: str, request: QuestionDetailsRequest):
+    set_caller(user_id)
+    set_deadline()
+    # Results pages ask for all their questions at once so missing details are generated in batches
+    try:
+        return await asyncio.to_thread(get_question_details, user_id, quiz_id, request.question_ids)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -165,6 +533,7 @@ async def delete_quiz_folder(quiz_id: str, user_id: str, db: firestore.Client =
     try:
         folder_ref = db.collection("users").document(user_id).collection("quizzes").document(quiz_id)
         folder_ref.delete()
+        await asyncio.to_thread(forget_quiz_everywhere, user_id, quiz_id)
         return {"message": "Quiz folder deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -174,6 +543,7 @@ async def delete_quiz(quiz_id: str, user_id: str, db: firestore.Client = Depends
     try:
         quiz_ref = db.collection("users").document(user_id).collection("quizzes").document(quiz_id)
         quiz_ref.delete()
+        await asyncio.to_thread(forget_quiz_everywhere, user_id, quiz_id)
         return {"message": "Quiz deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
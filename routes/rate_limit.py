@@ -0,0 +1,236 @@
+import bisect
+import contextvars
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+
+# Gemini calls per minute for the whole API key, and for each user, with the
+# burst a full bucket allows
+KEY_CALLS_PER_MINUTE = float(os.environ.get("GEMINI_CALLS_PER_MINUTE", 60))
+KEY_BURST = 10
+USER_CALLS_PER_MINUTE = float(os.environ.get("GEMINI_USER_CALLS_PER_MINUTE", 12))
+USER_BURST = 6
+
+# Lower numbers go first. A call that would wait longer than its priority's
+# maximum is refused straight away.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+MAX_WAIT_SECONDS = {PRIORITY_INTERACTIVE: 10.0, PRIORITY_BACKGROUND: 120.0}
+
+# Histogram bucket upper bounds; the last bucket counts everything above
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+MAX_USER_BUCKETS = 10_000
+
+
+class RateLimited(Exception):
+    """A Gemini call refused by the rate limiter; retry_after is in whole seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at rate tokens per second up to capacity.
+
+    Tokens can be reserved ahead of time, leaving the bucket in debt; later
+    callers then wait for the debt to be refilled as well as their own token.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, cost: float = 1) -> float:
+        """Seconds until cost tokens are available."""
+        self.refill(now)
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def reserve(self, now: float, cost: float = 1) -> float:
+        """Takes cost tokens, in debt if need be; returns the seconds until they are really there."""
+        wait = self.wait_time(now, cost)
+        self.tokens -= cost
+        return wait
+
+    def refund(self, cost: float = 1) -> None:
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+# The user and priority of Gemini calls made by the current request; calls
+# outside a request (warmers, pools) are background calls of no user
+_caller: contextvars.ContextVar[Tuple[Optional[str], int]] = contextvars.ContextVar(
+    "gemini_caller", default=(None, PRIORITY_BACKGROUND)
+)
+
+_condition = threading.Condition()
+_key_buckets: Dict[str, TokenBucket] = {}
+_user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+# Waiting calls as (priority, arrival) pairs; the smallest may take the next key token
+_queue = []
+_arrivals = itertools.count()
+_stats = {
+    "admitted": 0,
+    "rejected": 0,
+    "timed_out": 0,
+    "max_depth": 0,
+    "wait_seconds": [0] * (len(WAIT_BUCKETS) + 1),
+    "depth_at_arrival": [0] * (len(DEPTH_BUCKETS) + 1),
+}
+
+
+def set_caller(user_id: Optional[str], priority: int = PRIORITY_INTERACTIVE) -> None:
+    """Attributes the Gemini calls of the current request to a user."""
+    _caller.set((user_id, priority))
+
+
+def with_caller(function: Callable) -> Callable:
+    """
+    Wraps function to run in the current request's context, for worker threads:
+    its Gemini calls are made as the current caller, under the current deadline.
+    """
+    context = contextvars.copy_context()
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(function, *args, **kwargs)
+    return wrapper
+
+
+def _key_bucket() -> TokenBucket:
+    key = hashlib.sha256(os.environ.get("GEMINI_API_KEY", "").encode("utf-8")).hexdigest()
+    if key not in _key_buckets:
+        _key_buckets[key] = TokenBucket(KEY_CALLS_PER_MINUTE / 60, KEY_BURST)
+    return _key_buckets[key]
+
+
+def _user_bucket(user_id: str) -> TokenBucket:
+    bucket = _user_buckets.get(user_id)
+    if bucket is None:
+        bucket = _user_buckets[user_id] = TokenBucket(USER_CALLS_PER_MINUTE / 60, USER_BURST)
+        if len(_user_buckets) > MAX_USER_BUCKETS:
+            _user_buckets.popitem(last=False)
+    else:
+        _user_buckets.move_to_end(user_id)
+    return bucket
+
+
+def _observe(histogram: str, bounds: Tuple, value: float) -> None:
+    _stats[histogram][bisect.bisect_left(bounds, value)] += 1
+
+
+def acquire() -> float:
+    """
+    Waits for permission to make one Gemini call as the current caller.
+
+    The call takes a token from its user's bucket, then queues by priority for a
+    token of the API key's bucket. Calls that would wait longer than their
+    priority's MAX_WAIT_SECONDS are refused without waiting.
+
+    This blocks the calling thread, so calls made while serving a request must
+    run in a worker thread (asyncio.to_thread), not on the event loop.
+
+    Returns:
+        float: The seconds waited.
+
+    Raises:
+        RateLimited: If the call cannot be made in time.
+    """
+    user_id, priority = _caller.get()
+    max_wait = MAX_WAIT_SECONDS.get(priority, MAX_WAIT_SECONDS[PRIORITY_BACKGROUND])
+    start_time = time.monotonic()
+    deadline = start_time + max_wait
+
+    with _condition:
+        key_bucket = _key_bucket()
+        user_bucket = _user_bucket(user_id) if user_id else None
+        user_wait = user_bucket.wait_time(start_time) if user_bucket else 0.0
+        # Calls queued ahead of this one at the same or a more urgent priority take key tokens first
+        ahead = sum(1 for queued_priority, _ in _queue if queued_priority <= priority)
+        key_wait = key_bucket.wait_time(start_time, ahead + 1)
+        estimate = max(user_wait, key_wait)
+        if estimate > max_wait:
+            _stats["rejected"] += 1
+            who = "You are" if user_wait >= key_wait else "The service is"
+            raise RateLimited(f"{who} making too many AI requests; try again shortly", math.ceil(estimate))
+        if user_bucket:
+            user_bucket.reserve(start_time)
+        # The user's token may be in debt; the call only queues for the key once
+        # it is paid, so it never holds up other users' calls
+        ready_at = start_time + user_wait
+        while time.monotonic() < ready_at:
+            _condition.wait(ready_at - time.monotonic())
+
+        entry = (priority, next(_arrivals))
+        heapq.heappush(_queue, entry)
+        _observe("depth_at_arrival", DEPTH_BUCKETS, len(_queue) - 1)
+        _stats["max_depth"] = max(_stats["max_depth"], len(_queue))
+        try:
+            while True:
+                now = time.monotonic()
+                if _queue[0] == entry and key_bucket.wait_time(now) == 0:
+                    key_bucket.reserve(now)
+                    heapq.heappop(_queue)
+                    break
+                if now >= deadline:
+                    _queue.remove(entry)
+                    heapq.heapify(_queue)
+                    if user_bucket:
+                        user_bucket.refund()
+                    _stats["timed_out"] += 1
+                    retry_after = math.ceil(key_bucket.wait_time(now, len(_queue) + 1)) or 1
+                    raise RateLimited("The service is busy; try again shortly", retry_after)
+                _condition.wait(min(max(key_bucket.wait_time(now), 0.005), deadline - now))
+        finally:
+            _condition.notify_all()
+
+        waited = time.monotonic() - start_time
+        _stats["admitted"] += 1
+        _observe("wait_seconds", WAIT_BUCKETS, waited)
+        return waited
+
+
+def try_acquire() -> bool:
+    """Takes a token for one Gemini call only if it is free right now and nothing is queued."""
+    user_id, _ = _caller.get()
+    with _condition:
+        now = time.monotonic()
+        key_bucket = _key_bucket()
+        user_bucket = _user_bucket(user_id) if user_id else None
+        if _queue or key_bucket.wait_time(now) > 0 or (user_bucket and user_bucket.wait_time(now) > 0):
+            return False
+        key_bucket.reserve(now)
+        if user_bucket:
+            user_bucket.reserve(now)
+        _stats["admitted"] += 1
+        _observe("wait_seconds", WAIT_BUCKETS, 0)
+        return True
+
+
+def rate_limit_stats() -> Dict:
+    """Admitted, refused and timed-out calls, queue depth, and wait-time and depth histograms."""
+    with _condition:
+        return {
+            "admitted": _stats["admitted"],
+            "rejected": _stats["rejected"],
+            "timed_out": _stats["timed_out"],
+            "queue_depth": len(_queue),
+            "max_queue_depth": _stats["max_depth"],
+            "wait_seconds": dict(zip([*map(str, WAIT_BUCKETS), "+Inf"], _stats["wait_seconds"])),
+            "queue_depth_at_arrival": dict(zip([*map(str, DEPTH_BUCKETS), "+Inf"], _stats["depth_at_arrival"])),
+        }
@@ -0,0 +1,249 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+import requests
+from google.api_core import exceptions as api_exceptions
+
+from routes.circuit_breaker import gemini_breaker
+from routes.model_routing import record_call
+from routes.rate_limit import RateLimited, acquire, try_acquire
+
+# Every request must be answered within this many seconds, generation included
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", 120))
+# A model call outside any request is given this long
+CALL_TIMEOUT_SECONDS = 90.0
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 8.0
+# Hedging sends a second, identical call once the first has run longer than the
+# operation's 95th percentile latency, and keeps whichever answers first
+HEDGE_ENABLED = os.environ.get("GEMINI_HEDGE", "") == "1"
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+HEDGE_WORKERS = 8
+
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    requests.ConnectionError,
+    requests.Timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Whether an error says the service is struggling (timeouts, connection errors,
+    429s and 5xx) rather than that the request was bad (e.g. a 4xx for an
+    unsupported page); only transient errors count against a circuit breaker.
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "code", None)
+    return isinstance(status, int) and (status in (408, 429) or status >= 500)
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before a step could finish."""
+
+
+# The monotonic time by which the current request must be answered
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+_latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "failed": 0})
+_lock = threading.Lock()
+
+
+def set_deadline(seconds: float = REQUEST_DEADLINE_SECONDS) -> None:
+    """Gives the current request, and every step it runs, seconds to finish."""
+    _deadline.set(time.monotonic() + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(step: str) -> None:
+    """Raises DeadlineExceeded if the current request has no time left for step."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"The request ran out of time before {step}")
+
+
+def bounded_timeout(timeout: float) -> float:
+    """timeout, shortened to what is left of the current request's deadline."""
+    check_deadline("fetching")
+    left = remaining()
+    return timeout if left is None else min(timeout, left)
+
+
+def run_within(seconds: float, function: Callable, *args, **kwargs):
+    """
+    Runs function with a deadline seconds from now, for a worker thread (which has
+    its own copy of the request's context): its fetches and calls then give up in
+    time instead of running on after the caller stopped waiting for them.
+    """
+    set_deadline(seconds)
+    return function(*args, **kwargs)
+
+
+def _p95(operation: str) -> Optional[float]:
+    with _lock:
+        samples = sorted(_latencies[operation])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95)]
+
+
+def _record(operation: str, seconds: float) -> None:
+    with _lock:
+        _latencies[operation].append(seconds)
+
+
+def _count(operation: str, counter: str) -> None:
+    with _lock:
+        _counters[operation][counter] += 1
+
+
+def _hedged(operation: str, function: Callable, args, kwargs, timeout: float):
+    """
+    Runs function, and a second copy of it after the p95 delay.
+
+    Returns:
+        Tuple: The first answer, and whether a hedge was sent.
+    """
+    delay = _p95(operation)
+    primary = _hedge_executor.submit(function, *args, **kwargs)
+    if delay is None or delay >= timeout:
+        return primary.result(timeout=timeout), False
+
+    done, _ = wait([primary], timeout=delay)
+    # A hedge only goes out when the rate limits have room for it right away
+    if done or not try_acquire():
+        return primary.result(timeout=max(timeout - delay, 0)), False
+
+    _count(operation, "hedged")
+    hedge = _hedge_executor.submit(function, *args, **kwargs)
+    pending = {primary, hedge}
+    end_time = time.monotonic() + timeout - delay
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(end_time - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    _count(operation, "hedge_wins")
+                return future.result(), True
+            error = future.exception()
+    # The call still running is abandoned; its answer is not needed any more
+    raise error or TimeoutError(f"{operation} timed out after {timeout:.1f} seconds")
+
+
+def call_model(operation: str, function: Callable, *args, stats: Optional[Dict] = None, hedge: Optional[bool] = None, **kwargs):
+    """
+    Makes a Gemini call that retries, optionally hedges, and respects the request deadline.
+
+    Each attempt waits for the rate limiter and gets what is left of the request's
+    deadline as its timeout (request_options). Retryable errors (rate limits,
+    server errors, timeouts, connection errors) are retried up to MAX_ATTEMPTS
+    times with full-jitter exponential backoff, as long as the deadline allows.
+    Those errors also count against Gemini's circuit breaker; while it is open,
+    calls are refused straight away. Inside a routed_model block, each attempt's
+    latency (or a failure penalty) is recorded against the routed model. Waits and backoff block the calling thread,
+    so requests must make their calls from a worker thread, not the event loop.
+
+    Args:
+        operation (str): The kind of call, e.g. "generate"; latencies are tracked per kind.
+        function (Callable): The call, e.g. model.generate_content.
+        *args: Its arguments.
+        stats (Optional[Dict]): Filled with "attempts", "queued_seconds" and "hedged".
+        hedge (Optional[bool]): Hedge slow attempts; defaults to HEDGE_ENABLED.
+        **kwargs: Its keyword arguments.
+
+    Returns:
+        The call's result.
+
+    Raises:
+        RateLimited: If the rate limiter refuses the call.
+        CircuitOpen: If Gemini's circuit is open.
+        DeadlineExceeded: If the request's deadline passes first.
+        Exception: The call's own error once it is not retryable or attempts run out.
+    """
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    stats = stats if stats is not None else {}
+    stats.update(attempts=0, queued_seconds=0.0)
+    _count(operation, "calls")
+    for attempt in range(MAX_ATTEMPTS):
+        check_deadline(operation)
+        gemini_breaker.check()
+        stats["queued_seconds"] = round(stats["queued_seconds"] + acquire(), 3)
+        timeout = remaining()
+        timeout = CALL_TIMEOUT_SECONDS if timeout is None else min(timeout, CALL_TIMEOUT_SECONDS)
+        check_deadline(operation)
+        stats["attempts"] = attempt + 1
+        call_kwargs = {**kwargs, "request_options": {"timeout": timeout}}
+        start_time = time.monotonic()
+        try:
+            if hedge:
+                result, stats["hedged"] = _hedged(operation, function, args, call_kwargs, timeout)
+            else:
+                result = function(*args, **call_kwargs)
+            _record(operation, time.monotonic() - start_time)
+            record_call(time.monotonic() - start_time)
+            gemini_breaker.record_success()
+            return result
+        except RateLimited:
+            raise
+        except Exception as e:
+            # Errors of the request itself show the service is up
+            if is_transient(e):
+                gemini_breaker.record_failure()
+                record_call(time.monotonic() - start_time, failed=True)
+            else:
+                gemini_breaker.record_success()
+            left = remaining()
+            if left is not None and left <= 0:
+                _count(operation, "failed")
+                raise DeadlineExceeded(f"The request ran out of time during {operation}: {str(e)}")
+            if not isinstance(e, RETRYABLE_ERRORS) or attempt == MAX_ATTEMPTS - 1:
+                _count(operation, "failed")
+                raise
+            delay = random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if left is not None and delay >= left:
+                _count(operation, "failed")
+                raise DeadlineExceeded(f"The request ran out of time retrying {operation}: {str(e)}")
+            _count(operation, "retries")
+            print(f"{operation} attempt {attempt + 1} failed ({type(e).__name__}: {str(e)}), retrying in {delay:.2f} seconds")
+            time.sleep(delay)
+
+
+def call_stats() -> Dict:
+    """Per kind of model call: calls, retries, hedges, failures and p50/p95 latency."""
+    with _lock:
+        operations = {}
+        for operation, counters in _counters.items():
+            samples = sorted(_latencies[operation])
+            operations[operation] = {
+                **counters,
+                "p50_seconds": round(samples[len(samples) // 2], 3) if samples else None,
+                "p95_seconds": round(samples[int(len(samples) * 0.95)], 3) if samples else None,
+            }
+        return operations
@@ -0,0 +1,20 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from routes.search_index import KINDS, search
+
+router = APIRouter()
+
+
+@router.get("/users/{user_id}/search")
+async def search_user(user_id: str, q: str, limit: int = 20, kind: Optional[str] = None):
+    if kind is not None and kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(KINDS)}")
+    try:
+        # A cold index is built from Firestore, so the search runs off the event loop
+        results = await asyncio.to_thread(search, user_id, q, limit=max(1, min(limit, 100)), kind=kind)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
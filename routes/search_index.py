@@ -0,0 +1,416 @@
+import bisect
+import json
+import math
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from firebase_admin import firestore
+
+from routes.question_index import TOKEN_PATTERN, tokenize
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# A prefix matches at most this many indexed terms, most frequent first
+MAX_PREFIX_TERMS = 50
+MIN_PREFIX_LENGTH = 2
+TITLE_LENGTH = 120
+# Segments are compacted once a user has more than MAX_SEGMENTS; compacted
+# segments hold at most SEGMENT_DOCS documents each to stay under Firestore's 1 MiB
+MAX_SEGMENTS = 16
+SEGMENT_DOCS = 2000
+SEGMENT_VERSION = 1
+# Cached indexes pick up segments written by other workers after this long
+REFRESH_SECONDS = 60
+MAX_CACHED_INDEXES = 200
+# Document ids start with their kind, e.g. "flashcard:<id>"
+KINDS = ("flashcard", "question")
+
+
+class SearchIndex:
+    """
+    A BM25 full-text index of one user's flashcards and quiz questions.
+
+    Documents are numbered as they are added; each term has a posting array of
+    document numbers and one of term frequencies. A re-added document gets a new
+    number and its old one becomes a tombstone, skipped by searches and dropped
+    when the index is compacted.
+    """
+
+    def __init__(self):
+        self.doc_ids: List[str] = []
+        self.titles: List[str] = []
+        self.lengths = array("I")
+        self.kinds = array("B")
+        self.numbers: Dict[str, int] = {}
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.deleted = set()
+        self.total_length = 0
+        self._sorted_terms: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def add(self, doc_id: str, title: str, text: str) -> None:
+        self.remove(doc_id)
+        tokens = tokenize(text)
+        number = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.titles.append(title[:TITLE_LENGTH])
+        self.lengths.append(len(tokens))
+        self.kinds.append(KINDS.index(doc_id.split(":", 1)[0]))
+        self.numbers[doc_id] = number
+        self.total_length += len(tokens)
+
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, count in counts.items():
+            if term not in self.postings:
+                self.postings[term] = (array("I"), array("H"))
+                self._sorted_terms = None
+            numbers, frequencies = self.postings[term]
+            numbers.append(number)
+            frequencies.append(min(count, 65535))
+
+    def remove(self, doc_id: str) -> bool:
+        number = self.numbers.pop(doc_id, None)
+        if number is None:
+            return False
+        self.deleted.add(number)
+        self.total_length -= self.lengths[number]
+        return True
+
+    def remove_prefix(self, prefix: str) -> int:
+        doc_ids = [doc_id for doc_id in self.numbers if doc_id.startswith(prefix)]
+        for doc_id in doc_ids:
+            self.remove(doc_id)
+        return len(doc_ids)
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """The indexed terms starting with prefix, the most frequent MAX_PREFIX_TERMS."""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + "\uffff")
+        terms = self._sorted_terms[start:end]
+        if len(terms) > MAX_PREFIX_TERMS:
+            terms = sorted(terms, key=lambda term: len(self.postings[term][0]), reverse=True)[:MAX_PREFIX_TERMS]
+        return terms
+
+    def search(self, query: str, limit: int = 20, kind: Optional[str] = None) -> List[Dict]:
+        """
+        Ranks the documents matching a query with BM25.
+
+        The last query word, unless followed by a space, also matches as a prefix,
+        so results follow the user's typing.
+
+        Args:
+            query (str): The search text.
+            limit (int): The maximum number of results.
+            kind (Optional[str]): Only "flashcard" or only "question" documents.
+
+        Returns:
+            List[Dict]: Results with "id", "kind", "title" and "score", best first.
+        """
+        live = len(self.numbers)
+        if not live:
+            return []
+        terms = set(tokenize(query))
+        words = TOKEN_PATTERN.findall(query.casefold())
+        prefix_terms = []
+        if words and not query[-1:].isspace() and len(words[-1]) >= MIN_PREFIX_LENGTH:
+            prefix_terms = [term for term in self.expand_prefix(words[-1]) if term not in terms]
+
+        average_length = self.total_length / live or 1.0
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in [*terms, *prefix_terms]:
+            if term not in self.postings:
+                continue
+            numbers, frequencies = self.postings[term]
+            numbers = np.frombuffer(numbers, dtype=np.uint32)
+            frequencies = np.frombuffer(frequencies, dtype=np.uint16).astype(np.float32)
+            # Tombstones still in the postings can make them outnumber live documents
+            document_frequency = min(len(numbers), live)
+            idf = math.log(1 + (live - document_frequency + 0.5) / (document_frequency + 0.5))
+            norms = K1 * (1 - B + B * lengths[numbers] / average_length)
+            scores[numbers] += idf * frequencies * (K1 + 1) / (frequencies + norms)
+
+        if self.deleted:
+            scores[np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))] = 0
+        if kind:
+            scores[np.frombuffer(self.kinds, dtype=np.uint8) != KINDS.index(kind)] = 0
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > limit:
+            matches = matches[np.argpartition(scores[matches], -limit)[-limit:]]
+        matches = matches[np.argsort(scores[matches])[::-1]]
+        return [
+            {
+                "id": self.doc_ids[number].split(":", 1)[1],
+                "kind": self.doc_ids[number].split(":", 1)[0],
+                "title": self.titles[number],
+                "score": round(float(scores[number]), 4),
+            }
+            for number in matches
+        ]
+
+    def live_documents(self) -> List[int]:
+        return sorted(self.numbers.values())
+
+    def segments(self, deleted: Iterable[str] = ()) -> List[bytes]:
+        """
+        Serializes the live documents as segments of up to SEGMENT_DOCS documents.
+
+        A segment is zlib-compressed JSON of its documents ([id, title, length]),
+        their postings ({term: [[position, frequency], ...]}, positions into the
+        segment's documents) and the ids of documents it deletes, which go in
+        the first segment.
+        """
+        numbers = self.live_documents()
+        chunks = [numbers[start:start + SEGMENT_DOCS] for start in range(0, max(len(numbers), 1), SEGMENT_DOCS)]
+        positions = {number: divmod(position, SEGMENT_DOCS) for position, number in enumerate(numbers)}
+        postings: List[Dict[str, List]] = [{} for _ in chunks]
+        for term, (term_numbers, frequencies) in self.postings.items():
+            for number, frequency in zip(term_numbers, frequencies):
+                if number in positions:
+                    chunk, position = positions[number]
+                    postings[chunk].setdefault(term, []).append([position, frequency])
+        return [
+            zlib.compress(json.dumps({
+                "version": SEGMENT_VERSION,
+                "docs": [[self.doc_ids[number], self.titles[number], self.lengths[number]] for number in chunk],
+                "postings": chunk_postings,
+                "deleted": list(deleted) if position == 0 else [],
+            }, separators=(",", ":")).encode("utf-8"))
+            for position, (chunk, chunk_postings) in enumerate(zip(chunks, postings))
+        ]
+
+    def load_segment(self, data: bytes) -> None:
+        """Applies a segment: its deletions first, then its documents."""
+        segment = json.loads(zlib.decompress(data))
+        if segment.get("version") != SEGMENT_VERSION:
+            raise ValueError(f"Unknown search segment version {segment.get('version')}")
+        for doc_id in segment["deleted"]:
+            self.remove(doc_id)
+        base = len(self.doc_ids)
+        for doc_id, title, length in segment["docs"]:
+            self.remove(doc_id)
+            self.numbers[doc_id] = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.titles.append(title)
+            self.lengths.append(length)
+            self.kinds.append(KINDS.index(doc_id.split(":", 1)[0]))
+            self.total_length += length
+        for term, entries in segment["postings"].items():
+            if term not in self.postings:
+                self.postings[term] = (array("I"), array("H"))
+                self._sorted_terms = None
+            numbers, frequencies = self.postings[term]
+            for position, frequency in entries:
+                numbers.append(base + position)
+                frequencies.append(frequency)
+
+
+# Per user: the index, its own lock, the last segment sequence loaded, the segment
+# count and the load time. The global lock only guards this cache; loading,
+# refreshing and writing a user's index happens under that user's lock.
+_indexes: "OrderedDict[str, Dict]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _segments_ref(user_id: str):
+    return firestore.client().collection("users").document(user_id).collection("search_segments")
+
+
+def _sequence() -> str:
+    """A segment sequence, ordered by write time and unique across workers."""
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+def write_segment(user_id: str, data: bytes) -> str:
+    sequence = _sequence()
+    _segments_ref(user_id).document(sequence).set({"seq": sequence, "data": data})
+    return sequence
+
+
+def mark_stale(user_id: str) -> None:
+    """
+    Records that a change could not be added to a user's index, so the next load
+    or refresh of it, in any worker, rebuilds it from Firestore.
+    """
+    sequence = _sequence()
+    _segments_ref(user_id).document(sequence).set({"seq": sequence, "stale": True})
+
+
+def compact(user_id: str, entry: Dict) -> None:
+    """Rewrites a user's segments as few segments without tombstones, and reloads the index from them."""
+    _refresh(user_id, entry)
+    old = list(_segments_ref(user_id).stream())
+    segments = entry["index"].segments()
+    index = SearchIndex()
+    for data in segments:
+        entry["seq"] = write_segment(user_id, data)
+        index.load_segment(data)
+    entry.update(index=index, segments=len(segments))
+    # Segments written by other workers meanwhile are kept; they come after the compacted ones
+    for start in range(0, len(old), 500):
+        batch = firestore.client().batch()
+        for doc in old[start:start + 500]:
+            batch.delete(doc.reference)
+        batch.commit()
+
+
+def build_from_firestore(user_id: str) -> SearchIndex:
+    """Indexes all of a user's flashcards and quiz questions."""
+    user_ref = firestore.client().collection("users").document(user_id)
+    index = SearchIndex()
+    for doc in user_ref.collection("flashcards").stream():
+        index.add(f"flashcard:{doc.id}", *flashcard_document(doc.to_dict()))
+    for quiz in user_ref.collection("quizzes").stream():
+        for doc in quiz.reference.collection("questions").stream():
+            index.add(f"question:{quiz.id}/{doc.id}", *question_document(doc.to_dict()))
+    return index
+
+
+def flashcard_document(flashcard: Dict) -> Tuple[str, str]:
+    """The title and searchable text of a flashcard."""
+    return str(flashcard.get("front", "")), f"{flashcard.get('front', '')} {flashcard.get('back', '')}"
+
+
+def question_document(question: Dict) -> Tuple[str, str]:
+    """The title and searchable text of a quiz question."""
+    text = [str(question.get("question", "")), str(question.get("answer", ""))]
+    text += [str(option) for option in question.get("options") or []]
+    return text[0], " ".join(text)
+
+
+def _apply(entry: Dict, segment: Dict) -> None:
+    entry["index"].load_segment(segment["data"])
+    entry["seq"], entry["segments"] = segment["seq"], entry["segments"] + 1
+
+
+def _rebuild(user_id: str, entry: Dict, seen: str) -> None:
+    """Replaces an index with one built from Firestore, and its segments up to seen with compacted ones."""
+    # The build already reflects the segments up to seen, so they are not applied again
+    entry.update(index=build_from_firestore(user_id), seq=seen, segments=0)
+    compact(user_id, entry)
+    print(f"Built the search index of {user_id}: {len(entry['index'])} documents")
+
+
+def _refresh(user_id: str, entry: Dict) -> None:
+    """Applies the segments other workers wrote since the index was loaded, rebuilding it if one is marked stale."""
+    segments = [doc.to_dict() for doc in _segments_ref(user_id).where("seq", ">", entry["seq"]).order_by("seq").stream()]
+    if any(segment.get("stale") for segment in segments):
+        _rebuild(user_id, entry, segments[-1]["seq"])
+    else:
+        for segment in segments:
+            _apply(entry, segment)
+    entry["loaded"] = time.time()
+
+
+def _load(user_id: str, entry: Dict) -> None:
+    """Loads a user's index from their segments, building it first if they have none or it is marked stale."""
+    segments = [doc.to_dict() for doc in _segments_ref(user_id).order_by("seq").stream()]
+    entry.update(index=SearchIndex(), seq="", segments=0)
+    try:
+        if segments and not any(segment.get("stale") for segment in segments):
+            for segment in segments:
+                _apply(entry, segment)
+            if entry["segments"] > MAX_SEGMENTS:
+                compact(user_id, entry)
+        else:
+            _rebuild(user_id, entry, segments[-1]["seq"] if segments else "")
+    except Exception:
+        entry["index"] = None
+        raise
+    entry["loaded"] = time.time()
+
+
+def _entry(user_id: str) -> Dict:
+    with _indexes_lock:
+        entry = _indexes.get(user_id)
+        if entry is None:
+            entry = _indexes[user_id] = {"lock": threading.RLock(), "index": None, "seq": "", "segments": 0, "loaded": 0.0}
+            if len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(user_id)
+        return entry
+
+
+@contextmanager
+def search_index(user_id: str):
+    """
+    A user's index, loaded or refreshed from Firestore as needed, held under the
+    user's lock for the with block.
+
+    Yields:
+        Dict: The cache entry; its "index" is the SearchIndex.
+    """
+    entry = _entry(user_id)
+    with entry["lock"]:
+        if entry["index"] is None:
+            _load(user_id, entry)
+        elif time.time() - entry["loaded"] > REFRESH_SECONDS:
+            _refresh(user_id, entry)
+        yield entry
+
+
+def search(user_id: str, query: str, limit: int = 20, kind: Optional[str] = None) -> List[Dict]:
+    """Searches a user's flashcards and quiz questions, see SearchIndex.search."""
+    with search_index(user_id) as entry:
+        return entry["index"].search(query, limit, kind)
+
+
+def update_documents(user_id: str, documents: List[Tuple[str, str, str]] = (), deleted: Iterable[str] = ()) -> None:
+    """
+    Adds or replaces (doc_id, title, text) documents and deletes doc_id prefixes
+    in a user's index, persisting the change as one new segment.
+
+    Doc ids are "flashcard:<id>" or "question:<quiz_id>/<question_id>"; deleting
+    "question:<quiz_id>/" drops a whole quiz.
+    """
+    with search_index(user_id) as entry:
+        index = entry["index"]
+        # Segments store deletions by exact id, so prefixes are resolved here
+        deleted_ids = [doc_id for prefix in deleted for doc_id in index.numbers if doc_id.startswith(prefix)]
+        for doc_id in deleted_ids:
+            index.remove(doc_id)
+        # The new segment only holds the new documents
+        delta = SearchIndex()
+        for doc_id, title, text in documents:
+            index.add(doc_id, title, text)
+            delta.add(doc_id, title, text)
+        if not documents and not deleted_ids:
+            return
+        # Catch up first, so this worker's sequence does not skip another's segments
+        _refresh(user_id, entry)
+        for data in delta.segments(deleted_ids):
+            entry["seq"] = write_segment(user_id, data)
+            entry["segments"] += 1
+        if entry["segments"] > MAX_SEGMENTS:
+            compact(user_id, entry)
+
+
+def index_flashcard_documents(user_id: str, flashcards: List[Tuple[str, Dict]]) -> None:
+    """Adds saved (flashcard_id, flashcard) pairs to the user's search index."""
+    update_documents(user_id, [(f"flashcard:{flashcard_id}", *flashcard_document(flashcard)) for flashcard_id, flashcard in flashcards])
+
+
+def index_quiz_questions(user_id: str, quiz_id: str, questions: List[Tuple[str, Dict]]) -> None:
+    """Adds saved (question_id, question) pairs of a quiz to the user's search index."""
+    update_documents(user_id, [(f"question:{quiz_id}/{question_id}", *question_document(question)) for question_id, question in questions])
+
+
+def forget_quiz_documents(user_id: str, quiz_id: str) -> None:
+    """Drops a deleted quiz's questions from the user's search index."""
+    update_documents(user_id, deleted=[f"question:{quiz_id}/"])
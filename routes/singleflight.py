@@ -0,0 +1,78 @@
+import asyncio
+import copy
+import random
+import re
+from typing import Callable, Dict, Hashable, List, Tuple
+
+# Profile fields that shape a quiz for a whole class rather than one student; they
+# are part of a generation's key, so only requests agreeing on them share one
+SHARED_PROFILE_FIELDS = ("education_level",)
+
+# Generations in flight on this worker's event loop, by key
+_in_flight: Dict[Hashable, asyncio.Future] = {}
+_stats = {"calls": 0, "collapsed": 0}
+
+
+async def singleflight(key: Hashable, generate: Callable[[], List[Dict]]) -> Tuple[List[Dict], bool]:
+    """
+    Runs generate in a thread, unless a generation with the same key is already
+    running, in which case it waits for that one and shares its result.
+
+    Errors are shared too: every waiter of a failed generation gets its exception.
+
+    Args:
+        key (Hashable): The generation key, see generation_key.
+        generate (Callable[[], List[Dict]]): The blocking generation to run.
+
+    Returns:
+        Tuple[List[Dict], bool]: The result, and whether it came from another
+            request's generation. Callers must copy it before changing it.
+    """
+    future = _in_flight.get(key)
+    if future is not None:
+        _stats["collapsed"] += 1
+        return await asyncio.shield(future), True
+
+    _stats["calls"] += 1
+    future = asyncio.ensure_future(asyncio.to_thread(generate))
+    _in_flight[key] = future
+    future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded, so a disconnecting leader does not cancel the generation its waiters share
+    return await asyncio.shield(future), False
+
+
+def normalize(text: str) -> str:
+    """Case- and whitespace-insensitive form of a topic or subject."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def shared_profile(user_data: Dict) -> Dict:
+    """The part of a user's profile requests sharing a generation must agree on."""
+    return {field: user_data[field] for field in SHARED_PROFILE_FIELDS if field in user_data}
+
+
+def generation_key(*parts, user_data: Dict) -> Tuple:
+    """A coalescing key from the generation arguments and the shared profile."""
+    return (*parts, tuple(sorted(shared_profile(user_data).items())))
+
+
+def personalize_quiz(quiz: List[Dict], user_id: str) -> List[Dict]:
+    """
+    A user's own copy of a shared quiz.
+
+    Question order and multiple-choice options are shuffled per user, so students
+    sitting next to each other do not see the same sequence.
+    """
+    rng = random.Random(user_id)
+    quiz = copy.deepcopy(quiz)
+    rng.shuffle(quiz)
+    for question in quiz:
+        options = question.get("options")
+        if isinstance(options, list) and len(options) > 2:
+            rng.shuffle(options)
+    return quiz
+
+
+def singleflight_stats() -> Dict:
+    """Generations started, requests that shared another's generation, and generations in flight."""
+    return {**_stats, "in_flight": len(_in_flight)}
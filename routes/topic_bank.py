@@ -0,0 +1,255 @@
+import hashlib
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from firebase_admin import firestore
+from google.api_core import exceptions as api_exceptions
+
+from routes.content_minimizer import block_key
+from routes.difficulty_fanout import DIFFICULTIES, generate_by_difficulty
+from routes.prompt_registry import prompt_hash
+from routes.quiz_topic import generate_quiz_topic
+from routes.singleflight import normalize
+
+# The warmer keeps banks for the TOP_TOPICS most requested topics requested in
+# the last POPULARITY_WINDOW_DAYS, and only generates during WARM_HOURS_UTC
+TOP_TOPICS = 20
+POPULARITY_WINDOW_DAYS = 14
+WARM_HOURS_UTC = range(2, 6)
+WARM_CHECK_SECONDS = 30 * 60
+# Every worker runs a warmer, but only the one holding the warmer lease warms;
+# the holder renews it on every check, and it passes on if the holder goes away
+WARM_LEASE = timedelta(hours=2)
+# Each refresh adds up to BANK_BATCH questions per difficulty level, keeping the
+# newest BANK_MAX_PER_DIFFICULTY
+BANK_BATCH = 10
+BANK_MAX_PER_DIFFICULTY = 30
+BANK_MAX_AGE = timedelta(days=3)
+
+_warmer_started = threading.Event()
+_worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def bank_id(topic: str, subject: str, question_type: str) -> str:
+    """The document id of a topic bank, the same for differently spelled or cased requests."""
+    key = "\x00".join((normalize(topic), normalize(subject), question_type))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+
+def _bank_ref(doc_id: str):
+    """
+    The document holding a bank's questions. It is kept apart from the topic's
+    document, which every request increments, so that document stays small.
+    """
+    return firestore.client().collection("topic_banks").document(doc_id).collection("bank").document("current")
+
+
+def _day(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+
+def record_topic_request(topic: str, subject: str, question_type: str) -> None:
+    """Counts a topic quiz request towards the topic's popularity, in a bucket per UTC day."""
+    db = firestore.client()
+    db.collection("topic_banks").document(bank_id(topic, subject, question_type)).set({
+        "topic": topic,
+        "subject": subject,
+        "question_type": question_type,
+        "requests": firestore.Increment(1),
+        "daily_requests": {_day(datetime.now(timezone.utc)): firestore.Increment(1)},
+        "last_requested": firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+
+
+def serve_from_bank(
+    topic: str, subject: str, question_type: str, number_of_questions: int, user_id: str
+) -> Optional[List[Dict]]:
+    """
+    Assembles a topic quiz from the shared bank, without a model call.
+
+    Only questions the user has not been served before are used, and the served
+    ones are recorded.
+
+    Args:
+        topic (str): The quiz topic.
+        subject (str): The broader subject area.
+        question_type (str): The type of questions.
+        number_of_questions (int): The number of questions per difficulty level.
+        user_id (str): The user the quiz is for.
+
+    Returns:
+        Optional[List[Dict]]: The quiz, or None when there is no up-to-date bank or
+            it has too few questions left for this user.
+    """
+    db = firestore.client()
+    doc_id = bank_id(topic, subject, question_type)
+    bank = _bank_ref(doc_id).get()
+    bank = bank.to_dict() if bank.exists else None
+    if not bank or not bank.get("questions") or bank.get("prompt_version") != prompt_hash("topic", question_type):
+        return None
+
+    served_ref = db.collection("users").document(user_id).collection("topic_bank_served").document(doc_id)
+    served_doc = served_ref.get()
+    served = set(served_doc.to_dict().get("keys", [])) if served_doc.exists else set()
+
+    quiz = []
+    for difficulty in DIFFICULTIES:
+        unseen = [
+            question for question in bank["questions"]
+            if question.get("difficulty") == difficulty and question["bank_key"] not in served
+        ]
+        if len(unseen) < number_of_questions:
+            print(f"Topic bank {doc_id} exhausted for user {user_id} ({difficulty})")
+            return None
+        quiz += random.sample(unseen, number_of_questions)
+
+    served_ref.set({"keys": firestore.ArrayUnion([question["bank_key"] for question in quiz])}, merge=True)
+    return [{key: value for key, value in question.items() if key != "bank_key"} for question in quiz]
+
+
+def refresh_bank(topic: str, subject: str, question_type: str) -> int:
+    """
+    Generates a batch of shared questions into a topic bank.
+
+    Banks are generated without any user's profile. New questions repeating banked
+    ones are dropped; a bank made with an older prompt version is replaced.
+
+    Returns:
+        int: The number of questions added.
+    """
+    db = firestore.client()
+    doc_id = bank_id(topic, subject, question_type)
+    bank_ref = _bank_ref(doc_id)
+    bank = bank_ref.get()
+    bank = bank.to_dict() if bank.exists else {}
+
+    version = prompt_hash("topic", question_type)
+    questions = bank.get("questions", []) if bank.get("prompt_version") == version else []
+    seen = {question["bank_key"] for question in questions}
+
+    added = 0
+    for question in generate_by_difficulty(generate_quiz_topic, topic, subject, question_type, BANK_BATCH, {}):
+        key = block_key(str(question.get("question", "")))
+        if key in seen:
+            continue
+        seen.add(key)
+        questions.append(dict(question, bank_key=key))
+        added += 1
+
+    # Keep the newest questions of each difficulty level
+    kept = []
+    for difficulty in DIFFICULTIES:
+        kept += [question for question in questions if question.get("difficulty") == difficulty][-BANK_MAX_PER_DIFFICULTY:]
+
+    bank_ref.set({
+        "questions": kept,
+        "prompt_version": version,
+        "generated_at": firestore.SERVER_TIMESTAMP,
+    })
+    # The warmer decides what to refresh from the topic's document alone; questions
+    # banks stored there before they had their own document are dropped
+    db.collection("topic_banks").document(doc_id).set({
+        "prompt_version": version,
+        "generated_at": firestore.SERVER_TIMESTAMP,
+        "questions": firestore.DELETE_FIELD,
+    }, merge=True)
+    print(f"Added {added} questions to the {question_type} bank for {topic} ({subject})")
+    return added
+
+
+def popular_topics(limit: int = TOP_TOPICS) -> List[Dict]:
+    """
+    The most requested topics of the last POPULARITY_WINDOW_DAYS, by their daily
+    request counts within the window. Counts of older days are deleted on the way.
+    """
+    db = firestore.client()
+    now = datetime.now(timezone.utc)
+    oldest = _day(now - timedelta(days=POPULARITY_WINDOW_DAYS - 1))
+    cutoff = now - timedelta(days=POPULARITY_WINDOW_DAYS)
+    topics = []
+    for doc in db.collection("topic_banks").where("last_requested", ">=", cutoff).stream():
+        topic = doc.to_dict()
+        daily = topic.get("daily_requests") or {}
+        topic["recent_requests"] = sum(count for day, count in daily.items() if day >= oldest)
+        expired = [day for day in daily if day < oldest]
+        if expired:
+            doc.reference.update({f"daily_requests.`{day}`": firestore.DELETE_FIELD for day in expired})
+        topics.append(topic)
+    topics.sort(key=lambda topic: topic["recent_requests"], reverse=True)
+    return [topic for topic in topics if topic["recent_requests"]][:limit]
+
+
+def warm_banks() -> int:
+    """
+    Refreshes the banks of the popular topics that are missing, stale or built
+    with an older prompt version.
+
+    Returns:
+        int: The number of banks refreshed.
+    """
+    refreshed = 0
+    now = datetime.now(timezone.utc)
+    for topic in popular_topics():
+        generated_at = topic.get("generated_at")
+        current = topic.get("prompt_version") == prompt_hash("topic", topic["question_type"])
+        if current and generated_at and now - generated_at < BANK_MAX_AGE:
+            continue
+        try:
+            refresh_bank(topic["topic"], topic["subject"], topic["question_type"])
+            refreshed += 1
+        except Exception as e:
+            print(f"Warming the bank for {topic['topic']} failed: {str(e)}")
+    return refreshed
+
+
+def acquire_warmer_lease() -> bool:
+    """
+    Takes or renews the warmer lease in Firestore for this worker.
+
+    The lease document is only written if it did not change since it was read,
+    so of workers racing for an expired lease, one wins.
+
+    Returns:
+        bool: Whether this worker holds the lease.
+    """
+    db = firestore.client()
+    lease_ref = db.collection("leases").document("topic_bank_warmer")
+    now = datetime.now(timezone.utc)
+    lease = {"holder": _worker_id, "expires_at": now + WARM_LEASE}
+    snapshot = lease_ref.get()
+    try:
+        if not snapshot.exists:
+            lease_ref.create(lease)
+        elif snapshot.get("holder") == _worker_id or snapshot.get("expires_at") <= now:
+            lease_ref.update(lease, option=db.write_option(last_update_time=snapshot.update_time))
+        else:
+            return False
+    except (api_exceptions.AlreadyExists, api_exceptions.FailedPrecondition):
+        return False
+    return True
+
+
+def warm_loop() -> None:
+    """Checks every WARM_CHECK_SECONDS and warms the banks during WARM_HOURS_UTC, if this worker holds the lease."""
+    while True:
+        if datetime.now(timezone.utc).hour in WARM_HOURS_UTC:
+            try:
+                if acquire_warmer_lease():
+                    print(f"Warmed {warm_banks()} topic banks")
+            except Exception as e:
+                print(f"Warming topic banks failed: {str(e)}")
+        time.sleep(WARM_CHECK_SECONDS)
+
+
+def start_warmer() -> None:
+    """Starts the background warmer once per process; see acquire_warmer_lease for which one warms."""
+    if _warmer_started.is_set():
+        return
+    _warmer_started.set()
+    threading.Thread(target=warm_loop, name="topic-bank-warmer", daemon=True).start()